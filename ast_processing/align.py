@@ -0,0 +1,82 @@
+from typing import Hashable, List, Optional, Sequence, Tuple
+
+
+def align(
+    keys1: Sequence[Hashable],
+    keys2: Sequence[Hashable],
+    max_edits: Optional[int] = None,
+) -> Optional[List[Tuple[int, int]]]:
+    """
+    Index pairs (i, j) of a longest common subsequence of keys1 and keys2.
+
+    Uses Myers' algorithm, which takes O((n + m) * d) time and O(d * d)
+    memory for d insertions and deletions, so lists that differ in a few
+    places are aligned in about linear time. The common prefix and suffix
+    are matched up front. When more than max_edits insertions and
+    deletions are needed after that, None is returned instead.
+    """
+    n, m = len(keys1), len(keys2)
+    start = 0
+    while start < n and start < m and keys1[start] == keys2[start]:
+        start += 1
+    end = 0
+    while (
+        end < n - start and end < m - start and keys1[n - 1 - end] == keys2[m - 1 - end]
+    ):
+        end += 1
+
+    pairs = [(i, i) for i in range(start)]
+    middle = _myers(keys1[start : n - end], keys2[start : m - end], max_edits)
+    if middle is None:
+        return None
+    pairs.extend((i + start, j + start) for i, j in middle)
+    pairs.extend((n - end + k, m - end + k) for k in range(end))
+    return pairs
+
+
+def _myers(a, b, max_edits):
+    n, m = len(a), len(b)
+    if not n or not m:
+        return [] if max_edits is None or n + m <= max_edits else None
+
+    # v[k] is the furthest x reached on diagonal k = x - y, trace keeps v
+    # as it was before each round d for the walk back
+    v = {1: 0}
+    trace = []
+    for d in range(n + m + 1):
+        if max_edits is not None and d > max_edits:
+            return None
+        trace.append(dict(v))
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[k - 1] < v[k + 1]):
+                x = v[k + 1]
+            else:
+                x = v[k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[k] = x
+            if x >= n and y >= m:
+                return _backtrack(trace, n, m)
+    raise AssertionError("unreachable")
+
+
+def _backtrack(trace, x, y) -> List[Tuple[int, int]]:
+    pairs = []
+    for d in range(len(trace) - 1, -1, -1):
+        v = trace[d]
+        k = x - y
+        if k == -d or (k != d and v.get(k - 1, -1) < v.get(k + 1, -1)):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = v.get(prev_k, 0)
+        prev_y = prev_x - prev_k
+        while x > prev_x and y > prev_y:
+            x -= 1
+            y -= 1
+            pairs.append((x, y))
+        x, y = prev_x, prev_y
+    pairs.reverse()
+    return pairs
@@ -1,7 +1,9 @@
 from itertools import zip_longest
 from parser.nodes import Binary, Cell, CellRange, Function, Name, Number, Unary
 
+from ast_processing.align import align
 from ast_utils.change_classes import (
+    Change,
     ChildAddition,
     ChildDeletion,
     NodeModification,
@@ -11,6 +13,31 @@ from ast_utils.change_classes import (
     StructuralChange,
 )
 
+# Argument lists that need more insertions and deletions than this to line
+# up are compared by position, which bounds the alignment of n arguments
+# to O(n * MAX_ARGUMENT_EDITS) time
+MAX_ARGUMENT_EDITS = 100
+
+
+def align_arguments(args1, args2):
+    # Runs of (old, new) arguments in between identical arguments, which
+    # are lined up by content hash. Arguments within a run are paired by
+    # position.
+    pairs = align(
+        [arg.structural_hash() for arg in args1],
+        [arg.structural_hash() for arg in args2],
+        MAX_ARGUMENT_EDITS,
+    )
+    if pairs is None:
+        return [(0, args1, 0, args2)]
+    gaps = []
+    i = j = 0
+    for next_i, next_j in pairs + [(len(args1), len(args2))]:
+        if next_i > i or next_j > j:
+            gaps.append((i, args1[i:next_i], j, args2[j:next_j]))
+        i, j = next_i + 1, next_j + 1
+    return gaps
+
 
 def compare_asts(original_node, modified_node):
     changes: list = []
@@ -32,86 +59,120 @@ def compare_asts(original_node, modified_node):
             else:
                 return False
 
-        if type(node1) != type(node2):
-            if node1.is_root() and node2.is_root():
-                # Exclude composite types (Function, Binary, Unary)
-                if not isinstance(node1, (Function, Binary, Unary)) and not isinstance(
-                    node2, (Function, Binary, Unary)
+        # Walk pairs of nodes with an explicit stack instead of recursing, so
+        # deeply nested formulas do not hit the recursion limit. Work that the
+        # recursive version did after descending into a child (further pairs or
+        # child changes) is queued in order, which keeps the change order.
+        stack = [(node1, node2)]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, Change):
+                changes.append(item)
+                continue
+            node1, node2 = item
+            if (
+                node1 is not None
+                and node2 is not None
+                and node1.structural_hash() == node2.structural_hash()
+            ):
+                # Identical subtrees, nothing below can differ
+                continue
+            pending = []
+
+            if type(node1) != type(node2):
+                if node1.is_root() and node2.is_root():
+                    # Exclude composite types (Function, Binary, Unary)
+                    if not isinstance(
+                        node1, (Function, Binary, Unary)
+                    ) and not isinstance(node2, (Function, Binary, Unary)):
+                        changes.append(RootNodeModification(node1, node2))
+                if not check_for_structural_change(node1, node2):
+                    continue  # No further traversal needed
+
+            if isinstance(node1, Binary) and isinstance(node2, Binary):
+                # Check for changes in operator
+                if not node1.compare_content(node2):
+                    changes.append(NodeModification(node1, node2))
+
+                # Check for changes in operands. An operand is missing while
+                # the op that replaces it is on its way, see
+                # ASTManager._claim_slot, and is only added.
+                if not isinstance(node1.left, type(node2.left)):
+                    # TODO: Can you just call NodeModification?
+                    if node1.left is not None:
+                        pending.append(ChildDeletion(node1, node1.left))
+                    pending.append(ChildAddition(node1, node2.left, operand="left"))
+                else:
+                    pending.append((node1.left, node2.left))
+
+                if not isinstance(node1.right, type(node2.right)):
+                    if node1.right is not None:
+                        pending.append(ChildDeletion(node1, node1.right))
+                    pending.append(ChildAddition(node1, node2.right, operand="right"))
+                else:
+                    pending.append((node1.right, node2.right))
+
+            elif isinstance(node1, CellRange) and isinstance(node2, CellRange):
+                # Check for changes in cell range
+                if not node1.compare_content(node2):
+                    changes.append(NodeModification(node1, node2))
+
+            elif isinstance(node1, Function) and isinstance(node2, Function):
+                # Check for changes in cell value
+                if not node1.compare_content(node2):
+                    changes.append(NodeModification(node1, node2))
+
+                # Check for changes in operands. Identical arguments are
+                # lined up first, so an argument inserted or deleted in the
+                # middle does not shift the comparison of all that follow.
+                # Gaps are handled left to right, so by the time a change
+                # is applied every argument before it is in place and the
+                # position of the new argument is its final one.
+                for _, gap1, j, gap2 in align_arguments(
+                    node1.arguments, node2.arguments
                 ):
-                    changes.append(RootNodeModification(node1, node2))
-            if not check_for_structural_change(node1, node2):
-                return  # No further traversal needed
-
-        if isinstance(node1, Binary) and isinstance(node2, Binary):
-            # Check for changes in operator
-            if not node1.compare_content(node2):
-                changes.append(NodeModification(node1, node2))
-
-            # Check for changes in operands
-            if not isinstance(node1.left, type(node2.left)):
-                # TODO: Can you just call NodeModification?
-                changes.append(ChildDeletion(node1, node1.left))
-                changes.append(ChildAddition(node1, node2.left))
-            else:
-                traverse_and_compare(node1.left, node2.left)
+                    for i, (arg1, arg2) in enumerate(zip_longest(gap1, gap2), start=j):
+                        if arg1 is None:
+                            # New argument added in modified_node
+                            pending.append(ChildAddition(node1, arg2, i))
+                        elif arg2 is None:
+                            # Argument removed in modified_node (if you want to handle deletions)
+                            pending.append(ChildDeletion(node1, arg1))
+                        elif type(arg1) != type(arg2):
+                            # Different type of argument found, treat as deletion and addition
+                            pending.append(ChildDeletion(node1, arg1))
+                            pending.append(ChildAddition(node1, arg2, i))
+                        else:
+                            pending.append((arg1, arg2))
+
+            elif isinstance(node1, Unary) and isinstance(node2, Unary):
+                # Check for changes in cell value
+                if not node1.compare_content(node2):
+                    changes.append(NodeModification(node1, node2))
+
+                # Check for changes in operands
+                pending.append((node1.expr, node2.expr))
+
+            elif isinstance(node1, Cell) and isinstance(node2, Cell):
+                # Check for changes in cell value
+                if not node1.compare_content(node2):
+                    changes.append(NodeModification(node1, node2))
+
+            elif isinstance(node1, Name) and isinstance(node2, Name):
+                # Check for changes in cell value
+                if not node1.compare_content(node2):
+                    changes.append(NodeModification(node1, node2))
+
+            elif isinstance(node1, Number) and isinstance(node2, Number):
+                # Check for changes in cell value
+                if not node1.compare_content(node2):
+                    changes.append(NodeModification(node1, node2))
 
-            if not isinstance(node1.right, type(node2.right)):
-                changes.append(ChildDeletion(node1, node1.right))
-                changes.append(ChildAddition(node1, node2.right))
             else:
-                traverse_and_compare(node1.right, node2.right)
-
-        elif isinstance(node1, CellRange) and isinstance(node2, CellRange):
-            # Check for changes in cell range
-            if not node1.compare_content(node2):
-                changes.append(NodeModification(node1, node2))
-
-        elif isinstance(node1, Function) and isinstance(node2, Function):
-            # Check for changes in cell value
-            if not node1.compare_content(node2):
-                changes.append(NodeModification(node1, node2))
-
-            # Check for changes in operands
-            for arg1, arg2 in zip_longest(node1.arguments, node2.arguments):
-                if arg1 is None:
-                    # New argument added in modified_node
-                    changes.append(ChildAddition(node1, arg2))
-                elif arg2 is None:
-                    # Argument removed in modified_node (if you want to handle deletions)
-                    changes.append(ChildDeletion(node1, arg1))
-                elif type(arg1) != type(arg2):
-                    # Different type of argument found, treat as deletion and addition
-                    changes.append(ChildDeletion(node1, arg1))
-                    changes.append(ChildAddition(node1, arg2))
-                else:
-                    traverse_and_compare(arg1, arg2)
-
-        elif isinstance(node1, Unary) and isinstance(node2, Unary):
-            # Check for changes in cell value
-            if not node1.compare_content(node2):
-                changes.append(NodeModification(node1, node2))
-
-            # Check for changes in operands
-            traverse_and_compare(node1.expr, node2.expr)
-
-        elif isinstance(node1, Cell) and isinstance(node2, Cell):
-            # Check for changes in cell value
-            if not node1.compare_content(node2):
-                changes.append(NodeModification(node1, node2))
-
-        elif isinstance(node1, Name) and isinstance(node2, Name):
-            # Check for changes in cell value
-            if not node1.compare_content(node2):
-                changes.append(NodeModification(node1, node2))
-
-        elif isinstance(node1, Number) and isinstance(node2, Number):
-            # Check for changes in cell value
-            if not node1.compare_content(node2):
-                changes.append(NodeModification(node1, node2))
-
-        else:
-            # print the node type
-            raise Exception("Node type not found for change of type", type(node1))
+                # print the node type
+                raise Exception("Node type not found for change of type", type(node1))
+
+            stack.extend(reversed(pending))
 
     def check_for_structural_change(node1, node2):
         # Check for a new Binary root node addition
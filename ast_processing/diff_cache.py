@@ -0,0 +1,142 @@
+from collections import OrderedDict
+from parser.cache import CacheInfo
+from parser.nodes import BaseNode
+from typing import Callable, List, Optional
+
+from ast_processing.compare_asts import compare_asts
+from ast_utils.change_classes import Change
+
+# Where a template finds a node: in which tree, the child indices leading
+# to it from the root and its type
+_BASE, _TARGET, _VALUE = range(3)
+
+
+class DiffCache:
+    """
+    Bounded LRU cache of diffs, keyed by the structural hashes of both trees.
+
+    The same base is often diffed against the same target on many
+    replicas, e.g. when everyone accepts one suggested edit. The first
+    diff is kept as a template that records where each node a change
+    refers to sits in the two trees. A hit rebinds the template to the
+    caller's trees, so the changes refer to the caller's live nodes and
+    ids, in time proportional to the size of the change set. Instances are
+    drop-in diff engines for ASTManager and may be shared between
+    replicas. A maxsize of 0 disables caching.
+    """
+
+    def __init__(
+        self,
+        diff: Callable[[BaseNode, BaseNode], List[Change]] = compare_asts,
+        maxsize: int = 1024,
+    ):
+        self.diff = diff
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._templates: OrderedDict[tuple, list] = OrderedDict()
+
+    def __call__(
+        self, original_node: BaseNode, modified_node: BaseNode
+    ) -> List[Change]:
+        if self.maxsize <= 0:
+            self.misses += 1
+            return self.diff(original_node, modified_node)
+
+        # compare_asts treats a pair of roots differently from inner nodes
+        key = (
+            original_node.structural_hash(),
+            modified_node.structural_hash(),
+            original_node.is_root(),
+        )
+        template = self._templates.get(key)
+        if template is not None:
+            changes = _bind(template, original_node, modified_node)
+            # A hash collision shows up as a template that does not fit
+            if changes is not None:
+                self.hits += 1
+                self._templates.move_to_end(key)
+                return changes
+
+        self.misses += 1
+        changes = self.diff(original_node, modified_node)
+        template = _template(changes, original_node, modified_node)
+        if template is not None:
+            self._templates[key] = template
+            if len(self._templates) > self.maxsize:
+                self._templates.popitem(last=False)
+        return changes
+
+    def resize(self, maxsize: int):
+        self.maxsize = maxsize
+        while len(self._templates) > max(maxsize, 0):
+            self._templates.popitem(last=False)
+
+    def clear(self):
+        self._templates.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._templates))
+
+
+def _locations(root: BaseNode) -> dict:
+    # Parent and child index of every node, by id
+    where = {id(root): (None, None)}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        for i, child in enumerate(node.children()):
+            if child is not None:
+                where[id(child)] = (node, i)
+                stack.append(child)
+    return where
+
+
+def _path(where: dict, node: BaseNode) -> tuple:
+    path = []
+    parent, i = where[id(node)]
+    while parent is not None:
+        path.append(i)
+        parent, i = where[id(parent)]
+    return tuple(reversed(path))
+
+
+def _template(changes: List[Change], original: BaseNode, modified: BaseNode):
+    # None when a change refers to a node in neither tree
+    base, target = _locations(original), _locations(modified)
+    template = []
+    for change in changes:
+        fields = []
+        for name, value in vars(change).items():
+            if not isinstance(value, BaseNode):
+                fields.append((name, _VALUE, value, None))
+            elif id(value) in base:
+                fields.append((name, _BASE, _path(base, value), type(value)))
+            elif id(value) in target:
+                fields.append((name, _TARGET, _path(target, value), type(value)))
+            else:
+                return None
+        template.append((type(change), fields))
+    return template
+
+
+def _bind(template, original: BaseNode, modified: BaseNode) -> Optional[List[Change]]:
+    changes = []
+    for cls, fields in template:
+        change = object.__new__(cls)
+        for name, where, value, node_type in fields:
+            if where != _VALUE:
+                node = original if where == _BASE else modified
+                try:
+                    for i in value:
+                        node = node.children()[i]
+                except IndexError:
+                    return None
+                if type(node) is not node_type:
+                    return None
+                value = node
+            setattr(change, name, value)
+        changes.append(change)
+    return changes
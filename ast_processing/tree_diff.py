@@ -0,0 +1,341 @@
+"""
+GumTree-style diff, an alternative to compare_asts.
+
+compare_asts walks both trees in step and only lines up Function
+arguments that are identical, everything else is compared by position.
+tree_diff first matches nodes between the two trees, wherever they are,
+and only then derives changes from the matching:
+
+1. Top-down, identical subtrees of some height are anchored by their
+   structural hash, the largest first.
+2. Bottom-up, nodes whose descendants were mostly matched to the
+   descendants of a node of the same type are matched to that node, and
+   their children are aligned by hash, then by type.
+3. Matched nodes whose content differs become NodeModifications. The
+   children of matched nodes that stay in order are kept, the others are
+   deleted and unmatched ones added, in the place they take in the
+   modified tree.
+
+There is no change type for moves, a subtree that moved is deleted and
+added again. Pairs of trees the matching cannot cover, like a new root,
+are left to compare_asts.
+"""
+
+import heapq
+from itertools import count
+from parser.nodes import BaseNode, Binary, Function, Logical, Unary
+from typing import Dict, List
+
+from ast_processing.align import align
+from ast_processing.compare_asts import compare_asts
+from ast_utils.change_classes import (
+    Change,
+    ChildAddition,
+    ChildDeletion,
+    NodeModification,
+)
+
+# Smallest height of a subtree anchored by the top-down phase, single
+# cells and numbers repeat too often to be anchored on their own
+MIN_HEIGHT = 2
+# Share of matched descendants for two nodes to be matched bottom-up
+MIN_DICE = 0.5
+
+
+class _Tree:
+    # Pre-order position, subtree size, height and parent of every node. The
+    # parent attributes of the nodes are not used, as replicas share nodes.
+
+    def __init__(self, root: BaseNode):
+        self.root = root
+        self.order: List[BaseNode] = []
+        self.pre: Dict[BaseNode, int] = {}
+        self.parent: Dict[BaseNode, BaseNode] = {}
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            self.pre[node] = len(self.order)
+            self.order.append(node)
+            children = [child for child in node.children() if child is not None]
+            for child in children:
+                self.parent[child] = node
+            stack.extend(reversed(children))
+
+        self.size: Dict[BaseNode, int] = {}
+        self.height: Dict[BaseNode, int] = {}
+        for node in reversed(self.order):
+            size, height = 1, 0
+            for child in node.children():
+                if child is not None:
+                    size += self.size[child]
+                    height = max(height, self.height[child])
+            self.size[node] = size
+            self.height[node] = height + 1
+
+    def descendants(self, node: BaseNode) -> List[BaseNode]:
+        start = self.pre[node]
+        return self.order[start + 1 : start + self.size[node]]
+
+    def contains(self, ancestor: BaseNode, node: BaseNode) -> bool:
+        start = self.pre[ancestor]
+        return start < self.pre[node] < start + self.size[ancestor]
+
+
+class _Matcher:
+    def __init__(self, root1: BaseNode, root2: BaseNode):
+        self.t1 = _Tree(root1)
+        self.t2 = _Tree(root2)
+        self.m12: Dict[BaseNode, BaseNode] = {}
+        self.m21: Dict[BaseNode, BaseNode] = {}
+
+    def match(self, node1: BaseNode, node2: BaseNode):
+        self.m12[node1] = node2
+        self.m21[node2] = node1
+
+    def match_subtrees(self, node1: BaseNode, node2: BaseNode):
+        # Identical subtrees have the same shape, so pre-order pairs them up
+        self.match(node1, node2)
+        for d1, d2 in zip(self.t1.descendants(node1), self.t2.descendants(node2)):
+            self.match(d1, d2)
+
+    def top_down(self):
+        tie = count()
+        open1 = [(-self.t1.height[self.t1.root], next(tie), self.t1.root)]
+        open2 = [(-self.t2.height[self.t2.root], next(tie), self.t2.root)]
+
+        def pop_height(heap):
+            height = -heap[0][0]
+            nodes = []
+            while heap and -heap[0][0] == height:
+                nodes.append(heapq.heappop(heap)[2])
+            return nodes
+
+        def open_children(heap, tree, nodes):
+            for node in nodes:
+                for child in node.children():
+                    if child is not None:
+                        heapq.heappush(heap, (-tree.height[child], next(tie), child))
+
+        while open1 and open2:
+            height1, height2 = -open1[0][0], -open2[0][0]
+            if max(height1, height2) < MIN_HEIGHT:
+                break
+            if height1 != height2:
+                if height1 > height2:
+                    open_children(open1, self.t1, pop_height(open1))
+                else:
+                    open_children(open2, self.t2, pop_height(open2))
+                continue
+
+            nodes1, nodes2 = pop_height(open1), pop_height(open2)
+            by_hash: Dict[int, tuple] = {}
+            for node in nodes1:
+                by_hash.setdefault(node.structural_hash(), ([], []))[0].append(node)
+            for node in nodes2:
+                by_hash.setdefault(node.structural_hash(), ([], []))[1].append(node)
+
+            matched = set()
+            for candidates1, candidates2 in by_hash.values():
+                if not candidates1 or not candidates2:
+                    continue
+                for node1, node2 in self._pair_candidates(candidates1, candidates2):
+                    self.match_subtrees(node1, node2)
+                    matched.add(node1)
+                    matched.add(node2)
+            open_children(open1, self.t1, [n for n in nodes1 if n not in matched])
+            open_children(open2, self.t2, [n for n in nodes2 if n not in matched])
+
+    def _pair_candidates(self, candidates1, candidates2):
+        # Identical subtrees that occur more than once are paired up by how
+        # alike their parents are, then by where they sit in them
+        if len(candidates1) == 1 and len(candidates2) == 1:
+            return [(candidates1[0], candidates2[0])]
+
+        def parent_hash(tree, node):
+            parent = tree.parent.get(node)
+            return parent.structural_hash() if parent is not None else None
+
+        def position(tree, node):
+            parent = tree.parent.get(node)
+            if parent is None:
+                return 0.0
+            siblings = parent.children()
+            return next(i for i, child in enumerate(siblings) if child is node) / len(
+                siblings
+            )
+
+        scored = []
+        for node1 in candidates1:
+            for node2 in candidates2:
+                same_parent = parent_hash(self.t1, node1) == parent_hash(self.t2, node2)
+                distance = abs(position(self.t1, node1) - position(self.t2, node2))
+                scored.append((not same_parent, distance, len(scored), node1, node2))
+        scored.sort(key=lambda item: item[:3])
+
+        pairs, used = [], set()
+        for _, _, _, node1, node2 in scored:
+            if node1 not in used and node2 not in used:
+                pairs.append((node1, node2))
+                used.add(node1)
+                used.add(node2)
+        return pairs
+
+    def bottom_up(self):
+        root1, root2 = self.t1.root, self.t2.root
+        for node1 in reversed(self.t1.order):
+            if node1 in self.m12 or not node1.children():
+                continue
+            if node1 is root1:
+                if type(root1) == type(root2) and root2 not in self.m21:
+                    self.match(root1, root2)
+                    self.recover(root1, root2)
+                continue
+            candidate = self._best_candidate(node1)
+            if candidate is not None:
+                self.match(node1, candidate)
+                self.recover(node1, candidate)
+
+    def _best_candidate(self, node1):
+        descendants = self.t1.descendants(node1)
+        candidates = set()
+        for descendant in descendants:
+            partner = self.m12.get(descendant)
+            parent = self.t2.parent.get(partner) if partner is not None else None
+            while parent is not None and parent not in candidates:
+                if type(parent) == type(node1) and parent not in self.m21:
+                    candidates.add(parent)
+                parent = self.t2.parent.get(parent)
+
+        best, best_dice = None, MIN_DICE
+        for candidate in candidates:
+            common = sum(
+                1
+                for descendant in descendants
+                if descendant in self.m12
+                and self.t2.contains(candidate, self.m12[descendant])
+            )
+            dice = 2 * common / (len(descendants) + self.t2.size[candidate] - 1)
+            if dice >= best_dice:
+                best, best_dice = candidate, dice
+        return best
+
+    def recover(self, node1: BaseNode, node2: BaseNode):
+        # Matches the unmatched children of a matched pair, identical ones
+        # first and then ones of the same type, whose children in turn are
+        # recovered
+        stack = [(node1, node2)]
+        while stack:
+            node1, node2 = stack.pop()
+            if isinstance(node1, Function):
+                children1 = [c for c in node1.arguments if c not in self.m12]
+                children2 = [c for c in node2.arguments if c not in self.m21]
+                for i, j in align(
+                    [c.structural_hash() for c in children1],
+                    [c.structural_hash() for c in children2],
+                ):
+                    self.match_subtrees(children1[i], children2[j])
+                children1 = [c for c in children1 if c not in self.m12]
+                children2 = [c for c in children2 if c not in self.m21]
+                pairs = [
+                    (children1[i], children2[j])
+                    for i, j in align(
+                        [_type_key(c) for c in children1],
+                        [_type_key(c) for c in children2],
+                    )
+                ]
+            else:
+                # Binary and Unary children stay in their slots
+                pairs = [
+                    (child1, child2)
+                    for child1, child2 in zip(node1.children(), node2.children())
+                    if child1 is not None
+                    and child2 is not None
+                    and child1 not in self.m12
+                    and child2 not in self.m21
+                    and _type_key(child1) == _type_key(child2)
+                ]
+
+            for child1, child2 in pairs:
+                if child1.structural_hash() == child2.structural_hash():
+                    self.match_subtrees(child1, child2)
+                else:
+                    self.match(child1, child2)
+                    if child1.children():
+                        stack.append((child1, child2))
+
+
+def _type_key(node: BaseNode):
+    # Logical nodes cannot be modified in place, only identical ones match
+    if isinstance(node, Logical):
+        return (Logical, node.value)
+    return type(node)
+
+
+def tree_diff(original_node: BaseNode, modified_node: BaseNode) -> List[Change]:
+    if type(original_node) != type(modified_node):
+        return compare_asts(original_node, modified_node)
+
+    matcher = _Matcher(original_node, modified_node)
+    matcher.top_down()
+    matcher.bottom_up()
+    m12 = matcher.m12
+
+    changes: List[Change] = []
+    stack = [(original_node, modified_node)]
+    while stack:
+        node1, node2 = stack.pop()
+        if node1.structural_hash() == node2.structural_hash():
+            continue
+        pending = []
+
+        if isinstance(node1, Unary) and m12.get(node1.expr) is not node2.expr:
+            # A Unary operand cannot be swapped out on its own
+            changes.extend(compare_asts(node1, node2))
+            continue
+
+        if not node1.compare_content(node2):
+            changes.append(NodeModification(node1, node2))
+
+        if isinstance(node1, Function):
+            args1, args2 = node1.arguments, node2.arguments
+            # Matched arguments that keep their order are kept, compared by
+            # identity of the partner, unmatched ones never compare equal
+            kept = align(
+                [
+                    id(m12[arg]) if arg in m12 else ("deleted", i)
+                    for i, arg in enumerate(args1)
+                ],
+                [id(arg) for arg in args2],
+            )
+            kept1 = {i for i, _ in kept}
+            kept2 = {j for _, j in kept}
+            # Deletions come first, so each addition can go to the position
+            # it has in the modified arguments
+            for i, arg in enumerate(args1):
+                if i not in kept1:
+                    changes.append(ChildDeletion(node1, arg))
+            for j, arg in enumerate(args2):
+                if j not in kept2:
+                    changes.append(ChildAddition(node1, arg, j))
+            pending.extend((args1[i], args2[j]) for i, j in kept)
+
+        elif isinstance(node1, Binary):
+            replaced = []
+            operands = zip(("left", "right"), node1.children(), node2.children())
+            for operand, child1, child2 in operands:
+                if child1 is not None and m12.get(child1) is child2:
+                    pending.append((child1, child2))
+                    continue
+                if child1 is not None:
+                    changes.append(ChildDeletion(node1, child1))
+                if child2 is not None:
+                    replaced.append(ChildAddition(node1, child2, operand=operand))
+            # Both operands are free by the time they are added
+            changes.extend(replaced)
+
+        elif isinstance(node1, Unary):
+            pending.append((node1.expr, node2.expr))
+
+        stack.extend(reversed(pending))
+
+    return changes
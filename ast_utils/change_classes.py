@@ -1,5 +1,5 @@
 from parser.nodes import BaseNode
-from typing import Union
+from typing import Optional, Union
 
 # Python type hinting shenanigans
 class Change:
@@ -16,15 +16,39 @@ class NodeModification(Change):
 
 
 class ChildAddition(Change):
-    def __init__(self, parent_node: BaseNode, child_node: BaseNode):
+    def __init__(
+        self,
+        parent_node: BaseNode,
+        child_node: BaseNode,
+        position: Optional[int] = None,
+        left=None,
+        operand: Optional[str] = None,
+    ):
         self.parent_node = parent_node
         self.child_node = child_node
+        # Index among a Function's arguments, None appends
+        self.position = position
+        # First id of the argument the child went after, or of the parent
+        # when it went first. Set once the change is applied, a merged
+        # change goes after the same argument rather than at position.
+        self.left = left
+        # Operand of a Binary the child goes into, "left" or "right". None
+        # takes the free one, and is set once the change is applied.
+        self.operand = operand
 
 
 class ChildDeletion(Change):
-    def __init__(self, parent_node: BaseNode, child_node: BaseNode):
+    def __init__(
+        self,
+        parent_node: BaseNode,
+        child_node: BaseNode,
+        position: Optional[int] = None,
+    ):
         self.parent_node = parent_node
         self.child_node = child_node
+        # Index among a Function's arguments where the child is likely to
+        # be, None when it is not known
+        self.position = position
 
 
 class RootAddition(Change):
@@ -0,0 +1,156 @@
+from parser.nodes import BaseNode
+from typing import Optional
+
+# Tombstone of a key that was removed after the layer holding it was frozen
+_REMOVED = object()
+_MISSING = object()
+
+
+class ForkableDict:
+    """
+    Dict that forks in O(1).
+
+    Contents are kept in layers. Writes go to a private top layer, the
+    layers below it are frozen and may be shared with forks. Forking
+    freezes the top layer and gives both dicts a new empty one. Lookups
+    walk the layers newest first, so a frozen layer is merged into the one
+    below it while it is at least half that size. Layer sizes then grow
+    geometrically, there are O(log n) of them and each entry is copied
+    O(log n) times, however often the dict is forked.
+    """
+
+    def __init__(self, items=None):
+        self._top = dict(items or {})
+        self._frozen = ()
+        self._size = len(self._top)
+
+    def get(self, key, default=None):
+        value = self._top.get(key, _MISSING)
+        if value is _MISSING:
+            for layer in self._frozen:
+                value = layer.get(key, _MISSING)
+                if value is not _MISSING:
+                    break
+            else:
+                return default
+        return default if value is _REMOVED else value
+
+    def __setitem__(self, key, value):
+        if self.get(key, _MISSING) is _MISSING:
+            self._size += 1
+        self._top[key] = value
+
+    def pop(self, key, default=None):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            return default
+        self._size -= 1
+        if self._frozen:
+            self._top[key] = _REMOVED
+        else:
+            del self._top[key]
+        return value
+
+    def fork(self) -> "ForkableDict":
+        layers = self._frozen
+        if self._top:
+            layers = self._compact((self._top,) + layers)
+        self._top = {}
+        self._frozen = layers
+        other = ForkableDict()
+        other._frozen = layers
+        other._size = self._size
+        return other
+
+    @staticmethod
+    def _compact(layers):
+        layers = list(layers)
+        while len(layers) > 1 and 2 * len(layers[0]) >= len(layers[1]):
+            merged = dict(layers[1])
+            merged.update(layers[0])
+            if len(layers) == 2:
+                # Nothing below is left for tombstones to hide
+                merged = {k: v for k, v in merged.items() if v is not _REMOVED}
+            layers[:2] = [merged]
+        return tuple(layers)
+
+    def items(self):
+        merged = {}
+        for layer in reversed((self._top,) + self._frozen):
+            merged.update(layer)
+        return ((key, value) for key, value in merged.items() if value is not _REMOVED)
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class NodeIndex:
+    """
+    Maps every id that a live node has ever had to that node.
+
+    Ids are unique, so any id of a node's history finds it. Lookups use the
+    first id, the one a node is created with, which is the same match rule
+    as find_node. The index has to be told about every change to the tree
+    it covers, ASTManager does this as it applies changes.
+    """
+
+    def __init__(self, root: Optional[BaseNode] = None):
+        self._nodes = ForkableDict()
+        if root is not None:
+            self.add_subtree(root)
+
+    def get(self, node: BaseNode) -> Optional[BaseNode]:
+        return self._nodes.get(node.id_history[0])
+
+    def get_id(self, node_id) -> Optional[BaseNode]:
+        return self._nodes.get(node_id)
+
+    def add_node(self, node: BaseNode):
+        for node_id in node.id_history:
+            self._nodes[node_id] = node
+
+    def add_subtree(self, root: BaseNode, skip: Optional[BaseNode] = None):
+        # skip is a subtree that is indexed already
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node is skip or node is None:
+                continue
+            self.add_node(node)
+            stack.extend(node.children())
+
+    def remove_subtree(self, root: BaseNode):
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            for node_id in node.id_history:
+                self._nodes.pop(node_id, None)
+            stack.extend(node.children())
+
+    def discard(self, node_id):
+        # An id a live node no longer has, see crdt.gc
+        self._nodes.pop(node_id, None)
+
+    def add_latest_id(self, node: BaseNode):
+        # After refresh_node appended a new id
+        self._nodes[node.id_history[-1]] = node
+
+    def ids(self):
+        return (node_id for node_id, _ in self._nodes.items())
+
+    def fork(self) -> "NodeIndex":
+        # Copy-on-write copy for a forked replica, see ForkableDict
+        other = NodeIndex()
+        other._nodes = self._nodes.fork()
+        return other
+
+    def __contains__(self, node_id) -> bool:
+        return node_id in self._nodes
+
+    def __len__(self) -> int:
+        return len(self._nodes)
@@ -1,5 +1,6 @@
 from typing import Optional
 from ast_utils.custom_exceptions import NodeNotFoundError
+from ast_utils.index import NodeIndex
 from parser.nodes import BaseNode, Binary, Cell, CellRange, Function, Name, Number, Unary
 from copy import deepcopy
 
@@ -11,37 +12,41 @@ from ast_utils.change_classes import (
     RootDeletion,
 )
 
-def find_node(root: BaseNode, new_node: BaseNode) -> BaseNode:
-    target_history = new_node.id_history
-    def id_history_matches(node_history: list[str], target_history: list[str]) -> bool:
-        # Check if any part of target_history matches with node_history
-        return any(node_history[:i] == target_history[:i] for i in range(1, len(target_history) + 1))
-
-    if id_history_matches(root.id_history, target_history):
-        return root
-
-    # Recursive search in composite nodes
-    if isinstance(root, Function):
-        for arg in root.arguments:
-            try:
-                return find_node(arg, new_node)
-            except NodeNotFoundError:
-                continue
-
-    elif isinstance(root, Binary):
-        try:
-            return find_node(root.left, new_node)
-        except NodeNotFoundError:
-            return find_node(root.right, new_node)
-
-    elif isinstance(root, Unary):
-        return find_node(root.expr, new_node)
+def find_node(
+    root: BaseNode, new_node: BaseNode, index: Optional[NodeIndex] = None
+) -> BaseNode:
+    # With an index of the tree the lookup is a single dict access
+    if index is not None:
+        node = index.get(new_node)
+        if node is None:
+            raise NodeNotFoundError(
+                f"Node with history {new_node.id_history} not found in AST."
+            )
+        return node
+
+    # Nodes match when they descend from the same original node, i.e. their
+    # histories share a common prefix, which is the case exactly when their
+    # first ids are equal
+    target_id = new_node.id_history[0]
+
+    # Pre-order search with an explicit stack, so deeply nested formulas do
+    # not hit the recursion limit
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node.id_history[0] == target_id:
+            return node
+
+        # Search composite nodes, left to right
+        stack.extend(child for child in reversed(node.children()) if child is not None)
 
     # If the node is not found in any of the branches
-    raise NodeNotFoundError(f"Node with history {target_history} not found in AST.")
+    raise NodeNotFoundError(
+        f"Node with history {new_node.id_history} not found in AST."
+    )
 
 
-def modify_node(change: NodeModification, user_id: str):
+def modify_node(change: NodeModification, user_id: str, clock=None):
     original_node = change.original_node
     new_node = change.new_node
 
@@ -79,63 +84,96 @@ def modify_node(change: NodeModification, user_id: str):
         case _:
             raise Exception("Node type to modify not found")
 
-    original_node.refresh_node(user_id)
+    original_node.invalidate_hash()
+    original_node.refresh_node(user_id, clock)
     change.new_node = original_node # needed to find match in merge.py
 
 
-def add_child(change: ChildAddition, user_id):
-    # Logic to add a child node to a parent node
-    # This function appends child_node to the children of parent_node
+def add_child(change: ChildAddition, user_id, clock=None):
+    # Adds child_node to parent_node: among a Function's arguments at
+    # change.position, recording in change.left the argument it went
+    # after, or into change.operand of a Binary, or the free operand,
+    # recording which
 
     child_node = change.child_node
     parent_node = change.parent_node
 
     if isinstance(parent_node, Function):
-        parent_node.arguments.append(child_node)
-        # Note: This is a fix to sort the arguments by timestamp
-        # There might be a better way to do this
-        # parent_node.arguments.sort(key=lambda node: node.timestamp)
-        child_node.refresh_node(user_id)
+        if change.position is None:
+            parent_node.arguments.append(child_node)
+            child_node.position = len(parent_node.arguments) - 1
+        else:
+            # Past the end appends, like list.insert
+            i = min(change.position, len(parent_node.arguments))
+            parent_node.arguments.insert(i, child_node)
+            child_node.position = i
+        i = child_node.position
+        left = parent_node.arguments[i - 1] if i else parent_node
+        change.left = left.id_history[0]
+        child_node.parent = parent_node
+        child_node.refresh_node(user_id, clock)
 
     elif isinstance(parent_node, Binary):
-        if parent_node.left is None:
-            parent_node.left = child_node
-            child_node.refresh_node(user_id)
-        elif parent_node.right is None:
-            parent_node.right = child_node
-            child_node.refresh_node(user_id)
-        else:
-            raise Exception("Binary node already has two children")
+        operand = change.operand
+        if operand is None:
+            operand = "left" if parent_node.left is None else "right"
+        if getattr(parent_node, operand) is not None:
+            raise Exception(f"Binary node already has a {operand} operand")
+        setattr(parent_node, operand, child_node)
+        change.operand = operand
+        child_node.refresh_node(user_id, clock)
+        child_node.parent = parent_node
     else:
         # Handle other types if needed
         raise Exception("Node type to add child node not found")
 
+    parent_node.invalidate_hash()
 
-def remove_child(change: ChildDeletion):
+
+def remove_child(change: ChildDeletion) -> Optional[BaseNode]:
     # Logic to remove a child node from a parent node
-    # This function removes child_node from parent_node's children
+    # This function removes child_node from parent_node's children and
+    # returns the node it removed, if any
 
     parent_node = change.parent_node
     child_node = change.child_node
+    removed = None
 
     if isinstance(parent_node, Function):
-        # Find and remove the argument with matching id_history
-        for i, arg in enumerate(parent_node.arguments):
-            if arg.id_history == child_node.id_history:
-                parent_node.arguments.pop(i)
+        # Find and remove the argument with the same first id, the rest of
+        # the history may have been truncated on one side, see crdt.gc
+        first_id = child_node.id_history[0]
+        i = change.position
+        arguments = parent_node.arguments
+        if i is None or i >= len(arguments) or arguments[i].id_history[0] != first_id:
+            i = parent_node.argument_index(
+                child_node, lambda arg: arg.id_history[0] == first_id
+            )
+        if i is not None:
+            removed = parent_node.arguments.pop(i)
 
     elif isinstance(parent_node, Binary):
-        if parent_node.left == child_node:
+        # By first id too, child_node may be the copy of another replica
+        first_id = child_node.id_history[0]
+        if parent_node.left is not None and parent_node.left.id_history[0] == first_id:
+            removed = parent_node.left
             parent_node.left = None
-        elif parent_node.right == child_node:
+        elif (
+            parent_node.right is not None
+            and parent_node.right.id_history[0] == first_id
+        ):
+            removed = parent_node.right
             parent_node.right = None
 
     else:
         # Handle other types if needed
         raise Exception("Node type to remove not found")
 
+    parent_node.invalidate_hash()
+    return removed
+
 
-def add_root(change: RootAddition, user_id):
+def add_root(change: RootAddition, user_id, clock=None):
     # Logic to add a new root node to the AST
     # This function sets new_root_node as the new root of the AST
 
@@ -158,9 +196,11 @@ def add_root(change: RootAddition, user_id):
         parent_node.arguments = [child_node]
     else:
         raise Exception("Change not supported")
+    child_node.parent = parent_node
+    parent_node.invalidate_hash()
 
     modified_ast = parent_node
-    modified_ast.refresh_node(user_id)
+    modified_ast.refresh_node(user_id, clock)
 
     # Update the change object
     return modified_ast
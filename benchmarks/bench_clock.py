@@ -0,0 +1,24 @@
+"""
+Cost of stamping and ordering edits, datetime against the hybrid logical clock.
+
+Run from the repository root with ``python -m benchmarks.bench_clock``.
+"""
+
+import datetime
+import timeit
+from parser.clock import HybridLogicalClock
+
+if __name__ == "__main__":
+    n = 1_000_000
+    clock = HybridLogicalClock()
+    stamp_datetime = timeit.timeit(datetime.datetime.now, number=n)
+    stamp_clock = timeit.timeit(clock.now, number=n)
+    print(f"stamp   datetime.now  {stamp_datetime / n * 1e9:6.0f} ns")
+    print(f"stamp   clock.now     {stamp_clock / n * 1e9:6.0f} ns")
+
+    a, b = datetime.datetime.now(), datetime.datetime.now()
+    compare_datetime = timeit.timeit(lambda: a > b, number=n)
+    a, b = clock.now(), clock.now()
+    compare_clock = timeit.timeit(lambda: a > b, number=n)
+    print(f"compare datetime      {compare_datetime / n * 1e9:6.0f} ns")
+    print(f"compare int stamps    {compare_clock / n * 1e9:6.0f} ns")
@@ -0,0 +1,61 @@
+"""
+Merging the changes of n offline edits, as they are and coalesced.
+
+One replica edits a formula n times while offline: it rewrites its
+arguments, adds arguments and deletes some again. The other replica then
+merges every change the edits made, or the ones coalesce folds them
+into, which grow with the size of the formula rather than with n. Run
+from the repository root with ``python -m benchmarks.bench_coalesce``.
+"""
+
+import random
+import time
+from parser.parser import parse, set_parse_cache_size
+
+from crdt.ast_manager import ASTManager
+from crdt.coalesce import coalesce
+
+CELLS = [f"{col}{row}" for col in "ABCDEFGH" for row in range(1, 9)]
+
+
+def offline(edits):
+    rng = random.Random(edits)
+    base = ASTManager(parse("SUM(A1, MAX(B2, 3), C3 * 2, D4)"))
+    sender = base.fork()
+    for _ in range(edits):
+        args = [str(arg) for arg in sender.ast.arguments]
+        roll = rng.random()
+        if roll < 0.2 or len(args) < 3:
+            args.insert(rng.randrange(len(args) + 1), f"MAX({rng.choice(CELLS)}, 1)")
+        elif roll < 0.4:
+            del args[rng.randrange(len(args))]
+        else:
+            args[rng.randrange(len(args))] = rng.choice(CELLS)
+        sender.stage(sender.get_changes_to(f"SUM({', '.join(args)})"), "sender")
+    return base, sender
+
+
+def merge(base, changes):
+    receiver = base.fork()
+    start = time.perf_counter()
+    receiver.apply_changes(receiver.merge_changes(changes), "receiver")
+    return time.perf_counter() - start, str(receiver)
+
+
+if __name__ == "__main__":
+    set_parse_cache_size(0)
+    print("n offline edits of one formula, merged by another replica")
+    print("      n  changes  coalesced      plain   coalesce     folded")
+    for edits in (100, 1000, 10000):
+        base, sender = offline(edits)
+        changes = list(sender.pending)
+        start = time.perf_counter()
+        coalesced = coalesce(changes)
+        folding = time.perf_counter() - start
+        plain, plain_result = merge(base, changes)
+        folded, folded_result = merge(base, coalesced)
+        assert plain_result == folded_result == str(sender)
+        print(
+            f"{edits:>7} {len(changes):>8} {len(coalesced):>10}"
+            f" {plain * 1000:8.2f}ms {folding * 1000:8.2f}ms {folded * 1000:8.2f}ms"
+        )
@@ -0,0 +1,47 @@
+"""
+Nesting depth benchmark for the parse, diff, search and serialize paths.
+
+Run from the repository root with ``python -m benchmarks.bench_depth``.
+Formulas are ``IF(A1, IF(A1, ..., 0), 0)`` chains, nested far beyond the
+default recursion limit of the interpreter.
+"""
+
+import sys
+import timeit
+from parser.parser import parse, set_parse_cache_size
+
+from ast_processing.compare_asts import compare_asts
+from ast_utils.operations import find_node
+
+
+def nested_if(depth, leaf="B1"):
+    return "IF(A1, " * depth + leaf + ", 0)" * depth
+
+
+def deepest(node):
+    while node.children():
+        node = node.children()[1]
+    return node
+
+
+def bench(depths):
+    print(f"recursion limit: {sys.getrecursionlimit()}")
+    header = ["depth", "parse", "str", "compare", "find_node"]
+    print(" ".join(f"{name:>10}" for name in header) + "   (ms)")
+    for depth in depths:
+        original = parse(nested_if(depth))
+        modified = parse(nested_if(depth, leaf="B2"))
+        target = deepest(original)
+        timings = [
+            timeit.timeit(lambda: parse(nested_if(depth)), number=1),
+            timeit.timeit(lambda: str(original), number=1),
+            timeit.timeit(lambda: compare_asts(original, modified), number=1),
+            timeit.timeit(lambda: find_node(original, target), number=1),
+        ]
+        print(f"{depth:>10} " + " ".join(f"{t * 1e3:>10.2f}" for t in timings))
+
+
+if __name__ == "__main__":
+    # Measure the parser itself, not the template cache
+    set_parse_cache_size(0)
+    bench([100, 1000, 10000, 20000, 40000])
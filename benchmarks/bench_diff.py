@@ -0,0 +1,35 @@
+"""
+Diff benchmark for a large formula of which a single leaf changes per round.
+
+Run from the repository root with ``python -m benchmarks.bench_diff``.
+"""
+
+import time
+from parser.parser import parse
+
+from ast_processing.compare_asts import compare_asts
+
+
+def long_sum(n, changed=None):
+    args = [f"A{i} * {i}" for i in range(1, n + 1)]
+    if changed is not None:
+        args[changed] = f"A{changed + 1} * 0"
+    return "SUM(" + ", ".join(args) + ")"
+
+
+def bench(n, rounds=20):
+    base = parse(long_sum(n))
+    modified = [parse(long_sum(n, changed=i * n // rounds)) for i in range(rounds)]
+    for ast in [base] + modified:
+        # Trees that have been diffed or parsed through the cache before
+        ast.structural_hash()
+    start = time.perf_counter()
+    for ast in modified:
+        changes = compare_asts(base, ast)
+        assert len(changes) == 1
+    return (time.perf_counter() - start) / rounds
+
+
+if __name__ == "__main__":
+    for n in (100, 1000, 10000):
+        print(f"{n:>6} arguments: {bench(n) * 1000:8.2f} ms per diff")
@@ -0,0 +1,49 @@
+"""
+Diffing the same suggested edit on many replicas, with and without a
+DiffCache in front of the diff engine.
+
+Run from the repository root with ``python -m benchmarks.bench_diff_cache``.
+"""
+
+import time
+from parser.parser import parse
+
+from ast_processing.compare_asts import compare_asts
+from ast_processing.diff_cache import DiffCache
+from ast_processing.tree_diff import tree_diff
+from crdt.ast_manager import ASTManager
+
+REPLICAS = 20
+
+
+def long_sum(n, changed=0):
+    return (
+        "SUM("
+        + ", ".join(f"A{i} * {i + (i <= changed)}" for i in range(1, n + 1))
+        + ")"
+    )
+
+
+def bench(n, engine):
+    # Every replica parses the suggestion itself, only the diff is timed
+    managers = [ASTManager(parse(long_sum(n)), diff_engine=engine)]
+    managers += [managers[0].fork() for _ in range(REPLICAS - 1)]
+    targets = [parse(long_sum(n, n // 10)) for _ in managers]
+    start = time.perf_counter()
+    for manager, target in zip(managers, targets):
+        manager.diff_engine(manager.ast, target)
+    return (time.perf_counter() - start) / REPLICAS
+
+
+if __name__ == "__main__":
+    print(f"per replica, {REPLICAS} replicas diffing the same edit")
+    print(" nodes   engine          uncached     cached")
+    for n in (100, 1000, 5000):
+        for name, engine in (("compare_asts", compare_asts), ("tree_diff", tree_diff)):
+            uncached = bench(n, engine)
+            cache = DiffCache(engine)
+            cached = bench(n, cache)
+            print(
+                f"{3 * n + 1:>6}   {name:<12} {uncached * 1000:8.2f}ms "
+                f"{cached * 1000:8.2f}ms   {cache.info().hits} hits"
+            )
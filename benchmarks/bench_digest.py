@@ -0,0 +1,68 @@
+"""
+Finding the formulas two replicas disagree on: strings against digests.
+
+Two replicas of a sheet of n formulas differ in a few cells. Comparing
+strings renders and sends every formula. Comparing digests costs one
+request when the replicas agree, and otherwise a number of requests
+that grows with log n. Building the digest tree hashes every node the
+first time and only the changed ones after that. Run from the
+repository root with ``python -m benchmarks.bench_digest``.
+"""
+
+import time
+from parser.parser import parse, set_parse_cache_size
+
+from crdt.ast_manager import ASTManager
+from crdt.digest import WorkbookDigest, find_divergence
+
+CHANGED = 10
+
+
+def replicas(n):
+    cells = {
+        f"A{i}": ASTManager(parse(f"SUM(B{i}, C{i} * 2, MAX(D{i}, 3))"))
+        for i in range(n)
+    }
+    other = {address: manager.fork() for address, manager in cells.items()}
+    for i in range(0, n, n // CHANGED):
+        manager = other[f"A{i}"]
+        manager.commit(
+            manager.get_changes_to(f"SUM(B{i}, C{i} * 2, MAX(D{i}, 4))"), "user"
+        )
+    return cells, other
+
+
+def by_strings(cells, other):
+    start = time.perf_counter()
+    differ = [
+        address for address in cells if str(cells[address]) != str(other[address])
+    ]
+    return time.perf_counter() - start, len(differ)
+
+
+def by_digests(cells, other):
+    start = time.perf_counter()
+    first_build = WorkbookDigest({"S": cells})
+    build = time.perf_counter() - start
+    start = time.perf_counter()
+    theirs = WorkbookDigest({"S": other})
+    rebuild = time.perf_counter() - start
+    start = time.perf_counter()
+    found, requests = find_divergence(first_build, theirs)
+    search = time.perf_counter() - start
+    assert len(found) == CHANGED
+    return build, rebuild, search, requests
+
+
+if __name__ == "__main__":
+    set_parse_cache_size(0)
+    print(f"Sheet of n formulas, {CHANGED} of them changed on one replica")
+    print("      n    strings     build   rebuild    search  requests")
+    for n in (1000, 10000, 100000):
+        cells, other = replicas(n)
+        strings, _ = by_strings(cells, other)
+        build, rebuild, search, requests = by_digests(cells, other)
+        print(
+            f"{n:>7} {strings * 1000:8.1f}ms {build * 1000:7.1f}ms"
+            f" {rebuild * 1000:7.1f}ms {search * 1000:7.2f}ms {requests:>9}"
+        )
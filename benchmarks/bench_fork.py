@@ -0,0 +1,51 @@
+"""
+Forking a replica with ASTManager.fork against a deepcopy of its tree.
+
+Times the fork itself and the first edit made after it, which copies the
+path to the edited node. Run from the repository root with
+``python -m benchmarks.bench_fork``.
+"""
+
+import time
+from copy import deepcopy
+from parser.parser import parse, set_parse_cache_size
+
+from crdt.ast_manager import ASTManager
+
+
+def long_sum(n, changed=0):
+    return (
+        "SUM("
+        + ", ".join(f"A{i} * {i + (i <= changed)}" for i in range(1, n + 1))
+        + ")"
+    )
+
+
+def bench(n):
+    original = parse(long_sum(n))
+    manager = ASTManager(original)
+    changes = manager.get_changes_to(long_sum(n, 1))
+
+    start = time.perf_counter()
+    ASTManager(deepcopy(original))
+    copied = time.perf_counter() - start
+
+    start = time.perf_counter()
+    forked = manager.fork()
+    fork = time.perf_counter() - start
+
+    start = time.perf_counter()
+    forked.apply_changes(changes, "user_2")
+    edit = time.perf_counter() - start
+    return copied, fork, edit
+
+
+if __name__ == "__main__":
+    set_parse_cache_size(0)
+    print("  nodes  deepcopy      fork  first edit")
+    for n in (1000, 5000, 17000):
+        copied, fork, edit = bench(n)
+        print(
+            f"{3 * n + 1:>7} {copied * 1000:7.1f}ms {fork * 1e6:7.1f}us "
+            f"{edit * 1000:9.2f}ms"
+        )
@@ -0,0 +1,74 @@
+"""
+Merging into a node edited many times, with and without garbage collection.
+
+Two replicas share a SUM. One of them edits its first argument n times
+and syncs after every SYNC_EVERY edits, so the edits become causally
+stable. The other then either receives one more op on the argument, or
+merges one more edit of it as changes. Without garbage collection the
+argument keeps an id for every edit and both get slower as n grows,
+with it the history stays short and the time stays flat. Run from the
+repository root with ``python -m benchmarks.bench_gc``.
+"""
+
+import time
+from parser.parser import parse, set_parse_cache_size
+
+from crdt.ast_manager import ASTManager
+from crdt.sync import sync
+
+SYNC_EVERY = 100
+ROUNDS = 50
+
+
+def edited(edits, gc_interval):
+    author = ASTManager(parse("SUM(A1, B1, C1)"), gc_interval=gc_interval)
+    other = author.fork()
+    for edit in range(1, edits + 1):
+        author.commit(author.get_changes_to(f"SUM(A{edit + 1}, B1, C1)"), "author")
+        if edit % SYNC_EVERY == 0:
+            sync(author, other)
+    sync(author, other)
+    return author, other
+
+
+def by_ops(author, other, edits):
+    elapsed = 0
+    for row in range(edits + 2, edits + 2 + ROUNDS):
+        ops = author.commit(author.get_changes_to(f"SUM(A{row}, B1, C1)"), "author")
+        start = time.perf_counter()
+        other.receive(ops)
+        elapsed += time.perf_counter() - start
+    return elapsed / ROUNDS
+
+
+def by_changes(author, other, edits):
+    elapsed = 0
+    for row in range(edits + 2, edits + 2 + ROUNDS):
+        changes = other.get_changes_to(f"SUM(B{row}, B1, C1)")
+        other.apply_changes(changes, "other")
+        start = time.perf_counter()
+        merged = author.merge_changes(changes)
+        elapsed += time.perf_counter() - start
+        author.apply_changes(merged, "author")
+    assert str(author) == str(other)
+    return elapsed / ROUNDS
+
+
+if __name__ == "__main__":
+    set_parse_cache_size(0)
+    print(f"n edits to one argument, synced every {SYNC_EVERY}, then one more")
+    print("                 receive op        merge changes    history")
+    print("      n        plain       gc      plain       gc   plain    gc")
+    for edits in (100, 1000, 10000):
+        times, lengths = [], []
+        for gc_interval in (None, SYNC_EVERY):
+            author, other = edited(edits, gc_interval)
+            lengths.append(len(other.ast.arguments[0].id_history))
+            times.append(by_ops(author, other, edits))
+            times.append(by_changes(author, other, edits))
+        ops_plain, changes_plain, ops_gc, changes_gc = times
+        print(
+            f"{edits:>7} {ops_plain * 1e6:10.1f}us {ops_gc * 1e6:7.1f}us"
+            f" {changes_plain * 1e6:8.1f}us {changes_gc * 1e6:7.1f}us"
+            f" {lengths[0]:>7} {lengths[1]:>5}"
+        )
@@ -0,0 +1,50 @@
+"""
+Parse and merge throughput with uuid4 string ids and packed Lamport ids.
+
+Run from the repository root with ``python -m benchmarks.bench_ids``.
+"""
+
+import time
+from copy import deepcopy
+from parser.ids import LamportIds, UuidIds, set_id_scheme
+from parser.parser import parse, set_parse_cache_size
+
+from crdt.ast_manager import ASTManager
+
+
+def long_sum(n, offset=0):
+    return "SUM(" + ", ".join(f"A{i} * {i + offset}" for i in range(1, n + 1)) + ")"
+
+
+def bench_parse(formulas):
+    start = time.perf_counter()
+    for formula in formulas:
+        parse(formula)
+    return time.perf_counter() - start
+
+
+def bench_merge(n):
+    original = parse(long_sum(n))
+    user1 = ASTManager(deepcopy(original))
+    user2 = ASTManager(deepcopy(original))
+    changes = user1.get_changes_to(long_sum(n, offset=1))
+    user1.apply_changes(changes, "user_1")
+
+    start = time.perf_counter()
+    user2.apply_changes(user2.merge_changes(changes), "user_2")
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    set_parse_cache_size(0)
+    formulas = [
+        f"IF(A{i} > 0, SUM(B{i}:B{i + 10}) * 2, -C{i} / {i})" for i in range(1, 20_001)
+    ]
+    for name, scheme in (("uuid4", UuidIds()), ("lamport", LamportIds())):
+        set_id_scheme(scheme)
+        parse_time = bench_parse(formulas)
+        merge_time = bench_merge(1000)
+        print(
+            f"{name:>8}: parse {len(formulas) / parse_time:8.0f} formulas/s, "
+            f"merge of 1000 modifications {merge_time * 1000:7.1f} ms"
+        )
@@ -0,0 +1,51 @@
+"""
+Keystroke editing benchmark, incremental re-parse against a full re-parse.
+
+Types a number into the last argument of a long SUM one character at a
+time. Run from the repository root with
+``python -m benchmarks.bench_incremental``.
+"""
+
+import time
+from parser.parser import parse, set_parse_cache_size
+
+from crdt.ast_manager import ASTManager
+
+
+def long_sum(n):
+    return "SUM(" + ", ".join(f"A{i} * {i}" for i in range(1, n + 1)) + ")"
+
+
+def type_full(formula, keys):
+    manager = ASTManager(parse(formula))
+    start = time.perf_counter()
+    for key in keys:
+        text = str(manager.ast)
+        modified = text[:-2] + key + text[-2:]
+        manager.apply_changes(manager.get_changes_to(modified), "bench")
+    return time.perf_counter() - start
+
+
+def type_incremental(formula, keys):
+    manager = ASTManager(parse(formula))
+    start = time.perf_counter()
+    for key in keys:
+        offset = len(str(manager.ast)) - 2
+        manager.apply_changes(manager.get_changes_for_edit(offset, 0, key), "bench")
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    # Every keystroke produces new text, so the parse cache would only hold
+    # formulas that never come back
+    set_parse_cache_size(0)
+    keys = "1234567890" * 5
+    for n in (10, 100, 1000):
+        formula = long_sum(n)
+        full = type_full(formula, keys)
+        incremental = type_incremental(formula, keys)
+        print(
+            f"{n:>5} arguments: full {full * 1000:8.1f} ms, "
+            f"incremental {incremental * 1000:8.1f} ms "
+            f"({full / incremental:.1f}x)"
+        )
@@ -0,0 +1,47 @@
+"""
+Memory held by parsed ASTs, measured with tracemalloc.
+
+Parses a fill-down sheet of formulas and reports the bytes that stay
+allocated per AST node. Run from the repository root with
+``python -m benchmarks.bench_memory``.
+"""
+
+import tracemalloc
+from parser.parser import parse, set_parse_cache_size
+
+
+def count_nodes(ast):
+    count = 0
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(child for child in node.children() if child is not None)
+    return count
+
+
+def measure(formulas):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    asts = [parse(formula) for formula in formulas]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    nodes = sum(count_nodes(ast) for ast in asts)
+    stats = after.compare_to(before, "filename")
+    allocated = sum(stat.size_diff for stat in stats)
+    return nodes, allocated, stats
+
+
+if __name__ == "__main__":
+    # Templates in the parse cache would be counted against the sheet
+    set_parse_cache_size(0)
+    formulas = [
+        f"IF(A{i} > 0, SUM(B{i}:B{i + 10}) * 2, -C{i} / {i})" for i in range(1, 20_001)
+    ]
+    nodes, allocated, stats = measure(formulas)
+    print(f"{len(formulas)} formulas, {nodes} nodes")
+    print(f"{allocated / 2**20:.1f} MiB, {allocated / nodes:.0f} bytes per node")
+    print("Top allocation sites:")
+    for stat in stats[:5]:
+        print(f"  {stat}")
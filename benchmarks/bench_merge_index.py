@@ -0,0 +1,51 @@
+"""
+Merge lookups through the ASTManager node index against the tree search.
+
+Scales the size of the formula and the number of incoming changes. Run
+from the repository root with ``python -m benchmarks.bench_merge_index``.
+"""
+
+import time
+from copy import deepcopy
+from parser.parser import parse, set_parse_cache_size
+
+from crdt.ast_manager import ASTManager
+from crdt.merge import merge_changes
+
+
+def long_sum(n, changed=0):
+    # The first `changed` arguments differ from the original formula
+    return (
+        "SUM("
+        + ", ".join(f"A{i} * {i + (i <= changed)}" for i in range(1, n + 1))
+        + ")"
+    )
+
+
+def bench(n, changed):
+    original = parse(long_sum(n))
+    user1 = ASTManager(deepcopy(original))
+    user2 = ASTManager(deepcopy(original))
+    changes = user1.get_changes_to(long_sum(n, changed))
+    user1.apply_changes(changes, "user_1")
+
+    start = time.perf_counter()
+    merge_changes(user2.ast, changes)
+    searched = time.perf_counter() - start
+
+    start = time.perf_counter()
+    user2.merge_changes(changes)
+    indexed = time.perf_counter() - start
+    return searched, indexed
+
+
+if __name__ == "__main__":
+    set_parse_cache_size(0)
+    print(" nodes  changes    search    index")
+    for n in (100, 1000, 3000):
+        for changed in (1, n // 10, n):
+            searched, indexed = bench(n, changed)
+            print(
+                f"{3 * n + 1:>6} {changed:>8} {searched * 1000:7.1f}ms "
+                f"{indexed * 1000:7.2f}ms"
+            )
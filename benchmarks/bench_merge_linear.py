@@ -0,0 +1,46 @@
+"""
+End-to-end merge time of ASTManager.merge as the batch of changes grows.
+
+Every argument of a long SUM is edited on one replica, as modifications,
+and the other replica merges and applies the batch. Time per change
+stays flat when merging is linear. Run from the repository root with
+``python -m benchmarks.bench_merge_linear``.
+"""
+
+import time
+from parser.parser import parse, set_parse_cache_size
+
+from crdt.ast_manager import ASTManager
+
+
+def long_sum(n, changed=0):
+    return (
+        "SUM("
+        + ", ".join(f"MAX(A{i}, {i + (i <= changed)})" for i in range(1, n + 1))
+        + ")"
+    )
+
+
+def bench(n):
+    user1 = ASTManager(parse(long_sum(n)))
+    user2 = user1.fork()
+    changes = user1.get_changes_to(long_sum(n, n))
+    user1.apply_changes(changes, "user_1")
+
+    start = time.perf_counter()
+    result = user2.merge(changes)
+    user2.apply_changes(result.changes, "user_2")
+    elapsed = time.perf_counter() - start
+    assert str(user2) == str(user1)
+    return len(changes), elapsed
+
+
+if __name__ == "__main__":
+    set_parse_cache_size(0)
+    print("changes    nodes      merge+apply   per change")
+    for n in (1000, 5000, 10000, 20000):
+        count, elapsed = bench(n)
+        print(
+            f"{count:>7} {4 * n + 1:>8} {elapsed * 1000:12.1f}ms "
+            f"{elapsed / count * 1e6:9.2f}us"
+        )
@@ -0,0 +1,67 @@
+"""
+N-way merge of k replicas against merging every pair of replicas.
+
+Each replica edits its own argument of a long SUM and appends one. The
+pairwise run has every replica merge and apply the changes of every
+other one, k * (k - 1) merges. The N-way run merges the union once into
+the common tree and forks each replica from the result. Run from the
+repository root with ``python -m benchmarks.bench_merge_many``.
+"""
+
+import time
+from parser.parser import parse, set_parse_cache_size
+
+from crdt.ast_manager import ASTManager
+
+ARGS = 500
+
+
+def base():
+    return [f"A{i} * {i}" for i in range(1, ARGS + 1)]
+
+
+def edited(replica):
+    args = base()
+    args[replica] = f"B{replica + 1} * {replica}"
+    return "SUM(" + ", ".join(args + [f"C{replica + 1}"]) + ")"
+
+
+def replicas(k):
+    common = ASTManager(parse("SUM(" + ", ".join(base()) + ")"))
+    managers = [common.fork() for _ in range(k)]
+    change_sets = []
+    for replica, manager in enumerate(managers):
+        changes = manager.get_changes_to(edited(replica))
+        manager.apply_changes(changes, "user")
+        change_sets.append(changes)
+    return common, managers, change_sets
+
+
+def pairwise(k):
+    _, managers, change_sets = replicas(k)
+    start = time.perf_counter()
+    for i, manager in enumerate(managers):
+        for j, changes in enumerate(change_sets):
+            if i != j:
+                manager.apply_changes(manager.merge_changes(changes), "user")
+    return time.perf_counter() - start
+
+
+def n_way(k):
+    common, _, change_sets = replicas(k)
+    start = time.perf_counter()
+    hub = common.fork()
+    result = hub.merge_replicas(change_sets)
+    hub.apply_changes(result.changes, "hub")
+    managers = [hub.fork() for _ in range(k)]
+    elapsed = time.perf_counter() - start
+    assert all(str(manager) == str(hub) for manager in managers)
+    return elapsed
+
+
+if __name__ == "__main__":
+    set_parse_cache_size(0)
+    print(f"SUM of {ARGS} arguments, each replica edits one and appends one")
+    print("  k    pairwise      n-way")
+    for k in (2, 4, 8, 16, 32):
+        print(f"{k:>3} {pairwise(k) * 1000:9.1f}ms {n_way(k) * 1000:9.2f}ms")
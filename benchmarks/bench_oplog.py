@@ -0,0 +1,62 @@
+"""
+Syncing one edit through ops against sending and diffing the formula.
+
+One replica edits one argument of a long SUM. The other replica either
+parses the whole new formula and diffs it against its own tree, or
+receives the single op it is missing. Both end up with the same tree;
+the op costs the same however long the formula is. Run from the
+repository root with ``python -m benchmarks.bench_oplog``.
+"""
+
+import pickle
+import time
+from parser.parser import parse, set_parse_cache_size
+
+from crdt.ast_manager import ASTManager
+
+
+def formula(args, edited=None):
+    cells = [f"A{i} * {i}" for i in range(1, args + 1)]
+    if edited is not None:
+        cells[edited] = f"B{edited + 1} * {edited}"
+    return "SUM(" + ", ".join(cells) + ")"
+
+
+def replicas(args):
+    author = ASTManager(parse(formula(args)))
+    return author, author.fork()
+
+
+def by_formula(args):
+    author, other = replicas(args)
+    text = formula(args, args // 2)
+    author.apply_changes(author.get_changes_to(text), "author")
+    start = time.perf_counter()
+    other.apply_changes(other.get_changes_to(text), "other")
+    elapsed = time.perf_counter() - start
+    assert str(other) == str(author)
+    return elapsed, len(text.encode())
+
+
+def by_ops(args):
+    author, other = replicas(args)
+    author.commit(author.get_changes_to(formula(args, args // 2)), "author")
+    start = time.perf_counter()
+    ops = author.ops_since(other.version_vector)
+    other.receive(ops)
+    elapsed = time.perf_counter() - start
+    assert str(other) == str(author)
+    return elapsed, len(pickle.dumps(ops))
+
+
+if __name__ == "__main__":
+    set_parse_cache_size(0)
+    print("SUM of n arguments, one of them edited on another replica")
+    print("      n     formula     bytes        ops  bytes")
+    for args in (10, 100, 1000, 10000):
+        formula_time, formula_bytes = by_formula(args)
+        ops_time, ops_bytes = by_ops(args)
+        print(
+            f"{args:>7} {formula_time * 1000:9.2f}ms {formula_bytes:>9}"
+            f" {ops_time * 1e6:8.1f}us {ops_bytes:>6}"
+        )
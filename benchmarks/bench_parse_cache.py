@@ -0,0 +1,42 @@
+"""
+Parse cache benchmark for sheets that repeat the same formula text.
+
+Run from the repository root with ``python -m benchmarks.bench_parse_cache``.
+"""
+
+import time
+from parser.parser import (
+    clear_parse_cache,
+    parse,
+    parse_cache_info,
+    set_parse_cache_size,
+)
+
+
+def fill_down(rows, distinct):
+    templates = [
+        "A1 * B1",
+        "SUM(A1:A100) / COUNT(A1:A100)",
+        "IF(A1 > 0, SUM(B1:B10), AVERAGE(C1:C10) * 2)",
+    ]
+    formulas = [f"{templates[i % len(templates)]} + {i}" for i in range(distinct)]
+    return [formulas[i % distinct] for i in range(rows)]
+
+
+def run(formulas, maxsize):
+    set_parse_cache_size(maxsize)
+    clear_parse_cache()
+    start = time.perf_counter()
+    for formula in formulas:
+        parse(formula)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    formulas = fill_down(rows=100_000, distinct=50)
+    uncached = run(formulas, maxsize=0)
+    cached = run(formulas, maxsize=1024)
+    print(f"{len(formulas)} formulas, 50 distinct")
+    print(f"uncached: {uncached:.2f} s")
+    print(f"cached:   {cached:.2f} s ({uncached / cached:.1f}x)")
+    print(parse_cache_info())
@@ -0,0 +1,40 @@
+"""
+Batch parsing benchmark: parse_many against the serial parse loop.
+
+Run from the repository root with ``python -m benchmarks.bench_parse_many``.
+The speedup is bounded by the number of CPUs on the machine.
+"""
+
+import os
+import time
+from parser.parser import parse, parse_many, set_parse_cache_size
+
+
+def workbook(n):
+    # Distinct formulas, so that the parse cache does not hide the work
+    return [
+        f"IF(A{i} > {i}, SUM(B{i}:B{i + 10}) * {i}, AVERAGE(C1:C{i + 1}) - D{i})"
+        for i in range(1, n + 1)
+    ]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    set_parse_cache_size(0)
+    formulas = workbook(50_000)
+    print(f"{len(formulas)} formulas on {os.cpu_count()} CPUs")
+
+    serial = timed(lambda: [parse(formula) for formula in formulas])
+    print(f"{'serial loop':>20}: {serial:6.2f} s")
+    for workers in sorted({2, 4, os.cpu_count() or 1}):
+        for chunksize in (256, 2048):
+            elapsed = timed(
+                lambda: list(parse_many(formulas, workers=workers, chunksize=chunksize))
+            )
+            label = f"{workers} workers/{chunksize}"
+            print(f"{label:>20}: {elapsed:6.2f} s ({serial / elapsed:.2f}x)")
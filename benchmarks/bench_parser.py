@@ -0,0 +1,36 @@
+"""
+Parser scaling benchmark.
+
+Run from the repository root with ``python -m benchmarks.bench_parser``.
+Every row reports the time per token, which stays flat when parsing is
+linear in the formula length.
+"""
+
+import timeit
+from parser.parser import _tokenize, parse, set_parse_cache_size
+
+
+def sum_chain(n):
+    return "SUM(" + ", ".join(f"A{i}" for i in range(1, n + 1)) + ")"
+
+
+def binary_chain(n):
+    return "+".join(f"A{i}" for i in range(1, n + 1))
+
+
+def bench(name, make_formula, sizes, repeat=5):
+    print(f"{name}")
+    print(f"{'args':>8} {'tokens':>8} {'best (ms)':>12} {'us/token':>10}")
+    for n in sizes:
+        formula = make_formula(n)
+        tokens = len(_tokenize(formula))
+        best = min(timeit.repeat(lambda: parse(formula), number=1, repeat=repeat))
+        print(f"{n:>8} {tokens:>8} {best * 1e3:>12.2f} {best * 1e6 / tokens:>10.2f}")
+    print()
+
+
+if __name__ == "__main__":
+    # Measure the parser itself, not the template cache
+    set_parse_cache_size(0)
+    bench("SUM(A1, ..., An)", sum_chain, [1000, 4000, 16000, 64000])
+    bench("A1 + ... + An", binary_chain, [1000, 2000, 4000, 8000])
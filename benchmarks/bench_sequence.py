@@ -0,0 +1,56 @@
+"""
+Inserting into and deleting from a wide argument list, through ops.
+
+One replica of a CHOOSE of n arguments, like the ones generated for
+lookup tables, adds and deletes arguments at random places, and the
+other replica receives the ops. Each op finds its place in the argument
+sequence in O(log n), so the time per op barely grows with n; the
+first op on the Function builds the sequence and is left out. Run from
+the repository root with ``python -m benchmarks.bench_sequence``.
+"""
+
+import random
+import time
+from parser.parser import parse, set_parse_cache_size
+
+from ast_utils.change_classes import ChildAddition, ChildDeletion
+from crdt.ast_manager import ASTManager
+
+ROUNDS = 200
+
+
+def edits(author, rng, rounds):
+    changes = []
+    for _ in range(rounds):
+        arguments = author.ast.arguments
+        if rng.random() < 0.5:
+            child = parse(f"B{rng.randrange(1, 1000)}")
+            position = rng.randrange(1, len(arguments) + 1)
+            changes.append(ChildAddition(author.ast, child, position))
+        else:
+            child = arguments[rng.randrange(1, len(arguments))]
+            changes.append(ChildDeletion(author.ast, child))
+        yield author.commit(changes[-1:], "author")
+
+
+def by_ops(args):
+    rng = random.Random(args)
+    cells = ", ".join(f"A{i}" for i in range(1, args + 1))
+    author = ASTManager(parse(f"CHOOSE(1, {cells})"), gc_interval=None)
+    other = author.fork()
+    ops = list(edits(author, rng, ROUNDS + 1))
+    other.receive(ops[0])
+    start = time.perf_counter()
+    for op in ops[1:]:
+        other.receive(op)
+    elapsed = time.perf_counter() - start
+    assert str(other) == str(author)
+    return elapsed / ROUNDS
+
+
+if __name__ == "__main__":
+    set_parse_cache_size(0)
+    print(f"CHOOSE of n arguments, {ROUNDS} inserts and deletes received as ops")
+    print("      n    per op")
+    for args in (1000, 10000, 100000):
+        print(f"{args:>7} {by_ops(args) * 1e6:7.1f}us")
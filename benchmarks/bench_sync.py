@@ -0,0 +1,90 @@
+"""
+Reconnecting after a long offline session: diff, op log and delta sync.
+
+One replica of a long SUM goes offline and edits a few arguments over and
+over, adds some and deletes some of those again. On reconnect the other
+replica either diffs the whole new formula, receives every op of the
+session or receives the delta past its version vector. The delta grows
+with the number of arguments that changed, the ops with the number of
+edits and the diff with the length of the formula. Run from the
+repository root with ``python -m benchmarks.bench_sync``.
+"""
+
+import pickle
+import random
+import time
+from parser.parser import parse, set_parse_cache_size
+
+from crdt.ast_manager import ASTManager
+from crdt.sync import sync
+
+EDITS = 1000
+# Arguments at the front of the SUM that the session keeps editing
+TOUCHED = 20
+
+
+def session(args):
+    # The two replicas after the session, edited through text edits of
+    # the front of the formula, which leave the other arguments alone
+    online = ASTManager(
+        parse("SUM(" + ", ".join(f"A{i}" for i in range(1, args + 1)) + ")")
+    )
+    offline = online.fork()
+    rng = random.Random(0)
+    for edit in range(EDITS):
+        cells = [str(arg) for arg in offline.ast.arguments[: TOUCHED + 1]]
+        i = rng.randrange(TOUCHED)
+        offset = len("SUM(") + sum(len(cell) + 2 for cell in cells[:i])
+        if edit % 10 == 0:
+            changes = offline.get_changes_for_edit(offset, 0, f"C{edit}, ")
+        elif edit % 10 == 1:
+            changes = offline.get_changes_for_edit(offset, len(cells[i]) + 2, "")
+        else:
+            changes = offline.get_changes_for_edit(offset, len(cells[i]), f"B{edit}")
+        offline.commit(changes, "offline")
+    return online, offline
+
+
+def by_diff(online, offline):
+    online = online.fork()
+    text = str(offline)
+    start = time.perf_counter()
+    online.apply_changes(online.get_changes_to(text), "online")
+    return time.perf_counter() - start, len(text.encode())
+
+
+def by_ops(online, offline):
+    online = online.fork()
+    start = time.perf_counter()
+    ops = offline.ops_since(online.version_vector)
+    online.receive(ops)
+    elapsed = time.perf_counter() - start
+    assert str(online) == str(offline)
+    return elapsed, len(pickle.dumps(ops))
+
+
+def by_delta(online, offline):
+    online = online.fork()
+    start = time.perf_counter()
+    delta = offline.delta_since(online.version_vector)
+    online.receive(delta)
+    elapsed = time.perf_counter() - start
+    assert str(online) == str(offline)
+    assert sync(online, offline) == (0, 0)
+    return elapsed, len(pickle.dumps(delta))
+
+
+if __name__ == "__main__":
+    set_parse_cache_size(0)
+    print(f"{EDITS} offline edits to {TOUCHED} arguments of a SUM of n")
+    print("      n        diff     bytes        ops     bytes      delta   bytes")
+    for args in (100, 1000, 10000):
+        replicas = session(args)
+        diff_time, diff_bytes = by_diff(*replicas)
+        ops_time, ops_bytes = by_ops(*replicas)
+        delta_time, delta_bytes = by_delta(*replicas)
+        print(
+            f"{args:>7} {diff_time * 1000:9.2f}ms {diff_bytes:>9}"
+            f" {ops_time * 1000:8.2f}ms {ops_bytes:>9}"
+            f" {delta_time * 1000:8.2f}ms {delta_bytes:>7}"
+        )
@@ -0,0 +1,51 @@
+"""
+Change counts and runtime of tree_diff against compare_asts.
+
+Edits a long SUM at the front, in the middle and in place, and a nested
+formula in one spot. Run from the repository root with
+``python -m benchmarks.bench_tree_diff``.
+"""
+
+import time
+from parser.parser import parse, set_parse_cache_size
+
+from ast_processing.compare_asts import compare_asts
+from ast_processing.tree_diff import tree_diff
+
+
+def args(n):
+    return [f"A{i} * {i}" for i in range(1, n + 1)]
+
+
+def cases(n):
+    base = args(n)
+    yield "insert front", base, ["B1"] + base
+    yield "delete middle", base, base[: n // 2] + base[n // 2 + 1 :]
+    yield "modify one", base, base[:-1] + ["B1 * 2"]
+    nested = [f"MAX({a}, SUM(C1, C2))" for a in base]
+    changed = list(nested)
+    changed[n // 3] = changed[n // 3].replace("C2", "C3")
+    yield "nested modify", nested, changed
+
+
+def bench(engine, original, modified):
+    original, modified = parse(original), parse(modified)
+    start = time.perf_counter()
+    changes = engine(original, modified)
+    return len(changes), time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    set_parse_cache_size(0)
+    print("                     compare_asts            tree_diff")
+    print("case           args  changes     time  changes     time")
+    for n in (10, 200, 2000):
+        for name, before, after in cases(n):
+            original = f"SUM({', '.join(before)})"
+            modified = f"SUM({', '.join(after)})"
+            old_count, old_time = bench(compare_asts, original, modified)
+            new_count, new_time = bench(tree_diff, original, modified)
+            print(
+                f"{name:<14}{n:>5} {old_count:>8} {old_time * 1000:6.1f}ms "
+                f"{new_count:>8} {new_time * 1000:6.1f}ms"
+            )
@@ -0,0 +1,80 @@
+"""
+Version history of a persistent ASTManager against a deepcopy per version.
+
+Applies a run of single number edits to a nested formula and reports the
+memory each kept version costs and the time a rollback takes. Run from
+the repository root with ``python -m benchmarks.bench_versions``.
+"""
+
+import time
+import tracemalloc
+from copy import deepcopy
+from parser.parser import parse, set_parse_cache_size
+
+from ast_utils.change_classes import NodeModification
+from crdt.ast_manager import ASTManager
+
+EDITS = 100
+
+
+def nested(depth, fanout=8):
+    # SUM of SUMs, fanout**depth numbers in all
+    if depth == 0:
+        return "0"
+    return "SUM(" + ", ".join(nested(depth - 1, fanout) for _ in range(fanout)) + ")"
+
+
+def leaves(ast):
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        if hasattr(node, "arguments"):
+            stack.extend(node.arguments)
+        else:
+            yield node
+
+
+def edits(ast):
+    # One change per edit, each to a different number
+    for i, leaf in zip(range(EDITS), leaves(ast)):
+        yield [NodeModification(leaf, parse(str(i + 1)))]
+
+
+def bench(depth):
+    formula = nested(depth)
+    original = parse(formula)
+
+    tracemalloc.start()
+    manager = ASTManager(original, persistent=True)
+    before = tracemalloc.get_traced_memory()[0]
+    for changes in edits(original):
+        manager.apply_changes(changes, "test")
+    persistent = (tracemalloc.get_traced_memory()[0] - before) / manager.version
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    manager.rollback(manager.version // 2)
+    rollback = time.perf_counter() - start
+
+    copy_original = parse(formula)
+    copier = ASTManager(copy_original)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    history = []
+    for changes in edits(copy_original):
+        copier.apply_changes(changes, "test")
+        history.append(deepcopy(copier.ast))
+    copied = (tracemalloc.get_traced_memory()[0] - before) / len(history)
+    tracemalloc.stop()
+    return persistent, copied, rollback
+
+
+if __name__ == "__main__":
+    set_parse_cache_size(0)
+    print(" leaves  per version (persistent)  per version (deepcopy)  rollback")
+    for depth in (2, 3, 4):
+        persistent, copied, rollback = bench(depth)
+        print(
+            f"{8 ** depth:>7} {persistent / 1024:>24.1f}KB {copied / 1024:>22.1f}KB "
+            f"{rollback * 1e6:7.1f}us"
+        )
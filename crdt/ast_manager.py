@@ -1,6 +1,9 @@
-from parser.nodes import BaseNode
+from parser.clock import HybridLogicalClock
+from parser.ids import observe_id
+from parser.nodes import BaseNode, Binary, Function
+from parser.incremental import reparse
 from parser.parser import parse
-from typing import List
+from typing import Callable, List, Optional
 
 from ast_processing.compare_asts import compare_asts
 from ast_utils.change_classes import (
@@ -11,6 +14,7 @@ from ast_utils.change_classes import (
     RootAddition,
     RootDeletion,
 )
+from ast_utils.index import ForkableDict, NodeIndex
 from ast_utils.operations import (
     add_child,
     add_root,
@@ -19,12 +23,268 @@ from ast_utils.operations import (
     remove_root,
     replace_root_node,
 )
-from crdt.merge import merge_changes
+from crdt.coalesce import coalesce
+from crdt.gc import (
+    Collected,
+    drop_tombstones,
+    newest_id,
+    stable_deletions,
+    stable_ids,
+    truncate,
+)
+from crdt.merge import MergeResult, merge_indexed, merge_many
+from crdt.oplog import (
+    ADD,
+    DELETE,
+    MODIFY,
+    ROOT,
+    SKIP,
+    TOMBSTONE,
+    Op,
+    OpLog,
+    compact,
+    decode_subtree,
+    encode_subtree,
+    set_content,
+    subtree_ids,
+)
+from crdt.sequence import Sequence
+
+# Ops made or received between two garbage collection passes
+GC_INTERVAL = 1000
 
 
 class ASTManager:
-    def __init__(self, original_ast: BaseNode):
+    def __init__(
+        self,
+        original_ast: BaseNode,
+        replica_id: Optional[int] = None,
+        clock: Optional[HybridLogicalClock] = None,
+        persistent: bool = False,
+        diff_engine: Callable[[BaseNode, BaseNode], List[Change]] = compare_asts,
+        gc_interval: Optional[int] = GC_INTERVAL,
+    ):
+        # In persistent mode every applied change leaves a new version and
+        # no node of an earlier version is ever changed again
+        self.persistent = persistent
+        # compare_asts, or tree_diff for smaller change sets
+        self.diff_engine = diff_engine
         self.ast = original_ast
+        # Every replica stamps its own edits, a random replica id is drawn
+        # when neither is given
+        self.clock = clock or HybridLogicalClock(replica_id)
+        self.replica_id = self.clock.replica_id
+        # Ops made or received here, for replicas that sync through ops
+        self.log = OpLog(self.replica_id)
+        # Garbage is collected every gc_interval ops, see collect_garbage,
+        # or never when it is None
+        self.gc_interval = gc_interval
+        self._since_gc = 0
+        # Changes applied here and not yet sent, see stage
+        self.pending: List[Change] = []
+
+    @property
+    def ast(self) -> BaseNode:
+        return self._ast
+
+    @ast.setter
+    def ast(self, ast: BaseNode):
+        # A whole new tree is indexed from scratch, apply_changes keeps the
+        # index up to date with each change instead
+        self._ast = ast
+        self.index = NodeIndex(ast)
+        # Nodes carrying this token may be changed in place. Copies made of
+        # shared nodes are recorded in _copies, so that references to the
+        # originals, like the parent pointers of shared children, lead to
+        # this replica's copies.
+        self._token = object()
+        self._copies = ForkableDict()
+        # Argument order of the functions that ops changed, see _insert_id.
+        # Sequences carrying _sequence_token may be changed in place.
+        self._sequences = ForkableDict()
+        self._sequence_token = object()
+        # Stamp of the latest addition to each operand of a Binary, by
+        # first id of the Binary and operand, see _claim_slot
+        self._slots = ForkableDict()
+        # Tombstones in there whose deletion is stable, see collect_garbage
+        self._stable_deletions = ForkableDict()
+        # The greatest id every replica has, any node added later has a
+        # greater one. Replicas of this manager start from the whole tree.
+        self._newest_stable_id = max(self.index.ids(), default=None)
+        self._claim(ast)
+        self._start_history()
+
+    def _start_history(self):
+        # versions holds the root of every version, _states the index and
+        # copies that go with it
+        self.versions: List[BaseNode] = []
+        self._states = []
+        # The version the latest op made or received left, see rollback
+        self._op_version = 0
+        if self.persistent:
+            self._record()
+
+    def _record(self):
+        # Retiring the token makes the next change copy whatever it touches
+        self._token = object()
+        self.versions.append(self._ast)
+        self._states.append((self.index.fork(), self._copies.fork()))
+
+    @property
+    def version(self) -> int:
+        return len(self.versions) - 1
+
+    def rollback(self, version: int):
+        """
+        Makes an earlier version the current one again, in O(1).
+
+        The versions after it are dropped. Only persistent managers keep
+        versions, every applied change adds one. Ops cannot be taken back,
+        other replicas may have them, nor can the argument sequences and
+        log that went with them, so versions before the latest op are out
+        of reach.
+        """
+        if not self.persistent:
+            raise Exception("Rollback needs a persistent ASTManager")
+        # Raises IndexError for versions that do not exist
+        version = range(len(self.versions))[version]
+        if version < self._op_version:
+            raise Exception(
+                f"Cannot roll back past version {self._op_version}, "
+                "which ops were recorded up to"
+            )
+        index, copies = self._states[version]
+        del self.versions[version + 1 :]
+        del self._states[version + 1 :]
+        self._ast = self.versions[version]
+        self.index = index.fork()
+        self._copies = copies.fork()
+        self._token = object()
+
+    def fork(self, replica_id: Optional[int] = None) -> "ASTManager":
+        """
+        New replica that starts from the same tree, in O(1).
+
+        Both replicas share every node at first and keep all node ids.
+        Whichever replica changes a shared node first copies it, along with
+        the path from the root to it, and leaves the other replica's tree
+        as it was.
+        """
+        other = ASTManager.__new__(ASTManager)
+        other._ast = self._ast
+        other.index = self.index.fork()
+        other._token = object()
+        other._copies = self._copies.fork()
+        other._sequences = self._sequences.fork()
+        other._sequence_token = object()
+        other._slots = self._slots.fork()
+        other._stable_deletions = self._stable_deletions.fork()
+        other.clock = HybridLogicalClock(replica_id)
+        other.replica_id = other.clock.replica_id
+        other.log = self.log.fork(other.replica_id)
+        other.persistent = self.persistent
+        other.diff_engine = self.diff_engine
+        other.gc_interval = self.gc_interval
+        other._since_gc = 0
+        other._newest_stable_id = self._newest_stable_id
+        other.pending = []
+        other._start_history()
+        # The nodes and sequences owned so far are shared from now on
+        self._token = object()
+        self._sequence_token = object()
+        return other
+
+    def snapshot(self) -> BaseNode:
+        # The current tree, which later changes leave untouched
+        self._token = object()
+        return self._ast
+
+    def _claim(self, root: BaseNode):
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            if node._owner is None:
+                node._owner = self._token
+            stack.extend(node.children())
+
+    def _current(self, node: BaseNode) -> BaseNode:
+        # This replica's version of node, following the copies made of it.
+        # Nodes copied again and again, like the root of a persistent
+        # manager, get a shortcut to their latest copy.
+        first = self._copies.get(node)
+        if first is None:
+            return node
+        latest = first
+        while True:
+            copy = self._copies.get(latest)
+            if copy is None:
+                break
+            latest = copy
+        if latest is not first:
+            self._copies[node] = latest
+        return latest
+
+    def _own(self, node: BaseNode) -> BaseNode:
+        # This replica's version of node, made safe to change in place by
+        # copying it and every ancestor up to the first one it owns
+        node = self._current(node)
+        if node._owner is self._token:
+            return node
+
+        path = [node]
+        parent = node.parent
+        while parent is not None:
+            parent = self._current(parent)
+            if parent._owner is self._token:
+                break
+            path.append(parent)
+            parent = parent.parent
+
+        for shared in reversed(path):
+            copy = shared._fork_copy()
+            copy._owner = self._token
+            copy.parent = parent
+            if parent is not None:
+                parent._replace_child(shared, copy)
+            elif shared is self._ast:
+                self._ast = copy
+            self._copies[shared] = copy
+            self.index.add_node(copy)
+            parent = copy
+        return parent
+
+    def _adopt(self, root: BaseNode) -> BaseNode:
+        # An incoming subtree as this replica's own. Nodes nobody owns yet,
+        # like freshly parsed ones, are claimed in place. Otherwise the
+        # subtree is copied, as another replica may still change it.
+        nodes = []
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node is not None:
+                nodes.append(node)
+                stack.extend(node.children())
+        if all(node._owner is None for node in nodes):
+            for node in nodes:
+                node._owner = self._token
+            return root
+
+        root = root._fork_copy()
+        root._owner = self._token
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            for child in list(node.children()):
+                if child is None:
+                    continue
+                copy = child._fork_copy()
+                copy._owner = self._token
+                copy.parent = node
+                node._replace_child(child, copy)
+                stack.append(copy)
+        return root
 
     def apply_changes(self, changes: List[Change], user_id: str):
         # empty list
@@ -34,16 +294,30 @@ class ASTManager:
         for change in changes:
             match change:
                 case NodeModification():
-                    modify_node(change, user_id)
+                    change.original_node = self._own(change.original_node)
+                    modify_node(change, user_id, self.clock)
+                    self.index.add_latest_id(change.original_node)
 
                 case ChildAddition():
-                    add_child(change, user_id)
+                    change.parent_node = self._own(change.parent_node)
+                    change.child_node = self._adopt(change.child_node)
+                    if change.left is not None:
+                        change.position = self._position_after(change)
+                    add_child(change, user_id, self.clock)
+                    self.index.add_subtree(change.child_node)
 
                 case ChildDeletion():
-                    remove_child(change)
+                    change.parent_node = self._own(change.parent_node)
+                    change.child_node = self._current(change.child_node)
+                    removed = remove_child(change)
+                    if removed is not None:
+                        self.index.remove_subtree(removed)
 
                 case RootAddition():
-                    self.ast = add_root(change, user_id)
+                    change.child_node = self._own(change.child_node)
+                    change.parent_node = self._adopt(change.parent_node)
+                    self._ast = add_root(change, user_id, self.clock)
+                    self.index.add_subtree(self._ast, skip=change.child_node)
 
                 # case RootDeletion():
                 #     self.ast = remove_root(original_ast, change, user_id)
@@ -51,16 +325,443 @@ class ASTManager:
                 case _:
                     raise Exception("Change type not found")
 
+            if self.persistent:
+                self._record()
+
+    def stage(self, changes: List[Change], user_id: str):
+        # Applies changes like apply_changes and keeps them until they are
+        # sent, see take_pending
+        self.apply_changes(changes, user_id)
+        self.pending.extend(changes)
+
+    def take_pending(self) -> List[Change]:
+        """
+        The changes staged since the last call, folded by coalesce, for
+        another replica to merge.
+        """
+        changes = coalesce(self.pending)
+        self.pending = []
+        return changes
+
+    def _position_after(self, change: ChildAddition) -> Optional[int]:
+        """
+        Where a child goes among the arguments, right after change.left
+        and past any arguments there with greater first ids, like
+        _insert_id places them for ops. Children added concurrently after
+        the same argument end up in the same order on every replica.
+
+        The position of the change is kept when the argument it went after
+        is not among the arguments here.
+        """
+        parent = change.parent_node
+        if not isinstance(parent, Function):
+            return change.position
+        left = change.left
+        i = 0
+        if left != parent.id_history[0]:
+            i = parent.argument_index(
+                self.index.get_id(left), lambda arg: arg.id_history[0] == left
+            )
+            if i is None:
+                return change.position
+            i += 1
+        key = change.child_node.id_history[0]
+        arguments = parent.arguments
+        while i < len(arguments) and arguments[i].id_history[0] > key:
+            i += 1
+        return i
+
     def get_changes_to(self, modified_ast_str: str) -> List[Change]:
         modified_ast = parse(modified_ast_str)
-        return compare_asts(self.ast, modified_ast)
+        return self.diff_engine(self.ast, modified_ast)
+
+    def get_changes_for_edit(
+        self, offset: int, deleted_length: int, inserted_text: str
+    ) -> List[Change]:
+        # Like get_changes_to, but for a text edit of str(self.ast). Only the
+        # smallest subtree around the edit is parsed and compared, every
+        # other node is left alone.
+        node, parent, subtree = reparse(self.ast, offset, deleted_length, inserted_text)
+        if parent is None or type(node) == type(subtree):
+            return self.diff_engine(node, subtree)
+        # A child whose type changed is swapped out, in place
+        position, operand = None, None
+        if isinstance(parent, Function):
+            position = next(i for i, arg in enumerate(parent.arguments) if arg is node)
+        elif isinstance(parent, Binary):
+            operand = "left" if parent.left is node else "right"
+        return [
+            ChildDeletion(parent, node),
+            ChildAddition(parent, subtree, position, operand=operand),
+        ]
+
+    def commit(self, changes: List[Change], user_id: str) -> List[Op]:
+        """
+        Applies changes like apply_changes and records an op for each.
+
+        The ops are what other replicas receive, in place of the changes.
+        They refer to nodes by id only and can be sent in any order, any
+        number of times.
+        """
+        ops = []
+        for change in changes:
+            if isinstance(change, (ChildAddition, ChildDeletion)):
+                # The order of the arguments as they are before the change
+                parent = self._current(change.parent_node)
+                if isinstance(parent, Function):
+                    self._sequence(parent)
+            self.apply_changes([change], user_id)
+            ops.append(self._record_op(change))
+        self._count_ops(len(ops))
+        if ops:
+            self._op_version = self.version
+        return ops
+
+    def _record_op(self, change: Change) -> Op:
+        # Called right after change was applied, so its nodes are this
+        # replica's and carry their new ids and stamps
+        match change:
+            case NodeModification():
+                node = change.original_node
+                data = (
+                    node._content_key(),
+                    (node.id_history[-1],),
+                    node.timestamp,
+                    node.user_id,
+                )
+                return self.log.record(MODIFY, node.id_history[0], data)
+
+            case ChildAddition():
+                parent, child = change.parent_node, change.child_node
+                left = None
+                if isinstance(parent, Function):
+                    i = parent.argument_index(child, lambda arg: arg is child)
+                    if i:
+                        left = parent.arguments[i - 1].id_history[0]
+                    self._insert_id(parent, left, child.id_history[0])
+                elif isinstance(parent, Binary):
+                    # The operand it went into takes the place of the left
+                    # neighbour
+                    left = change.operand
+                    stamp = (child.timestamp, self.replica_id)
+                    self._slots[(parent.id_history[0], left)] = stamp
+                data = (left, encode_subtree(child))
+                return self.log.record(ADD, parent.id_history[0], data)
+
+            case ChildDeletion():
+                parent, child_id = change.parent_node, change.child_node.id_history[0]
+                if isinstance(parent, Function):
+                    self._remove_id(parent, child_id)
+                return self.log.record(DELETE, parent.id_history[0], (child_id,))
+
+            case RootAddition():
+                child = change.child_node
+                data = (encode_subtree(self._ast, placeholder=child),)
+                return self.log.record(ROOT, child.id_history[0], data)
+
+            case _:
+                raise Exception("Change type not found")
+
+    def receive(self, ops: List[Op], peers: Optional[dict] = None) -> int:
+        """
+        Applies the ops that are new here once their dependencies are,
+        returns how many were applied.
+
+        peers are the version vectors the sender knows of, see
+        OpLog.peers, which tell how far other replicas have got.
+        """
+        before = sum(self.log.version.values())
+        applied = self.log.deliver(ops, self._deliver)
+        if peers:
+            self.log.observe(peers)
+        # Ops a delta left out count too
+        self._count_ops(sum(self.log.version.values()) - before)
+        return applied
+
+    def _deliver(self, op: Op):
+        self._apply_op(op)
+        if self.persistent:
+            self._record()
+            self._op_version = self.version
+
+    def ops_since(self, version: dict) -> List[Op]:
+        # The ops a replica with the given version vector is missing
+        return self.log.missing(version)
+
+    def delta_since(self, version: dict) -> List[Op]:
+        """
+        The ops a replica with the given version vector is missing, thinned
+        out to what it takes to reach this replica's state, see compact.
+
+        The delta grows with the nodes that changed since, not with the
+        number of edits or the size of the tree. Receiving it is as
+        idempotent as receiving the ops themselves.
+        """
+        return compact(self.log.missing(version), self.index.__contains__)
+
+    @property
+    def version_vector(self) -> dict:
+        return dict(self.log.version)
+
+    @property
+    def peers(self) -> dict:
+        # Version vectors of the replicas known here, this one's included
+        return self.log.peers
+
+    def _count_ops(self, count: int):
+        self._since_gc += count
+        if self.gc_interval is not None and self._since_gc >= self.gc_interval:
+            self.collect_garbage()
+
+    def collect_garbage(self) -> Collected:
+        """
+        Drops the ids and tombstones that ops made stable since the last
+        pass, see crdt.gc.
+
+        Each pass looks at the ops that became stable since the one
+        before, so the work is linear in the number of ops overall. Nodes
+        that are shared with forks or earlier versions are copied first.
+        """
+        self._since_gc = 0
+        ops = self.log.newly_stable()
+
+        ids = 0
+        for first_id, stable in stable_ids(ops).items():
+            node = self.index.get_id(first_id)
+            if node is None:
+                continue
+            history, dropped = truncate(self._current(node).id_history, stable)
+            if dropped:
+                node = self._own(node)
+                node.id_history = history
+                for node_id in dropped:
+                    self.index.discard(node_id)
+                ids += len(dropped)
+
+        self._newest_stable_id = newest_id(ops, self._newest_stable_id)
+        for parent_id, deleted in stable_deletions(ops).items():
+            self._stable_deletions[parent_id] = (
+                self._stable_deletions.get(parent_id, frozenset()) | deleted
+            )
+        tombstones = 0
+        for parent_id, deleted in list(self._stable_deletions.items()):
+            sequence = self._sequences.pop(parent_id, Sequence())
+            left_in = frozenset()
+            if parent_id in self.index:
+                kept, left_in = drop_tombstones(
+                    tuple(sequence), deleted, self._newest_stable_id
+                )
+                # Once all are gone the arguments are the sequence again,
+                # see _sequence
+                if not all(present for _, present in kept):
+                    kept = Sequence(kept)
+                    kept._owner = self._sequence_token
+                    self._sequences[parent_id] = kept
+                tombstones += len(sequence) - len(kept)
+            else:
+                # Ops on a parent that is gone do nothing
+                tombstones += len(sequence) - sequence.present()
+            if left_in:
+                self._stable_deletions[parent_id] = frozenset(left_in)
+            else:
+                self._stable_deletions.pop(parent_id)
+        return Collected(ids, tombstones)
+
+    def _apply_op(self, op: Op):
+        if op.kind == MODIFY:
+            content, new_ids, timestamp, user_id = op.data
+            for new_id in new_ids:
+                observe_id(new_id)
+            self.clock.observe(timestamp)
+            node = self.index.get_id(op.target)
+            if node is None:
+                # Deleted here, deletions win
+                return
+            node = self._own(node)
+            # Last writer wins, ranges included. Both orders of two
+            # concurrent modifications leave the later stamp and the
+            # greater id last.
+            if timestamp > node.timestamp:
+                set_content(node, content)
+                node.timestamp = timestamp
+                node.user_id = user_id
+                node.invalidate_hash()
+            for new_id in new_ids:
+                if new_id in node.id_history:
+                    continue
+                if new_id > node.id_history[-1]:
+                    node.id_history.append(new_id)
+                else:
+                    node.id_history.insert(len(node.id_history) - 1, new_id)
+            self.index.add_node(node)
+
+        elif op.kind == ADD:
+            left, subtree = op.data
+            self._observe_subtree(subtree)
+            parent = self.index.get_id(op.target)
+            if parent is None or subtree[2][0] in self.index:
+                return
+            parent = self._own(parent)
+            child = self._adopt(decode_subtree(subtree))
+            if isinstance(parent, Function):
+                i = self._insert_id(parent, left, child.id_history[0])
+                parent.arguments.insert(i, child)
+                child.position = i
+            elif isinstance(parent, Binary):
+                if not self._claim_slot(parent, left, (subtree[3], op.replica)):
+                    return
+                setattr(parent, left, child)
+            else:
+                return
+            child.parent = parent
+            parent.invalidate_hash()
+            self.index.add_subtree(child)
+
+        elif op.kind == DELETE:
+            (child_id,) = op.data
+            observe_id(op.target)
+            observe_id(child_id)
+            parent = self.index.get_id(op.target)
+            child = self.index.get_id(child_id)
+            if parent is None or child is None:
+                return
+            parent = self._own(parent)
+            position = None
+            if isinstance(parent, Function):
+                position = self._remove_id(parent, child_id)
+            child = self._current(child)
+            removed = remove_child(ChildDeletion(parent, child, position))
+            if removed is not None:
+                self.index.remove_subtree(removed)
+
+        elif op.kind == ROOT:
+            (encoded,) = op.data
+            self._observe_subtree(encoded)
+            node = self.index.get_id(op.target)
+            if node is None:
+                return
+            # Roots added concurrently over the same tree stack up in
+            # stamp order, the latest outermost
+            node = self._current(node)
+            while node.parent is not None:
+                parent = self._current(node.parent)
+                if parent.timestamp > encoded[3]:
+                    break
+                node = parent
+            node = self._own(node)
+            above = node.parent
+            root = decode_subtree(encoded, placeholder=node)
+            self._claim(root)
+            node.parent = root
+            root.parent = above
+            if above is None:
+                self._ast = root
+            else:
+                above._replace_child(node, root)
+                root.position = getattr(node, "position", None)
+                above.invalidate_hash()
+            self.index.add_subtree(root, skip=node)
+
+        elif op.kind == TOMBSTONE:
+            left, child_id, timestamp = op.data
+            parent = self.index.get_id(op.target)
+            if isinstance(parent, Function):
+                self._insert_id(parent, left, child_id, present=False)
+            elif isinstance(parent, Binary):
+                # The addition still wins over concurrent ones it would have
+                # won over
+                parent = self._own(parent)
+                self._claim_slot(parent, left, (timestamp, op.replica))
+
+        elif op.kind == SKIP:
+            pass
+
+        else:
+            raise Exception("Op kind not found")
+
+    def _observe_subtree(self, subtree: tuple):
+        for id_history, timestamp in subtree_ids(subtree):
+            for node_id in id_history:
+                observe_id(node_id)
+            self.clock.observe(timestamp)
+
+    def _claim_slot(self, parent: Binary, slot: str, stamp: tuple) -> bool:
+        """
+        Whether an addition stamped stamp goes into an operand of parent,
+        which it does unless a later addition went there already. The
+        operand it replaces is removed.
+
+        Concurrent replacements of one operand each delete the operand
+        first, and the addition with the latest stamp, then replica id,
+        wins on every replica. The stamp stays when the winner is deleted,
+        so that additions it beat do not come back.
+        """
+        key = (parent.id_history[0], slot)
+        latest = self._slots.get(key)
+        if latest is not None and stamp < latest:
+            return False
+        self._slots[key] = stamp
+        loser = getattr(parent, slot)
+        if loser is not None:
+            setattr(parent, slot, None)
+            parent.invalidate_hash()
+            self.index.remove_subtree(loser)
+        return True
+
+    def _sequence(self, parent: Function) -> Sequence:
+        # First ids of the arguments of parent in RGA order, along with
+        # whether they are still there. Kept from the first op on parent on,
+        # and copied before the first change after a fork.
+        key = parent.id_history[0]
+        sequence = self._sequences.get(key)
+        if sequence is None:
+            sequence = Sequence((arg.id_history[0], True) for arg in parent.arguments)
+        elif sequence._owner is not self._sequence_token:
+            sequence = sequence.copy()
+        else:
+            return sequence
+        sequence._owner = self._sequence_token
+        self._sequences[key] = sequence
+        return sequence
+
+    def _insert_id(self, parent: Function, left, key, present=True) -> int:
+        """
+        Puts an argument into the sequence of parent and returns the index
+        it takes among the arguments that are there.
+
+        It goes right after the left neighbour its author saw, past any
+        arguments inserted there concurrently with greater first ids. Those
+        were inserted by ops that saw fewer of the arguments around, so
+        every replica puts them in the same order. Deleted arguments stay
+        in the sequence, inserts next to them find their place all the
+        same.
+        """
+        return self._sequence(parent).insert(left, key, present)
+
+    def _remove_id(self, parent: Function, key) -> Optional[int]:
+        # Index the argument had among those that are there, if it was
+        return self._sequence(parent).remove(key)
+
+    def merge(self, other_changes: List[Change]) -> MergeResult:
+        # The changes to apply here, and those whose target is gone
+        return merge_indexed(self.index, other_changes, self.clock)
+
+    def merge_replicas(self, change_sets: List[List[Change]]) -> MergeResult:
+        # One convergent merge of the changes of replicas that started from
+        # this manager's tree, see crdt.merge.merge_many
+        return merge_many(self.index, change_sets, self.clock)
 
     def merge_changes(self, other_changes: List[Change]) -> List[Change]:
         if other_changes:
-            return merge_changes(self.ast, other_changes)
+            return self.merge(other_changes).changes
         else:
             return []
 
+    def digest(self) -> bytes:
+        # Equal on replicas whose trees agree, ids included, see
+        # crdt.digest for finding where they do not
+        return self._ast.digest()
+
     def __str__(self):
         return str(self.ast)
 
@@ -0,0 +1,161 @@
+"""
+Folding the changes a replica made before they are sent.
+
+A replica that edits offline piles up changes, often many about the
+same few nodes, and the replica that merges them goes through each one.
+coalesce folds the changes into fewer that take the other replica to
+the same tree:
+
+- Successive modifications of a node collapse to the last one.
+- A subtree that was added and deleted again cancels out.
+- Changes inside a subtree that was added earlier are absorbed by the
+  addition, and changes inside a subtree that is deleted later by the
+  deletion. Changes are applied in place, so an added subtree already
+  shows what was done to it since, and a deleted one is gone whatever
+  was done to it before.
+
+Merging the folded changes gives the same tree as merging all of them.
+What it does not give is the changes that were absorbed among the
+unresolved ones of the merge, as their nodes are not there to merge
+into.
+"""
+
+from collections import defaultdict
+from parser.nodes import BaseNode, Function
+from typing import Dict, List, Optional
+
+from ast_utils.change_classes import (
+    Change,
+    ChildAddition,
+    ChildDeletion,
+    NodeModification,
+    RootAddition,
+)
+
+
+def _target_id(change: Change):
+    # First id of the node a change applies to, as merge looks it up
+    match change:
+        case NodeModification():
+            return change.new_node.id_history[0]
+        case ChildAddition() | ChildDeletion():
+            return change.parent_node.id_history[0]
+        case RootAddition():
+            return change.child_node.id_history[0]
+        case _:
+            raise Exception(f"Unhandled change type: {type(change)}")
+
+
+def _subtree_ids(root: BaseNode, skip: Optional[BaseNode] = None):
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node is None or node is skip:
+            continue
+        yield node.id_history[0]
+        stack.extend(node.children())
+
+
+def coalesce(changes: List[Change]) -> List[Change]:
+    """
+    The changes, applied in this order on one replica, folded into fewer
+    with the same effect on a replica that merges them.
+
+    Changes that are kept are returned as they are, in their order, but
+    for those of a Function whose arguments lost an addition that was
+    cancelled. Positions of later additions took that argument into
+    account, so the deletions and additions of the Function are given
+    again in one place: deletions first, then additions at the position
+    their argument ends up in.
+    """
+    dropped = [False] * len(changes)
+    # Addition that brought in each node, by first id
+    added: Dict[object, int] = {}
+    # Addition of each subtree root, by first id
+    additions: Dict[object, int] = {}
+    last_modification: Dict[object, int] = {}
+    # Changes kept so far by the node they apply to
+    by_target: Dict[object, List[int]] = defaultdict(list)
+    cancelled = set()
+
+    for i, change in enumerate(changes):
+        key = _target_id(change)
+        if key in added:
+            # The addition carries it already
+            dropped[i] = True
+            continue
+
+        match change:
+            case NodeModification():
+                previous = last_modification.get(key)
+                if previous is not None:
+                    dropped[previous] = True
+                last_modification[key] = i
+
+            case ChildAddition():
+                for node_id in _subtree_ids(change.child_node):
+                    added[node_id] = i
+                additions[change.child_node.id_history[0]] = i
+
+            case ChildDeletion():
+                child_id = change.child_node.id_history[0]
+                addition = additions.pop(child_id, None)
+                if addition is not None:
+                    dropped[addition] = dropped[i] = True
+                    if isinstance(change.parent_node, Function):
+                        cancelled.add(key)
+                    continue
+                for node_id in _subtree_ids(change.child_node):
+                    last_modification.pop(node_id, None)
+                    for j in by_target.pop(node_id, ()):
+                        dropped[j] = True
+
+            case RootAddition():
+                for node_id in _subtree_ids(change.parent_node, change.child_node):
+                    added[node_id] = i
+
+        by_target[key].append(i)
+
+    kept = [change for i, change in enumerate(changes) if not dropped[i]]
+    if cancelled:
+        kept = _place_again(kept, cancelled)
+    return kept
+
+
+def _place_again(changes: List[Change], parents: set) -> List[Change]:
+    structural: Dict[object, List[Change]] = defaultdict(list)
+    for change in changes:
+        if isinstance(change, (ChildAddition, ChildDeletion)):
+            key = change.parent_node.id_history[0]
+            if key in parents:
+                structural[key].append(change)
+
+    placed = []
+    for change in changes:
+        if not isinstance(change, (ChildAddition, ChildDeletion)):
+            placed.append(change)
+            continue
+        key = change.parent_node.id_history[0]
+        group = structural.pop(key, None)
+        if key not in parents:
+            placed.append(change)
+        elif group is not None:
+            placed.extend(_regroup(group))
+    return placed
+
+
+def _regroup(group: List[Change]) -> List[Change]:
+    # The parent of the last change has the arguments as they end up
+    final = [arg.id_history[0] for arg in group[-1].parent_node.arguments]
+    index = {node_id: i for i, node_id in enumerate(final)}
+    deletions = [c for c in group if isinstance(c, ChildDeletion)]
+    additions = sorted(
+        (c for c in group if isinstance(c, ChildAddition)),
+        key=lambda c: index[c.child_node.id_history[0]],
+    )
+    placed = []
+    for change in additions:
+        i = index[change.child_node.id_history[0]]
+        left = final[i - 1] if i else change.parent_node.id_history[0]
+        placed.append(ChildAddition(change.parent_node, change.child_node, i, left))
+    return deletions + placed
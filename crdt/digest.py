@@ -0,0 +1,292 @@
+"""
+Merkle digests of a workbook, for replicas to find where they differ.
+
+A workbook is a mapping of sheet names to mappings of cell addresses to
+formulas, given as trees or as ASTManagers. Its digest tree has the
+workbook at the root and the sheets below it. Below each sheet is a
+trie over its cells, keyed by the hex digits of a hash of their
+address, and below each cell is the formula tree itself, whose nodes
+carry their own digests, see BaseNode.digest. Digests cover node ids
+and contents, so two replicas with the same root digest agree.
+
+find_divergence walks two digest trees down from the root. It only
+enters parts whose digests differ, and asks the other replica for one
+level at a time. The trie has O(log n) levels for n cells, so finding d
+divergent formulas takes O(d log n) requests.
+"""
+
+import hashlib
+from parser.nodes import DIGEST_SIZE, BaseNode
+from typing import Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+# Cells a trie bucket holds before it is split by the next hex digit
+BUCKET_SIZE = 16
+
+# Kinds of trie buckets
+SPLIT = "split"
+CELLS = "cells"
+
+
+def _hash(*parts: bytes) -> bytes:
+    h = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    for part in parts:
+        h.update(part)
+    return h.digest()
+
+
+def _named(name: str, digest: bytes) -> bytes:
+    # Digests have a fixed size, so the name is unambiguous
+    return _hash(name.encode(), digest)
+
+
+def address_key(address: str) -> str:
+    # Where a cell sits in the trie
+    return hashlib.blake2b(address.encode(), digest_size=8).hexdigest()
+
+
+class Divergence(NamedTuple):
+    sheet: str
+    # None for a sheet only one side has
+    address: Optional[str]
+    # First id of the smallest node found to differ, None when the whole
+    # formula does, e.g. when only one side has the cell
+    node_id: object
+
+
+class WorkbookDigest:
+    """
+    Digest tree of a workbook, a snapshot built in one pass over its cells.
+
+    Formula digests stay cached on the nodes, so building it again after
+    some edits only hashes the nodes that changed, and the trie. root is
+    what replicas compare first. The other methods answer the requests of
+    find_divergence, and are what a replica serves to its peers.
+    """
+
+    def __init__(self, sheets: Mapping[str, Mapping[str, object]]):
+        self._formulas: Dict[str, Dict[str, BaseNode]] = {}
+        self._buckets: Dict[Tuple[str, str], tuple] = {}
+        self._sheets: Dict[str, bytes] = {}
+        # Nodes of a formula by first id, built when they are asked for
+        self._nodes: Dict[Tuple[str, str], Dict[object, BaseNode]] = {}
+        for sheet, cells in sheets.items():
+            formulas = {
+                address: getattr(formula, "ast", formula)
+                for address, formula in cells.items()
+            }
+            self._formulas[sheet] = formulas
+            items = sorted(
+                (address_key(address), address, root.digest())
+                for address, root in formulas.items()
+            )
+            self._sheets[sheet] = self._build(sheet, "", items)
+        self.root = _hash(
+            b"workbook",
+            *(_named(sheet, digest) for sheet, digest in sorted(self._sheets.items())),
+        )
+
+    def _build(self, sheet: str, prefix: str, items: list) -> bytes:
+        # items are (key, address, digest) in key order. Whether a bucket
+        # is split only depends on the cells in it, so equal cells give
+        # equal digests on every replica.
+        depth = len(prefix)
+        if len(items) <= BUCKET_SIZE or depth == len(items[0][0]):
+            cells = {address: digest for _, address, digest in items}
+            self._buckets[(sheet, prefix)] = (CELLS, cells)
+            return _hash(
+                b"cells",
+                *(_named(address, digest) for address, digest in sorted(cells.items())),
+            )
+
+        children = {}
+        start = 0
+        while start < len(items):
+            digit = items[start][0][depth]
+            end = start
+            while end < len(items) and items[end][0][depth] == digit:
+                end += 1
+            children[digit] = self._build(sheet, prefix + digit, items[start:end])
+            start = end
+        self._buckets[(sheet, prefix)] = (SPLIT, children)
+        return _hash(
+            b"split",
+            *(_named(digit, digest) for digit, digest in sorted(children.items())),
+        )
+
+    def sheets(self) -> Dict[str, bytes]:
+        return dict(self._sheets)
+
+    def bucket(self, sheet: str, prefix: str) -> tuple:
+        """
+        (SPLIT, digests by next digit) or (CELLS, digests by address) for
+        the cells of sheet whose key starts with prefix.
+
+        The other replica may have split its trie further or less far
+        than this one, so any prefix is answered.
+        """
+        for depth in range(len(prefix), -1, -1):
+            found = self._buckets.get((sheet, prefix[:depth]))
+            if found is None:
+                continue
+            kind, entries = found
+            if depth == len(prefix):
+                return kind, dict(entries)
+            if kind == SPLIT:
+                # prefix goes through a digit no cell has
+                return CELLS, {}
+            return CELLS, {
+                address: digest
+                for address, digest in entries.items()
+                if address_key(address).startswith(prefix)
+            }
+        return CELLS, {}
+
+    def cells(self, sheet: str, prefix: str) -> Dict[str, bytes]:
+        # Digests of all cells of sheet whose key starts with prefix
+        found = {}
+        stack = [prefix]
+        while stack:
+            prefix = stack.pop()
+            kind, entries = self.bucket(sheet, prefix)
+            if kind == CELLS:
+                found.update(entries)
+            else:
+                stack.extend(prefix + digit for digit in entries)
+        return found
+
+    def node(self, sheet: str, address: str, node_id=None):
+        """
+        (first id, [(first id, digest) of each child]) of a node of the
+        formula at address, its root when node_id is None. None if there
+        is no such node. Empty Binary sides are (None, None).
+        """
+        root = self._formulas.get(sheet, {}).get(address)
+        if root is None:
+            return None
+        node = root
+        if node_id is not None:
+            key = (sheet, address)
+            if key not in self._nodes:
+                self._nodes[key] = _by_first_id(root)
+            node = self._nodes[key].get(node_id)
+            if node is None:
+                return None
+        return node.id_history[0], [_entry(child) for child in node.children()]
+
+    def formula(self, sheet: str, address: str) -> Optional[BaseNode]:
+        return self._formulas.get(sheet, {}).get(address)
+
+
+def _entry(child: Optional[BaseNode]) -> tuple:
+    if child is None:
+        return (None, None)
+    return (child.id_history[0], child.digest())
+
+
+def _by_first_id(root: BaseNode) -> Dict[object, BaseNode]:
+    nodes = {}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node is not None:
+            nodes[node.id_history[0]] = node
+            stack.extend(node.children())
+    return nodes
+
+
+def find_divergence(local: WorkbookDigest, remote) -> Tuple[List[Divergence], int]:
+    """
+    Where local and remote differ, and the number of requests made to
+    remote to find out.
+
+    remote answers the requests of WorkbookDigest, root included, e.g. a
+    proxy for another replica's digest. For cells on both sides the
+    smallest nodes that differ are reported. Those are nodes whose own
+    content or children changed, subtrees that were added or removed show
+    up as their parent.
+    """
+    requests = 1
+
+    def ask(method: str, *args):
+        nonlocal requests
+        requests += 1
+        return getattr(remote, method)(*args)
+
+    found: List[Divergence] = []
+    if remote.root == local.root:
+        return found, requests
+
+    theirs = ask("sheets")
+    mine = local.sheets()
+    for sheet in sorted(set(mine) | set(theirs)):
+        if mine.get(sheet) == theirs.get(sheet):
+            continue
+        if sheet not in mine or sheet not in theirs:
+            found.append(Divergence(sheet, None, None))
+            continue
+
+        addresses: Dict[str, bytes] = {}
+        stack = [""]
+        while stack:
+            prefix = stack.pop()
+            their_kind, their_entries = ask("bucket", sheet, prefix)
+            my_kind, my_entries = local.bucket(sheet, prefix)
+            if their_kind == SPLIT and my_kind == SPLIT:
+                for digit in sorted(set(my_entries) | set(their_entries)):
+                    if my_entries.get(digit) == their_entries.get(digit):
+                        continue
+                    if digit not in their_entries:
+                        # Cells only this side has
+                        for address in local.cells(sheet, prefix + digit):
+                            addresses[address] = None
+                    elif digit not in my_entries:
+                        for address in ask("cells", sheet, prefix + digit):
+                            addresses[address] = None
+                    else:
+                        stack.append(prefix + digit)
+                continue
+            if their_kind != CELLS:
+                their_entries = ask("cells", sheet, prefix)
+            if my_kind != CELLS:
+                my_entries = local.cells(sheet, prefix)
+            for address in set(my_entries) | set(their_entries):
+                if address not in my_entries or address not in their_entries:
+                    addresses[address] = None
+                elif my_entries[address] != their_entries[address]:
+                    addresses[address] = their_entries[address]
+
+        for address in sorted(addresses):
+            digest = addresses[address]
+            if digest is None:
+                found.append(Divergence(sheet, address, None))
+            else:
+                found.extend(_diverging_nodes(local, ask, sheet, address, digest))
+    return found, requests
+
+
+def _diverging_nodes(local: WorkbookDigest, ask, sheet, address, digest):
+    root = local.formula(sheet, address)
+    reply = ask("node", sheet, address)
+    if reply is None or reply[0] != root.id_history[0]:
+        return [Divergence(sheet, address, None)]
+
+    found = []
+    stack = [(root, digest, reply[1])]
+    while stack:
+        node, their_digest, their_children = stack.pop()
+        my_ids = [_entry(child)[0] for child in node.children()]
+        their_ids = [node_id for node_id, _ in their_children]
+        # Combining their children with this node's own content gives their
+        # digest unless the node itself changed
+        own = node.combine_digests(digest for _, digest in their_children)
+        if my_ids != their_ids or own != their_digest:
+            found.append(Divergence(sheet, address, node.id_history[0]))
+        theirs = {node_id: digest for node_id, digest in their_children}
+        for child in node.children():
+            if child is None:
+                continue
+            digest = theirs.get(child.id_history[0])
+            if digest is not None and digest != child.digest():
+                _, children = ask("node", sheet, address, child.id_history[0])
+                stack.append((child, digest, children))
+    return found
@@ -0,0 +1,115 @@
+"""
+Garbage collection of id histories and tombstones by causal stability.
+
+A node gains an id with every modification and an argument list keeps a
+tombstone for every argument deleted through ops, see
+ASTManager._insert_id. Neither is needed once the op that made it is
+causally stable, see OpLog.stable: every known replica has applied the
+op, so no op still to come can be concurrent with it.
+
+- The ids of a node up to the latest one a stable op gave it are dropped,
+  but for the first id, which the node is known by. The stable id stays
+  as the point replicas that dropped less compare from, see
+  crdt.utils.calculate_depth.
+- Tombstones of arguments whose deletion is stable are dropped, once
+  the argument after them is old enough, see drop_tombstones. Inserts
+  that name one as their left neighbour were made before the deletion
+  or concurrently with it, so they are here already.
+
+Replicas collect on their own, each as far as it knows the others have
+got, and collecting never changes what a formula reads.
+"""
+
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Set, Tuple
+
+from crdt.oplog import ADD, DELETE, MODIFY, ROOT, Op, subtree_ids
+
+
+class Collected(NamedTuple):
+    # Ids dropped from node histories
+    ids: int
+    # Tombstones dropped from argument sequences
+    tombstones: int
+
+
+def stable_ids(ops: List[Op]) -> Dict[object, Set[object]]:
+    # The ids that stable ops gave each node, by first id of the node
+    ids: Dict[object, Set[object]] = defaultdict(set)
+    for op in ops:
+        if op.kind == MODIFY:
+            ids[op.target].update(op.data[1])
+        elif op.kind in (ADD, ROOT):
+            for history, _ in subtree_ids(op.data[-1]):
+                ids[history[0]].add(history[-1])
+    return ids
+
+
+def stable_deletions(ops: List[Op]) -> Dict[object, Set[object]]:
+    # First ids of the arguments stable ops deleted, by first id of the parent
+    # A tombstone op is no help, it does not tell whether the deletion
+    # behind it is stable too
+    deleted: Dict[object, Set[object]] = defaultdict(set)
+    for op in ops:
+        if op.kind == DELETE:
+            deleted[op.target].add(op.data[0])
+    return deleted
+
+
+def truncate(history: list, stable: Set[object]) -> Tuple[list, list]:
+    """
+    history without the ids between its first id and the last one in
+    stable, and the ids left out.
+    """
+    cut = 0
+    for i in range(len(history) - 1, 0, -1):
+        if history[i] in stable:
+            cut = i
+            break
+    if cut <= 1:
+        return history, []
+    return [history[0]] + history[cut:], history[1:cut]
+
+
+def newest_id(ops: List[Op], newest=None):
+    # The greatest id the ops carry, or newest if that is greater. Every
+    # replica that applied them has observed their ids.
+    for op in ops:
+        ids = [op.target]
+        if op.kind == MODIFY:
+            ids.extend(op.data[1])
+        elif op.kind in (ADD, ROOT):
+            for history, _ in subtree_ids(op.data[-1]):
+                ids.extend(history)
+        elif op.kind == DELETE:
+            ids.append(op.data[0])
+        for node_id in ids:
+            if node_id is None:
+                continue
+            if newest is None or node_id > newest:
+                newest = node_id
+    return newest
+
+
+def drop_tombstones(sequence: tuple, deleted: Set[object], newest) -> Tuple[tuple, set]:
+    """
+    sequence without the tombstones of deleted that no insert still to
+    come can tell apart from their absence, and those left in.
+
+    Inserts skip the arguments after their left neighbour that have
+    greater first ids, see ASTManager._insert_id, and a tombstone stops
+    them like any argument. Every insert still to come has a first id
+    greater than newest, so a tombstone followed by an argument whose id
+    is not makes no difference, nor does one at the end.
+    """
+    kept = []
+    left_in = set()
+    following = None
+    for node_id, present in reversed(sequence):
+        if not present and node_id in deleted:
+            if following is None or following <= newest:
+                continue
+            left_in.add(node_id)
+        kept.append((node_id, present))
+        following = node_id
+    return tuple(reversed(kept)), left_in
@@ -1,78 +1,291 @@
-from parser.nodes import CellRange
+from functools import reduce
+from parser.clock import default_clock, timestamp_replica
+from parser.ids import observe_id
+from parser.nodes import BaseNode, Binary, CellRange
+from typing import Dict, List, NamedTuple, Optional
 
-from ast_utils.change_classes import ChildAddition, ChildDeletion, NodeModification, RootAddition
+from ast_utils.change_classes import (
+    Change,
+    ChildAddition,
+    ChildDeletion,
+    NodeModification,
+    RootAddition,
+)
 from ast_utils.custom_exceptions import NodeNotFoundError
+from ast_utils.index import NodeIndex
 from ast_utils.operations import find_node
-from crdt.utils import calculate_depth, conflict_resolution, merge_cell_ranges
+from crdt.coalesce import coalesce
+from crdt.utils import (
+    align_histories,
+    calculate_depth,
+    conflict_resolution,
+    merge_cell_ranges,
+)
 
 
-def merge_changes(original_ast, changes):
+class MergeResult(NamedTuple):
+    # changes are to be applied locally, unresolved are the incoming changes
+    # whose target node is no longer in the local tree
+    changes: List[Change]
+    unresolved: List[Change]
+
+
+def merge_changes(original_ast, changes, clock=None, index=None):
+    # Changes whose target is gone are left out, merge_indexed returns
+    # them as unresolved
     merged_changes = []
 
     for change in changes:
-        match change:
-            case NodeModification():
-                new_node = change.new_node
-                try:
-                    original_node = find_node(original_ast, new_node)
-                except NodeNotFoundError as e:
-                    print(f" Error: {e}")
-                    continue
-
-                # Special Case: CellRange
-                if isinstance(original_node, CellRange) and isinstance(
-                    new_node, CellRange
-                ):
-                    merged_range = merge_cell_ranges(original_node, new_node)
-                    modification = NodeModification(original_node, merged_range)
-                    merged_changes.append(modification)
-                    continue  # No further action needed
-
-                if handle_node_modification(original_node, new_node):
-                    change.original_node = original_node
-                    merged_changes.append(change)
-                else:
-                    continue  # No further action needed
-
-            case ChildAddition():
-                child_node = change.child_node
-                try:
-                    parent_node = find_node(original_ast, change.parent_node)
-                except NodeNotFoundError as e:
-                    print(f" Error: {e}")
-                    continue
-                addition = ChildAddition(parent_node, child_node)
-                merged_changes.append(addition)
-
-            case ChildDeletion():
-                child_node = change.child_node
-                try:
-                    parent_node = find_node(original_ast, change.parent_node)
-                except NodeNotFoundError as e:
-                    print(f" Error: {e}")
-                    continue
-                deletion = ChildDeletion(parent_node, child_node)
-                merged_changes.append(deletion)
-
-            case RootAddition():
-                try:
-                    child_node = find_node(original_ast, change.child_node)
-                except NodeNotFoundError as e:
-                    print(f" Error: {e}")
-                    continue
-
-                new_root = change.parent_node
-                direction = change.direction
-                addition = RootAddition(new_root, child_node, direction)
-                merged_changes.append(addition)
-
-            case _:
-                raise Exception(f"Unhandled change type: {type(change)}")
+        _observe_change(change, clock or default_clock)
+        target = _find(original_ast, _target(change), index)
+        if target is None:
+            continue
+        merged = _merge_change(change, target)
+        if merged is not None:
+            merged_changes.append(merged)
 
     # TODO: Handle root addition and deletion
     return merged_changes
 
 
+def merge_indexed(index: NodeIndex, changes: List[Change], clock=None) -> MergeResult:
+    """
+    Like merge_changes, in one pass over changes with every lookup a single
+    index access.
+
+    Changes are grouped by the node they target, which is looked up once
+    per group. The merged changes come out group by group, in the order
+    the groups first appear, and each group in its original order, so
+    additions to the same parent keep their positions. Nothing is printed,
+    changes whose target is gone are returned as unresolved.
+    """
+    clock = clock or default_clock
+    groups: Dict[object, List[Change]] = {}
+    for change in changes:
+        _observe_change(change, clock)
+        groups.setdefault(_target(change).id_history[0], []).append(change)
+
+    merged_changes, unresolved = [], []
+    for group in groups.values():
+        target = index.get(_target(group[0]))
+        if target is None:
+            unresolved.extend(group)
+            continue
+        for change in group:
+            merged = _merge_change(change, target)
+            if merged is not None:
+                merged_changes.append(merged)
+    return MergeResult(merged_changes, unresolved)
+
+
+def merge_many(
+    index: NodeIndex, change_sets: List[List[Change]], clock=None
+) -> MergeResult:
+    """
+    Merges the changes of k replicas in one pass over their union.
+
+    Every replica is assumed to have started from the tree index covers
+    and to have applied its own changes, so that they carry its stamps.
+    The changes of each replica are coalesced first, see crdt.coalesce,
+    so that only its net changes meet those of others. Changes are then
+    grouped by target node across all replicas, and each group is resolved
+    on its own, in a way that does not depend on the order of change_sets:
+
+    * Of concurrent modifications the latest stamp wins. Ranges changed by
+      several replicas become the range that covers all of them.
+    * A child deleted by several replicas is deleted once.
+    * Additions are placed by position and then stamp. Each is shifted past
+      those of other replicas placed at or before its position.
+    * Of several replacements of one operand of a Binary the latest wins,
+      the others are unresolved.
+    * Of several new roots over one node the latest wins, the others are
+      unresolved.
+
+    Applying the result to the common tree gives the converged tree, which
+    the replicas can fork from.
+    """
+    clock = clock or default_clock
+    groups: Dict[object, List[Change]] = {}
+    for changes in change_sets:
+        # An addition the same replica deleted again is no concurrent one
+        for change in coalesce(changes):
+            _observe_change(change, clock)
+            groups.setdefault(_target(change).id_history[0], []).append(change)
+
+    merged_changes, unresolved = [], []
+    for group in groups.values():
+        target = index.get(_target(group[0]))
+        if target is None:
+            unresolved.extend(group)
+            continue
+        _merge_group(index, group, target, merged_changes, unresolved)
+    return MergeResult(merged_changes, unresolved)
+
+
+def _stamp(node: BaseNode):
+    return (node.timestamp, node.tie_breaker_value())
+
+
+def _merge_group(index, group, target, merged_changes, unresolved):
+    modifications = [c for c in group if isinstance(c, NodeModification)]
+    if len(modifications) > 1 and isinstance(target, CellRange):
+        ranges = [c.new_node for c in modifications]
+        merged_changes.append(
+            NodeModification(target, reduce(merge_cell_ranges, ranges))
+        )
+    elif modifications:
+        winner = max(modifications, key=lambda c: _stamp(c.new_node))
+        merged = _merge_change(winner, target)
+        if merged is not None:
+            merged_changes.append(merged)
+
+    deleted = set()
+    for change in group:
+        if isinstance(change, ChildDeletion):
+            first_id = change.child_node.id_history[0]
+            if first_id not in deleted:
+                deleted.add(first_id)
+                # The local child, so that remove_child finds it by history
+                child = index.get(change.child_node) or change.child_node
+                merged_changes.append(ChildDeletion(target, child))
+
+    additions = [c for c in group if isinstance(c, ChildAddition)]
+    if isinstance(target, Binary):
+        _merge_operands(target, additions, merged_changes, unresolved)
+        additions = []
+    additions = sorted(
+        additions,
+        key=lambda c: (
+            c.position is None,
+            c.position or 0,
+            _stamp(c.child_node),
+        ),
+    )
+    placed = []
+    for change in additions:
+        replica = timestamp_replica(change.child_node.timestamp)
+        position = change.position
+        if position is not None:
+            position += sum(
+                1 for other, at in placed if other != replica and at <= position
+            )
+            placed.append((replica, change.position))
+        merged_changes.append(ChildAddition(target, change.child_node, position))
+
+    roots = [c for c in group if isinstance(c, RootAddition)]
+    if roots:
+        winner = max(roots, key=lambda c: _stamp(c.parent_node))
+        merged_changes.append(_merge_change(winner, target))
+        unresolved.extend(c for c in roots if c is not winner)
+
+
+def _merge_operands(target, additions, merged_changes, unresolved):
+    # Of the additions to one operand of a Binary, each replacing it, the
+    # latest wins and the others are unresolved
+    operands: Dict[str, List[ChildAddition]] = {}
+    for change in additions:
+        operands.setdefault(change.operand, []).append(change)
+    for operand in sorted(operands):
+        winner = max(operands[operand], key=lambda c: _stamp(c.child_node))
+        merged_changes.append(_merge_change(winner, target))
+        unresolved.extend(c for c in operands[operand] if c is not winner)
+
+
+def _target(change: Change) -> BaseNode:
+    # The node of the local tree that a change is applied to
+    match change:
+        case NodeModification():
+            return change.new_node
+        case ChildAddition() | ChildDeletion():
+            return change.parent_node
+        case RootAddition():
+            return change.child_node
+        case _:
+            raise Exception(f"Unhandled change type: {type(change)}")
+
+
+def _merge_change(change: Change, target: BaseNode) -> Optional[Change]:
+    # The local version of change, with target as the node it applies to,
+    # or None when there is nothing to do
+    match change:
+        case NodeModification():
+            new_node = change.new_node
+
+            # Special Case: CellRange, when both replicas changed it.
+            # A range that is unchanged here just takes the other edit.
+            if isinstance(target, CellRange) and isinstance(new_node, CellRange):
+                original, updated = align_histories(
+                    target.id_history, new_node.id_history
+                )
+                if updated[: len(original)] != original:
+                    merged_range = merge_cell_ranges(target, new_node)
+                    return NodeModification(target, merged_range)
+
+            if handle_node_modification(target, new_node):
+                # A new change, apply_changes rebinds the changes it is
+                # given and the incoming one may be merged elsewhere too
+                return NodeModification(target, new_node)
+            return None  # No further action needed
+
+        case ChildAddition():
+            return ChildAddition(
+                target,
+                change.child_node,
+                change.position,
+                change.left,
+                change.operand,
+            )
+
+        case ChildDeletion():
+            return ChildDeletion(target, change.child_node)
+
+        case RootAddition():
+            return RootAddition(change.parent_node, target, change.direction)
+
+        case _:
+            raise Exception(f"Unhandled change type: {type(change)}")
+
+
+def _find(original_ast, node, index):
+    # The matching node of original_ast, or None if it is no longer there
+    if index is not None:
+        found = index.get(node)
+    else:
+        try:
+            found = find_node(original_ast, node)
+        except NodeNotFoundError:
+            found = None
+    return found
+
+
+def _observe_change(change, clock):
+    # Moves the local id counter and clock past every id and timestamp the
+    # change carries, so that later local edits order after the merged ones.
+    # Only subtrees the change brings in are walked, of the other nodes it
+    # refers to the node itself is enough, which keeps merging linear in
+    # the size of the changes rather than of the tree.
+    brought, skip = None, None
+    if isinstance(change, ChildAddition):
+        brought = change.child_node
+    elif isinstance(change, RootAddition):
+        # The new root, but not the local tree below it
+        brought, skip = change.parent_node, change.child_node
+
+    for node in vars(change).values():
+        if isinstance(node, BaseNode) and node is not brought:
+            observe_id(node.id_history[-1])
+            clock.observe(node.timestamp)
+
+    stack = [brought]
+    while stack:
+        node = stack.pop()
+        if node is None or node is skip:
+            continue
+        observe_id(node.id_history[-1])
+        clock.observe(node.timestamp)
+        stack.extend(node.children())
+
+
 def handle_node_modification(original_node, new_node) -> bool:
     depth = calculate_depth(original_node.id_history, new_node.id_history)
 
@@ -0,0 +1,438 @@
+"""
+Operation log for replicas that share ops instead of live Change objects.
+
+Every local change is recorded as an Op: plain ints, strings and tuples
+that can be pickled or sent as JSON. An op is identified by the
+(replica, counter) pair of its author and carries the author's version
+vector, the number of ops of each replica it had applied. OpLog delivers
+received ops once they are causally ready and only once, and gives a
+peer exactly the ops its version vector lacks.
+
+The vectors that come with ops and syncs also tell a log how far the
+other replicas it knows of have got. Ops every one of them has applied
+are causally stable: any op still to come was made after them, which is
+what crdt.gc relies on.
+
+Nodes are referred to by their first id, subtrees travel with all their
+ids and stamps, so every replica ends up with the same ids and a later
+op finds the nodes it refers to anywhere.
+"""
+
+from collections import deque
+from parser.nodes import (
+    BaseNode,
+    Binary,
+    Cell,
+    CellRange,
+    Function,
+    Logical,
+    Name,
+    Number,
+    Unary,
+)
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# Op kinds
+MODIFY = "modify"
+ADD = "add"
+DELETE = "delete"
+ROOT = "root"
+# An addition whose subtree was deleted since, see compact
+TOMBSTONE = "tombstone"
+# Stands in for a run of ops a delta left out, see compact
+SKIP = "skip"
+
+# Stands in for the local subtree below a new root
+_CHILD = "child"
+
+
+class Op(NamedTuple):
+    replica: int
+    # A skip covers the counters from data[0] up to counter
+    counter: int
+    # Version vector of the author when it made the op, as sorted pairs.
+    # Replicas it knew of that had not made ops yet come with 0.
+    deps: Tuple[Tuple[int, int], ...]
+    kind: str
+    # First id of the node the op applies to
+    target: object
+    # MODIFY: (content, new ids, timestamp, user id)
+    # ADD: (first id of the left neighbour or None, subtree), the operand
+    # "left" or "right" in place of the neighbour for a Binary
+    # DELETE: (first id of the child,)
+    # ROOT: (new root with _CHILD in place of the target,)
+    # TOMBSTONE: (left neighbour or operand as in ADD, first id of the child,
+    # timestamp of the child)
+    # SKIP: (first counter,)
+    data: tuple
+
+
+def _first(op: Op) -> int:
+    return op.data[0] if op.kind == SKIP else op.counter
+
+
+class OpLog:
+    """
+    The ops a replica has applied, and those it holds back until they are
+    causally ready.
+
+    Ops are kept in a list per replica, in counter order, a skip filling
+    every slot it covers. Forks share the lists and copy one before they
+    append to it, as each log may have applied a different stand-in for
+    the same op. version tells how much of each list a log has applied.
+    """
+
+    def __init__(self, replica_id: int):
+        self.replica_id = replica_id
+        self.version: Dict[int, int] = {}
+        self._ops: Dict[int, List[Op]] = {}
+        # Replicas whose list is this log's own to append to
+        self._owned = set()
+        # Ops held back, by the (replica, counter) they wait for and by id
+        self._waiting: Dict[Tuple[int, int], Dict[Tuple[int, int], Op]] = {}
+        # Version vectors other replicas are known to have reached, each
+        # covered by this log's own version
+        self._peers: Dict[int, Dict[int, int]] = {}
+        # The stable vector as of the last call to newly_stable
+        self._collected: Dict[int, int] = {}
+
+    def fork(self, replica_id: int) -> "OpLog":
+        other = OpLog(replica_id)
+        other.version = dict(self.version)
+        other._ops = dict(self._ops)
+        other._peers = {replica: dict(known) for replica, known in self._peers.items()}
+        other._peers[self.replica_id] = dict(self.version)
+        other._collected = dict(self._collected)
+        self._peers[replica_id] = dict(self.version)
+        self._owned = set()
+        return other
+
+    def record(self, kind: str, target, data: tuple) -> Op:
+        # A new local op, applied already
+        deps = {replica: 0 for replica in self._peers}
+        deps.update(self.version)
+        op = Op(
+            self.replica_id,
+            self.version.get(self.replica_id, 0) + 1,
+            tuple(sorted(deps.items())),
+            kind,
+            target,
+            data,
+        )
+        self._append(op)
+        return op
+
+    def _append(self, op: Op):
+        ops = self._ops.get(op.replica)
+        if op.replica not in self._owned:
+            ops = list(ops[: self.version.get(op.replica, 0)]) if ops else []
+            self._ops[op.replica] = ops
+            self._owned.add(op.replica)
+        while len(ops) < op.counter:
+            ops.append(op)
+        self.version[op.replica] = op.counter
+
+    def has(self, op: Op) -> bool:
+        return self.version.get(op.replica, 0) >= op.counter
+
+    def _blocker(self, op: Op) -> Optional[Tuple[int, int]]:
+        # The first (replica, counter) that op waits for, None once its
+        # replica's earlier ops and all its dependencies are applied
+        if self.version.get(op.replica, 0) < _first(op) - 1:
+            return (op.replica, _first(op) - 1)
+        for replica, counter in op.deps:
+            if replica != op.replica and self.version.get(replica, 0) < counter:
+                return (replica, counter)
+        return None
+
+    def is_ready(self, op: Op) -> bool:
+        return not self.has(op) and self._blocker(op) is None
+
+    def deliver(self, ops: Iterable[Op], apply: Callable[[Op], None]) -> int:
+        """
+        Calls apply for every op that is new, in causal order, and holds
+        back those whose dependencies have not arrived yet. Returns the
+        number of ops applied.
+
+        Held back ops wait for one (replica, counter) at a time and are
+        looked at again once it is applied, so delivery takes time linear
+        in the number of ops whatever order they come in.
+        """
+        applied = 0
+        queue = deque(ops)
+        while queue:
+            op = queue.popleft()
+            if self.has(op):
+                continue
+            blocker = self._blocker(op)
+            if blocker is not None:
+                self._waiting.setdefault(blocker, {})[(op.replica, op.counter)] = op
+                continue
+            before = self.version.get(op.replica, 0)
+            apply(op)
+            self._append(op)
+            # Its author had applied what the op depends on
+            self._learn(op.replica, op.deps)
+            self._learn(op.replica, ((op.replica, op.counter),))
+            applied += 1
+            for counter in range(before + 1, op.counter + 1):
+                woken = self._waiting.pop((op.replica, counter), None)
+                if woken:
+                    queue.extend(woken.values())
+        return applied
+
+    def missing(self, version: Dict[int, int]) -> List[Op]:
+        # The ops applied here that a replica at version has not seen, in an
+        # order it can apply them in
+        ops = []
+        for replica, count in self.version.items():
+            for op in self._ops[replica][version.get(replica, 0) : count]:
+                # A skip fills several slots
+                if not ops or ops[-1] is not op:
+                    ops.append(op)
+        return sorted(ops, key=lambda op: sum(c for _, c in op.deps) + 1)
+
+    @property
+    def pending(self) -> int:
+        return sum(len(ops) for ops in self._waiting.values())
+
+    def _learn(self, replica: int, counts: Iterable[Tuple[int, int]]):
+        known = self._peers.setdefault(replica, {})
+        for other, counter in counts:
+            # Zeros are kept too, they tell of a replica
+            if counter > known.get(other, -1):
+                known[other] = counter
+
+    def observe(self, peers: Dict[int, Dict[int, int]]):
+        """
+        Takes in the version vectors another replica knows of, its own
+        among them, see peers.
+
+        Only those covered by this log's version are kept, a replica whose
+        ops have not all arrived here yet may still send ops made before
+        it reached that vector.
+        """
+        for replica, version in peers.items():
+            if replica == self.replica_id:
+                continue
+            if all(self.version.get(r, 0) >= c for r, c in version.items()):
+                self._learn(replica, version.items())
+
+    @property
+    def peers(self) -> Dict[int, Dict[int, int]]:
+        # The version vector of every replica this log knows of
+        peers = {replica: dict(version) for replica, version in self._peers.items()}
+        peers[self.replica_id] = dict(self.version)
+        return peers
+
+    def stable(self) -> Dict[int, int]:
+        """
+        The ops every known replica has applied, as a version vector.
+
+        Replicas are known from forks, from the ops they made and from
+        the vectors of other replicas that mention them. One that is known
+        but whose vector is not holds everything back.
+        """
+        vectors = [self.version] + list(self._peers.values())
+        known = {self.replica_id} | set(self._peers)
+        for version in vectors:
+            known.update(version)
+        if not known <= {self.replica_id} | set(self._peers):
+            return {}
+        stable = {}
+        for replica in self.version:
+            counter = min(version.get(replica, 0) for version in vectors)
+            if counter:
+                stable[replica] = counter
+        return stable
+
+    def newly_stable(self) -> List[Op]:
+        # The ops that became stable since the last call, in an order they
+        # can be applied in
+        stable = self.stable()
+        ops = []
+        for replica, counter in stable.items():
+            start = self._collected.get(replica, 0)
+            for op in self._ops[replica][start:counter]:
+                if not ops or ops[-1] is not op:
+                    ops.append(op)
+            self._collected[replica] = max(start, counter)
+        return sorted(ops, key=lambda op: sum(c for _, c in op.deps) + 1)
+
+
+def compact(ops: List[Op], is_live: Callable[[object], bool]) -> List[Op]:
+    """
+    Thins out ops a peer is missing, given in causal order, to a delta that
+    takes the peer to the same state.
+
+    is_live tells whether a node id is in the sender's tree. The sender
+    has applied every op in ops, so a node that is gone there is gone on
+    the peer too once it has received them. Ops left out become skips,
+    one per run of counters of a replica. The receiver passes the delta on
+    as it got it, so every op left out is one whose effect any replica
+    gets from the ops kept.
+
+    - Modifications of nodes that are gone are left out, of the others
+      only the latest one by stamp is kept, carrying the ids of all.
+    - Additions under a parent that is gone are left out. Subtrees that
+      were added and are gone again turn into tombstones, which keep
+      their place among the arguments for concurrent inserts next to
+      them.
+    - Deletions from a parent that is gone are left out.
+    """
+    latest: Dict[object, Op] = {}
+    new_ids: Dict[object, list] = {}
+    for op in ops:
+        if op.kind == MODIFY and is_live(op.target):
+            best = latest.get(op.target)
+            if best is None or op.data[2] > best.data[2]:
+                latest[op.target] = op
+            new_ids.setdefault(op.target, []).extend(op.data[1])
+
+    delta: List[Op] = []
+    # Index in delta of the skip each replica's last left out op went to
+    runs: Dict[int, int] = {}
+    for op in ops:
+        kept = op
+        if op.kind == MODIFY:
+            if latest.get(op.target) is not op:
+                kept = None
+            else:
+                content, _, timestamp, user_id = op.data
+                ids = tuple(new_ids[op.target])
+                kept = op._replace(data=(content, ids, timestamp, user_id))
+        elif op.kind in (ADD, DELETE, TOMBSTONE) and not is_live(op.target):
+            kept = None
+        elif op.kind == ADD and not is_live(op.data[1][2][0]):
+            left, subtree = op.data
+            data = (left, subtree[2][0], subtree[3])
+            kept = op._replace(kind=TOMBSTONE, data=data)
+
+        if kept is not None:
+            runs.pop(op.replica, None)
+            delta.append(kept)
+            continue
+        run = runs.get(op.replica)
+        if run is not None and delta[run].counter == _first(op) - 1:
+            delta[run] = delta[run]._replace(counter=op.counter)
+        else:
+            runs[op.replica] = len(delta)
+            delta.append(Op(op.replica, op.counter, (), SKIP, None, (_first(op),)))
+    return delta
+
+
+def encode_subtree(root: BaseNode, placeholder: Optional[BaseNode] = None) -> tuple:
+    # (type name, content, id history, timestamp, user id, children), built
+    # with a stack rather than recursion, formulas nest deeper than the
+    # recursion limit
+    encoded: list = []
+    stack = [(root, None)]
+    while stack:
+        node, children = stack.pop()
+        if node is None:
+            encoded.append(None)
+        elif node is placeholder:
+            encoded.append(_CHILD)
+        elif children is None:
+            children = node.children()
+            stack.append((node, children))
+            stack.extend((child, None) for child in reversed(children))
+        else:
+            start = len(encoded) - len(children)
+            encoded[start:] = [
+                (
+                    type(node).__name__,
+                    node._content_key(),
+                    tuple(node.id_history),
+                    node.timestamp,
+                    node.user_id,
+                    tuple(encoded[start:]),
+                )
+            ]
+    return encoded[0]
+
+
+def decode_subtree(data: tuple, placeholder: Optional[BaseNode] = None) -> BaseNode:
+    # The inverse of encode_subtree, with a stack too
+    decoded: list = []
+    stack = [(data, False)]
+    while stack:
+        data, expanded = stack.pop()
+        if data is None:
+            decoded.append(None)
+        elif data == _CHILD:
+            decoded.append(placeholder)
+        elif not expanded:
+            stack.append((data, True))
+            stack.extend((child, False) for child in reversed(data[5]))
+        else:
+            start = len(decoded) - len(data[5])
+            decoded[start:] = [_decode_node(data, decoded[start:])]
+    return decoded[0]
+
+
+def _decode_node(data: tuple, children: list) -> BaseNode:
+    # Fields are set one by one, like BaseNode._copy does, as the node
+    # comes with its ids and the constructors would draw a new one
+    name, content, id_history, timestamp, user_id, _ = data
+    node = object.__new__(_NODES[name])
+    node.id_history = list(id_history)
+    node.user_id = user_id
+    node.timestamp = timestamp
+    node.parent = None
+    node._hash = None
+    node._digest = None
+    node._owner = None
+    set_content(node, content)
+    match node:
+        case Function():
+            node.arguments = children
+            for i, child in enumerate(children):
+                child.position = i
+        case Binary():
+            node.left, node.right = children
+        case Unary():
+            (node.expr,) = children
+    for child in children:
+        # None for an empty Binary side
+        if child is not None:
+            child.parent = node
+    return node
+
+
+_NODES = {
+    cls.__name__: cls
+    for cls in (Function, Binary, Unary, Cell, CellRange, Name, Number, Logical)
+}
+
+
+def set_content(node: BaseNode, content: tuple):
+    # The inverse of _content_key
+    match node:
+        case Function():
+            (node.func_name,) = content
+        case Binary() | Unary():
+            (node.op,) = content
+        case Cell():
+            node.col, node.row = content
+        case CellRange():
+            node.start = Cell(content[0], content[1], node.user_id)
+            node.end = Cell(content[2], content[3], node.user_id)
+        case Name():
+            (node.name,) = content
+        case Number() | Logical():
+            (node.value,) = content
+        case _:
+            raise Exception("Node type to modify not found")
+
+
+def subtree_ids(data: tuple):
+    # Every id and stamp of an encoded subtree
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if node is None or node == _CHILD:
+            continue
+        _, _, id_history, timestamp, _, children = node
+        yield id_history, timestamp
+        stack.extend(children)
@@ -0,0 +1,213 @@
+"""
+Argument order of a Function as a sequence CRDT, see ASTManager._insert_id.
+
+The sequence holds the first ids of the arguments in RGA order, those
+that were deleted included as tombstones. It is kept in a treap ordered
+by place in the sequence, each entry counting the entries and the
+arguments still there below it, and entries are found by id through a
+dict. Finding where an id is, inserting next to one and deleting one
+then take O(log n) however wide the Function is, where the arguments
+list itself is only touched at the index found.
+"""
+
+import random
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+_priorities = random.Random(0)
+
+
+class _Entry:
+    __slots__ = (
+        "key",
+        "present",
+        "priority",
+        "left",
+        "right",
+        "parent",
+        "size",
+        "count",
+    )
+
+    def __init__(self, key, present: bool):
+        self.key = key
+        self.present = present
+        self.priority = _priorities.random()
+        self.left: Optional["_Entry"] = None
+        self.right: Optional["_Entry"] = None
+        self.parent: Optional["_Entry"] = None
+        self.size = 1
+        self.count = int(present)
+
+
+def _size(entry: Optional[_Entry]) -> int:
+    return entry.size if entry is not None else 0
+
+
+def _count(entry: Optional[_Entry]) -> int:
+    return entry.count if entry is not None else 0
+
+
+def _pull(entry: _Entry) -> _Entry:
+    # Sizes and counts of entry from those of its children
+    entry.size = 1 + _size(entry.left) + _size(entry.right)
+    entry.count = int(entry.present) + _count(entry.left) + _count(entry.right)
+    for child in (entry.left, entry.right):
+        if child is not None:
+            child.parent = entry
+    return entry
+
+
+def _split(entry: Optional[_Entry], i: int):
+    # The first i entries under entry, and the rest
+    if entry is None:
+        return None, None
+    if i <= _size(entry.left):
+        first, rest = _split(entry.left, i)
+        entry.left = rest
+        if first is not None:
+            first.parent = None
+        return first, _pull(entry)
+    first, rest = _split(entry.right, i - _size(entry.left) - 1)
+    entry.right = first
+    if rest is not None:
+        rest.parent = None
+    return _pull(entry), rest
+
+
+def _join(first: Optional[_Entry], rest: Optional[_Entry]) -> Optional[_Entry]:
+    if first is None:
+        return rest
+    if rest is None:
+        return first
+    if first.priority > rest.priority:
+        first.right = _join(first.right, rest)
+        return _pull(first)
+    rest.left = _join(first, rest.left)
+    return _pull(rest)
+
+
+class Sequence:
+    """
+    Ids in order, each either there or a tombstone.
+
+    Iterating gives (id, present) pairs, like the tuples the sequence
+    starts from.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[object, bool]] = ()):
+        self._entries: Dict[object, _Entry] = {}
+        self._root = self._build(entries)
+        # Token of the replica that may change it in place, forks share
+        # sequences until they change them like they share nodes
+        self._owner = None
+
+    def _build(self, entries) -> Optional[_Entry]:
+        # Treap of entries in order in O(n), the right spine kept on a stack
+        spine = []
+        for key, present in entries:
+            entry = _Entry(key, present)
+            self._entries[key] = entry
+            last = None
+            while spine and spine[-1].priority < entry.priority:
+                last = _pull(spine.pop())
+            entry.left = last
+            if spine:
+                spine[-1].right = entry
+            spine.append(entry)
+        while spine:
+            root = _pull(spine.pop())
+        if self._entries:
+            root.parent = None
+            return root
+        return None
+
+    def __len__(self) -> int:
+        return _size(self._root)
+
+    def __contains__(self, key) -> bool:
+        return key in self._entries
+
+    def __iter__(self) -> Iterator[Tuple[object, bool]]:
+        stack, entry = [], self._root
+        while stack or entry is not None:
+            while entry is not None:
+                stack.append(entry)
+                entry = entry.left
+            entry = stack.pop()
+            yield entry.key, entry.present
+            entry = entry.right
+
+    def copy(self) -> "Sequence":
+        return Sequence(iter(self))
+
+    def present(self) -> int:
+        # How many of the ids are not tombstones
+        return _count(self._root)
+
+    def _rank(self, entry: _Entry) -> Tuple[int, int]:
+        # Entries before entry, and how many of them are present
+        rank, count = _size(entry.left), _count(entry.left)
+        while entry.parent is not None:
+            parent = entry.parent
+            if entry is parent.right:
+                rank += _size(parent.left) + 1
+                count += _count(parent.left) + int(parent.present)
+            entry = parent
+        return rank, count
+
+    def _at(self, i: int) -> _Entry:
+        entry = self._root
+        while True:
+            left = _size(entry.left)
+            if i < left:
+                entry = entry.left
+            elif i == left:
+                return entry
+            else:
+                i -= left + 1
+                entry = entry.right
+
+    def index(self, key) -> Optional[int]:
+        # Index among the ids that are present, None for tombstones and
+        # ids that are not in the sequence
+        entry = self._entries.get(key)
+        if entry is None or not entry.present:
+            return None
+        return self._rank(entry)[1]
+
+    def insert(self, left, key, present: bool = True) -> int:
+        """
+        Puts key right after left, or first when left is None, past the
+        ids there that are greater than key. Returns the index it takes
+        among the ids that are present.
+
+        An id already in the sequence stays where it is.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            return self._rank(entry)[1]
+        i = 0
+        if left is not None:
+            anchor = self._entries.get(left)
+            i = self._rank(anchor)[0] + 1 if anchor is not None else len(self)
+        while i < len(self) and self._at(i).key > key:
+            i += 1
+        entry = _Entry(key, present)
+        self._entries[key] = entry
+        first, rest = _split(self._root, i)
+        self._root = _join(_join(first, entry), rest)
+        self._root.parent = None
+        return self._rank(entry)[1]
+
+    def remove(self, key) -> Optional[int]:
+        # Turns key into a tombstone and returns the index it had among the
+        # ids that are present, None if it was not there
+        index = self.index(key)
+        if index is None:
+            return None
+        entry = self._entries[key]
+        entry.present = False
+        while entry is not None:
+            entry.count -= 1
+            entry = entry.parent
+        return index
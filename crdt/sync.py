@@ -0,0 +1,48 @@
+"""
+Delta-state anti-entropy between two replicas.
+
+A replica sums up its state in its version vector, one counter per
+replica it has heard of. Given the vector of a peer it computes the
+delta the peer lacks, the compacted ops past that vector, and the peer
+merges it idempotently. A round costs messages and work in proportion
+to what changed since the replicas last met, not to the size of their
+trees, and repeating it changes nothing.
+
+Along with each delta goes the sender's view of how far the replicas it
+knows of have got, which lets both sides collect garbage, see crdt.gc.
+"""
+
+from typing import List, NamedTuple
+
+from crdt.ast_manager import ASTManager
+from crdt.oplog import Op
+
+
+class SyncResult(NamedTuple):
+    # Ops in the delta each side sent
+    sent: int
+    received: int
+
+
+def exchange(sender: ASTManager, receiver: ASTManager) -> List[Op]:
+    # One direction: the receiver's vector goes out, the delta comes back
+    delta = sender.delta_since(receiver.version_vector)
+    receiver.receive(delta, sender.peers)
+    return delta
+
+
+def sync(first: ASTManager, second: ASTManager) -> SyncResult:
+    """
+    Brings two replicas to the same state in one round trip.
+
+    first sends its version vector, second answers with the delta first
+    lacks and its own vector, first replies with the delta second lacks.
+    """
+    vector = first.version_vector
+    to_first = second.delta_since(vector)
+    second_peers = second.peers
+    to_second = first.delta_since(second.version_vector)
+    first_peers = first.peers
+    first.receive(to_first, second_peers)
+    second.receive(to_second, first_peers)
+    return SyncResult(len(to_second), len(to_first))
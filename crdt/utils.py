@@ -2,22 +2,20 @@ from parser.nodes import Cell, CellRange
 
 
 def conflict_resolution(original_node, updated_node) -> bool:
-    # compare timestamps
-    if original_node.timestamp > updated_node.timestamp:
-        # original_node commited later
-        return True
-    elif original_node.timestamp < updated_node.timestamp:
-        # updated_node is more recent
-        return False
-    # timestamps are equal
-    else:
-        if original_node.tie_breaker_value() > updated_node.tie_breaker_value():
-            return True
-        else:
-            return False
+    # Hybrid logical clock stamps are unique per replica, so they only tie
+    # for nodes that were never edited
+    if original_node.timestamp != updated_node.timestamp:
+        # True when original_node was committed later
+        return original_node.timestamp > updated_node.timestamp
+    return original_node.tie_breaker_value() > updated_node.tie_breaker_value()
 
 
 def calculate_depth(original_history, updated_history):
+    # Replicas drop the stable ids after the first one, see crdt.gc, not
+    # all as far. Histories are compared from the later stable id then.
+    original_history, updated_history = align_histories(
+        original_history, updated_history
+    )
     last_common_index = -1
     for i in range(min(len(original_history), len(updated_history))):
         if original_history[i] == updated_history[i]:
@@ -31,6 +29,30 @@ def calculate_depth(original_history, updated_history):
     return -1  # No common history found
 
 
+def align_histories(original_history, updated_history):
+    # Both histories from the later of their second ids, when one has it
+    if (
+        len(original_history) < 2
+        or len(updated_history) < 2
+        or original_history[0] != updated_history[0]
+        or original_history[1] == updated_history[1]
+    ):
+        return original_history, updated_history
+    for first, second in (
+        (original_history, updated_history),
+        (updated_history, original_history),
+    ):
+        try:
+            i = first.index(second[1], 2)
+        except ValueError:
+            continue
+        aligned = [first[0]] + first[i:]
+        if first is original_history:
+            return aligned, updated_history
+        return original_history, aligned
+    return original_history, updated_history
+
+
 def merge_cell_ranges(node1, node2) -> CellRange:
     # Local function to convert column name to number
     def col_name_to_number(col):
@@ -1,5 +1,4 @@
 import tkinter as tk
-from copy import deepcopy
 from crdt.ast_manager import ASTManager
 from parser.parser import parse
 from tkinter import font as tkfont  # import the font module
@@ -56,9 +55,10 @@ def process_and_merge_asts(original_ast_str, user1_ast_str, user2_ast_str):
     # Parse the original AST once, important for id_history
     original_ast = parse(original_ast_str)
 
-    # Initialize AST managers with deep copies of the original AST
-    user1_ast_manager = ASTManager(deepcopy(original_ast))
-    user2_ast_manager = ASTManager(deepcopy(original_ast))
+    # Initialize AST managers, the second one forked from the first so
+    # that both share the original nodes until they change them
+    user1_ast_manager = ASTManager(original_ast)
+    user2_ast_manager = user1_ast_manager.fork()
 
     # Create changes
     user1_changes = user1_ast_manager.get_changes_to(user1_ast_str)
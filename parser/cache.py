@@ -0,0 +1,67 @@
+from collections import OrderedDict
+from parser.nodes import BaseNode
+from typing import Callable, NamedTuple
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+def normalize_formula(code: str) -> str:
+    # Whitespace never changes the meaning of a formula, apart from
+    # separating tokens, so runs of it collapse to a single space
+    return " ".join(code.split())
+
+
+class ParseCache:
+    """
+    Bounded LRU cache from formula text to a parsed template AST.
+
+    Templates never leave the cache. Every lookup returns a fresh clone with
+    new node ids, so two cells holding the same formula never share nodes
+    and keep separate CRDT identities. A maxsize of 0 disables caching.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._templates: OrderedDict[str, BaseNode] = OrderedDict()
+
+    def get(self, code: str, parse_fn: Callable[[str], BaseNode]) -> BaseNode:
+        if self.maxsize <= 0:
+            self.misses += 1
+            return parse_fn(code)
+
+        key = normalize_formula(code)
+        template = self._templates.get(key)
+        if template is not None:
+            self.hits += 1
+            self._templates.move_to_end(key)
+            return template.clone()
+
+        # Parse errors propagate and are not cached
+        self.misses += 1
+        template = parse_fn(code)
+        # Clones copy the cached structural hashes along with the nodes
+        template.structural_hash()
+        self._templates[key] = template
+        if len(self._templates) > self.maxsize:
+            self._templates.popitem(last=False)
+        return template.clone()
+
+    def resize(self, maxsize: int):
+        self.maxsize = maxsize
+        while len(self._templates) > max(maxsize, 0):
+            self._templates.popitem(last=False)
+
+    def clear(self):
+        self._templates.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._templates))
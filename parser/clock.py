@@ -0,0 +1,67 @@
+import os
+import time
+from parser.ids import REPLICA_BITS, random_replica_id
+
+# A stamp is ((wall clock milliseconds << LOGICAL_BITS) | logical) << REPLICA_BITS
+# | replica, so comparing two stamps compares the hybrid time first and
+# breaks ties between replicas by replica id
+LOGICAL_BITS = 16
+_REPLICA_MASK = (1 << REPLICA_BITS) - 1
+
+# Stamp of nodes that were parsed but never edited. It orders before every
+# clock reading and, being a small int, costs no allocation per node.
+UNSTAMPED = 0
+
+
+class HybridLogicalClock:
+    """
+    Hybrid logical clock of one replica, producing int timestamps.
+
+    Stamps follow the wall clock where it moves forward and a logical
+    counter where it does not, so they never repeat or go back on one
+    replica. observe() takes in stamps from other replicas, so anything
+    stamped afterwards orders after them even if their clocks run ahead.
+    """
+
+    def __init__(self, replica_id=None, wall_ns=time.time_ns):
+        if replica_id is None:
+            replica_id = random_replica_id()
+        if not 0 <= replica_id <= _REPLICA_MASK:
+            raise ValueError(f"Replica id must fit in {REPLICA_BITS} bits")
+        self.replica_id = replica_id
+        self._wall_ns = wall_ns
+        # Hybrid time of the last stamp, without the replica bits
+        self.last = 0
+
+    def now(self):
+        physical = (self._wall_ns() // 1_000_000) << LOGICAL_BITS
+        last = self.last + 1
+        if physical > last:
+            last = physical
+        self.last = last
+        return (last << REPLICA_BITS) | self.replica_id
+
+    def observe(self, timestamp):
+        if isinstance(timestamp, int):
+            self.last = max(self.last, timestamp >> REPLICA_BITS)
+
+
+def timestamp_replica(timestamp):
+    return timestamp & _REPLICA_MASK
+
+
+def timestamp_millis(timestamp):
+    return timestamp >> (REPLICA_BITS + LOGICAL_BITS)
+
+
+# Clock of this process, used wherever no replica clock is passed in
+default_clock = HybridLogicalClock()
+
+
+def _reseed_after_fork():
+    # A forked process is a replica of its own, see parser.ids
+    default_clock.replica_id = random_replica_id()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reseed_after_fork)
@@ -0,0 +1,88 @@
+import os
+import uuid
+
+# Low bits of a packed id hold the replica, the bits above it the counter
+REPLICA_BITS = 32
+_REPLICA_MASK = (1 << REPLICA_BITS) - 1
+
+
+def random_replica_id():
+    # os.urandom rather than random, whose state is copied into forked workers
+    return int.from_bytes(os.urandom(REPLICA_BITS // 8), "big")
+
+
+class LamportIds:
+    """
+    Node ids made of a (replica, counter) pair packed into one int.
+
+    Ids are unique as long as replica ids are, and compare as integers in
+    Lamport order: by counter first and by replica on ties. observe() moves
+    the counter past ids received from other replicas, so ids created after
+    a merge sort after everything that was merged.
+    """
+
+    def __init__(self, replica_id=None):
+        if replica_id is None:
+            replica_id = random_replica_id()
+        if not 0 <= replica_id <= _REPLICA_MASK:
+            raise ValueError(f"Replica id must fit in {REPLICA_BITS} bits")
+        self.replica_id = replica_id
+        self.counter = 0
+
+    def new_id(self):
+        self.counter += 1
+        return (self.counter << REPLICA_BITS) | self.replica_id
+
+    def observe(self, node_id):
+        if isinstance(node_id, int):
+            self.counter = max(self.counter, node_id >> REPLICA_BITS)
+
+
+class UuidIds:
+    # The previous scheme, random uuid4 strings without any ordering
+
+    def new_id(self):
+        return str(uuid.uuid4())
+
+    def observe(self, node_id):
+        pass
+
+
+def id_replica(node_id):
+    return node_id & _REPLICA_MASK
+
+
+def id_counter(node_id):
+    return node_id >> REPLICA_BITS
+
+
+_id_scheme = LamportIds()
+
+
+def new_id():
+    return _id_scheme.new_id()
+
+
+def observe_id(node_id):
+    _id_scheme.observe(node_id)
+
+
+def get_id_scheme():
+    return _id_scheme
+
+
+def set_id_scheme(scheme):
+    # Any object with new_id() and observe(node_id) methods
+    global _id_scheme
+    _id_scheme = scheme
+
+
+def _reseed_after_fork():
+    # A forked worker, e.g. one of parse_many's, must not hand out the same
+    # ids as its parent, so it continues as a replica of its own
+    if isinstance(_id_scheme, LamportIds):
+        set_id_scheme(LamportIds())
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reseed_after_fork)
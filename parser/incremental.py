@@ -0,0 +1,94 @@
+from parser.nodes import BaseNode, Binary, Function, Unary
+from parser.parser import FormulaParseError, parse
+from typing import Dict, NamedTuple, Optional, Tuple
+
+
+class Reparse(NamedTuple):
+    # node is the smallest subtree of the previous AST that had to be parsed
+    # again, parent its parent in that AST (None for the root), and subtree
+    # what its edited text parses to
+    node: BaseNode
+    parent: Optional[BaseNode]
+    subtree: BaseNode
+
+
+def formula_spans(root: BaseNode) -> Tuple[str, Dict[BaseNode, Tuple[int, int]]]:
+    # Serializes the AST like str() does and records the [start, end) offsets
+    # of every node in the resulting text
+    text = []
+    length = 0
+    spans = {}
+    stack = [root]
+    while stack:
+        part = stack.pop()
+        if isinstance(part, tuple):
+            node, start = part
+            spans[node] = (start, length)
+        elif isinstance(part, str) or part is None:
+            part = str(part)
+            text.append(part)
+            length += len(part)
+        else:
+            stack.append((part, length))
+            stack.extend(reversed(part._str_parts()))
+    return "".join(text), spans
+
+
+def _fits(node: BaseNode, parent: Optional[BaseNode], subtree: BaseNode) -> bool:
+    # Whether subtree can take the place of node without changing how the
+    # text around it parses
+    if parent is None or isinstance(parent, Function):
+        # Whole formulas and function arguments are complete expressions
+        return True
+    if isinstance(subtree, (Binary, Unary)):
+        # Operators could bind differently next to the surrounding ones
+        return False
+    # A re-typed Unary operand is not something compare_asts can express
+    return not isinstance(parent, Unary) or type(node) == type(subtree)
+
+
+def reparse(
+    ast: BaseNode, offset: int, deleted_length: int, inserted_text: str
+) -> Reparse:
+    """
+    Re-parse only the part of a formula that a text edit touches.
+
+    The edit replaces deleted_length characters at offset of str(ast) with
+    inserted_text. The smallest node whose text contains the edit is parsed
+    again with the edit applied. If its new text does not parse on its own,
+    or could bind differently with the surrounding operators, the enclosing
+    node is tried next, up to the whole formula. Nodes outside the returned
+    node are untouched, so they keep their identity and id_history.
+    """
+    text, spans = formula_spans(ast)
+    edit_end = offset + deleted_length
+    if offset < 0 or deleted_length < 0 or edit_end > len(text):
+        raise ValueError(f"Edit {offset}:{edit_end} is outside of the formula")
+
+    # Path down to the deepest node whose span contains the edited region
+    path = [ast]
+    descended = True
+    while descended:
+        descended = False
+        for child in path[-1].children():
+            if child is None:
+                continue
+            start, end = spans[child]
+            if start <= offset and edit_end <= end:
+                path.append(child)
+                descended = True
+                break
+
+    while True:
+        node = path.pop()
+        parent = path[-1] if path else None
+        start, end = spans[node]
+        new_text = text[start:offset] + inserted_text + text[edit_end:end]
+        try:
+            subtree = parse(new_text)
+        except FormulaParseError:
+            if parent is None:
+                raise
+        else:
+            if _fits(node, parent, subtree):
+                return Reparse(node, parent, subtree)
@@ -1,23 +1,77 @@
-import datetime
-import uuid
+import hashlib
+from parser.clock import UNSTAMPED, default_clock
+from parser.ids import new_id
+
+# Bytes in a node digest, and what stands in for an empty Binary side
+DIGEST_SIZE = 16
+_NO_CHILD = bytes(DIGEST_SIZE)
 
 
 class BaseNode:
-    def __init__(self, node_content, user_id):
-        self.id_history = [str(uuid.uuid4())]
-        self.node_content = node_content
+    # Nodes are kept resident by the million, so they carry no __dict__.
+    # node_content and node_type are derived from the other fields on access.
+    # position is only set on Function arguments. _owner is the token of
+    # the ASTManager that may change the node in place, see ASTManager.fork.
+    __slots__ = (
+        "id_history",
+        "user_id",
+        "timestamp",
+        "parent",
+        "position",
+        "_hash",
+        "_digest",
+        "_owner",
+    )
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Fields that a copy takes over from its original, collected once
+        cls._copied_slots = tuple(
+            name
+            for klass in reversed(cls.__mro__[:-1])
+            for name in klass.__dict__.get("__slots__", ())
+            if name not in ("id_history", "timestamp", "parent", "_owner")
+        )
+        cls._pickled_slots = tuple(
+            name
+            for klass in reversed(cls.__mro__[:-1])
+            for name in klass.__dict__.get("__slots__", ())
+            if name not in ("_hash", "_owner")
+        )
+
+    def __init__(self, user_id):
+        self.id_history = [new_id()]
         self.user_id = user_id
-        self.timestamp = datetime.datetime.now()
+        # Parsed nodes are stamped when they are first edited
+        self.timestamp = UNSTAMPED
         self.parent = None
-        self.node_type = self.__class__.__name__
+        self._hash = None
+        self._digest = None
+        self._owner = None
+
+    def __getstate__(self):
+        # Cached hashes depend on the str hash seed of the process that
+        # computed them, so they are left behind by pickle and deepcopy,
+        # and copies are not owned by anyone yet
+        state = {"_hash": None, "_owner": None}
+        for name in self._pickled_slots:
+            try:
+                state[name] = getattr(self, name)
+            except AttributeError:
+                pass
+        return None, state
+
+    @property
+    def node_type(self):
+        return self.__class__.__name__
 
     def generate_new_id(self):
-        new_id = str(uuid.uuid4())
-        self.id_history.append(new_id)
+        self.id_history.append(new_id())
 
-    def refresh_node(self, user_id):
+    def refresh_node(self, user_id, clock=None):
+        # Edits are stamped by the editing replica's clock
         self.generate_new_id()
-        self.timestamp = datetime.datetime.now()
+        self.timestamp = (clock or default_clock).now()
         self.user_id = user_id
 
     def tie_breaker_value(self):
@@ -27,56 +81,296 @@ class BaseNode:
     def is_root(self):
         return self.parent is None
 
+    def structural_hash(self):
+        """
+        Merkle hash of the subtree: node types and contents, not ids.
+
+        Equal subtrees hash equally, so a diff can skip them without walking
+        them. The hash is computed once and cached on every node of the
+        subtree until invalidate_hash() is called.
+        """
+        if self._hash is not None:
+            return self._hash
+        stack = [(self, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if node._hash is not None:
+                continue
+            if expanded:
+                node._hash = hash(
+                    (
+                        node.__class__.__name__,
+                        node._content_key(),
+                        *(None if c is None else c._hash for c in node.children()),
+                    )
+                )
+            else:
+                stack.append((node, True))
+                stack.extend(
+                    (child, False) for child in node.children() if child is not None
+                )
+        return self._hash
+
+    def digest(self) -> bytes:
+        """
+        Merkle digest of the subtree: node types, contents and first ids.
+
+        Unlike structural_hash it comes out the same in every process, so
+        replicas can compare digests to tell whether they agree, and where
+        they do not. It is cached like the structural hash and dropped
+        along with it by invalidate_hash().
+        """
+        if self._digest is not None:
+            return self._digest
+        stack = [(self, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if node._digest is not None:
+                continue
+            if expanded:
+                node._digest = node.combine_digests(
+                    None if child is None else child._digest
+                    for child in node.children()
+                )
+            else:
+                stack.append((node, True))
+                stack.extend(
+                    (child, False) for child in node.children() if child is not None
+                )
+        return self._digest
+
+    def combine_digests(self, child_digests) -> bytes:
+        # Digest of this node over the given digests of its children
+        h = hashlib.blake2b(digest_size=DIGEST_SIZE)
+        key = (self.__class__.__name__, self._content_key(), self.id_history[0])
+        h.update(repr(key).encode())
+        for digest in child_digests:
+            h.update(_NO_CHILD if digest is None else digest)
+        return h.digest()
+
+    def invalidate_hash(self):
+        # Must follow every in-place change of the node or of its children.
+        # A node whose hash and digest are not cached has no cached ancestors
+        # either, as hashing a node hashes its whole subtree, so the walk can
+        # stop there.
+        node = self
+        while node is not None and (node._hash is not None or node._digest is not None):
+            node._hash = None
+            node._digest = None
+            node = node.parent
+
+    def children(self):
+        # Child nodes in source order, a Binary may hold None after a deletion.
+        # CellRange keeps its cells to itself and counts as a leaf.
+        return ()
+
+    def __str__(self):
+        # Nodes describe themselves as a sequence of text and child nodes,
+        # which is expanded with an explicit stack and joined once, so that
+        # deeply nested formulas neither recurse nor copy strings per level
+        text = []
+        stack = [self]
+        while stack:
+            part = stack.pop()
+            if isinstance(part, str):
+                text.append(part)
+            elif part is None:
+                text.append("None")
+            else:
+                stack.extend(reversed(part._str_parts()))
+        return "".join(text)
+
+    def __repr__(self):
+        return self.fold(lambda node, parts: node._format_repr(parts), "None")
+
+    def clone(self):
+        # Fresh copy of the whole subtree in which every node gets a new id.
+        # Nodes are copied attribute by attribute instead of re-running the
+        # constructors, which makes this much cheaper than parsing again.
+        root = self._copy()
+        stack = [root]
+        while stack:
+            stack.extend(stack.pop()._copy_children())
+        return root
+
+    def _copy(self):
+        node = object.__new__(self.__class__)
+        for name in self._copied_slots:
+            try:
+                setattr(node, name, getattr(self, name))
+            except AttributeError:
+                # position of a node that is not a function argument
+                pass
+        node.id_history = [new_id()]
+        node.timestamp = UNSTAMPED
+        node.parent = None
+        # The digest covers the first id
+        node._digest = None
+        node._owner = None
+        return node
+
+    def _fork_copy(self):
+        # Copy of this node alone that keeps its ids, stamp and parent. The
+        # children stay shared with the original.
+        node = object.__new__(self.__class__)
+        for name in self._copied_slots:
+            try:
+                setattr(node, name, getattr(self, name))
+            except AttributeError:
+                pass
+        node.id_history = list(self.id_history)
+        node.timestamp = self.timestamp
+        node.parent = self.parent
+        node._owner = None
+        return node
+
+    def _replace_child(self, old, new):
+        raise Exception("Node type has no children to replace")
+
+    def _copy_children(self):
+        # Replaces the children of a fresh copy by copies of their own and
+        # returns those that may have children in turn
+        return ()
+
+    def fold(self, combine, missing):
+        # Post-order walk with an explicit stack: combine(node, parts) builds
+        # the result for a node from the results of its children, missing
+        # stands in for an empty Binary side
+        results = []
+        stack = [(self, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if node is None:
+                results.append(missing)
+            elif expanded:
+                count = len(node.children())
+                parts = results[len(results) - count :]
+                del results[len(results) - count :]
+                results.append(combine(node, parts))
+            else:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(node.children()))
+        return results[0]
+
 
 class Function(BaseNode):
+    __slots__ = ("func_name", "arguments")
+
     def __init__(self, func_name, arguments, user_id):
-        super().__init__(f"Func[{func_name}]", user_id)
+        super().__init__(user_id)
         self.func_name = func_name
         self.arguments = arguments
         for i, arg in enumerate(self.arguments):
             arg.parent = self
             arg.position = i
 
-    def __str__(self):
-        arg_strs = [str(arg) for arg in self.arguments]
-        return f"{self.func_name}({', '.join(arg_strs)})"
+    @property
+    def node_content(self):
+        return f"Func[{self.func_name}]"
 
-    def __repr__(self):
-        arg_reprs = [repr(arg) for arg in self.arguments]
-        return f"Function(func_name='{self.func_name}', arguments={arg_reprs}"
+    def children(self):
+        return self.arguments
+
+    def _str_parts(self):
+        parts = [f"{self.func_name}("]
+        for i, arg in enumerate(self.arguments):
+            if i > 0:
+                parts.append(", ")
+            parts.append(arg)
+        parts.append(")")
+        return parts
+
+    def _format_repr(self, parts):
+        return f"Function(func_name='{self.func_name}', arguments={parts}"
+
+    def _copy_children(self):
+        self.arguments = [arg._copy() for arg in self.arguments]
+        for i, arg in enumerate(self.arguments):
+            arg.parent = self
+            arg.position = i
+        return self.arguments
+
+    def _fork_copy(self):
+        node = super()._fork_copy()
+        node.arguments = list(self.arguments)
+        return node
+
+    def _replace_child(self, old, new):
+        i = self.argument_index(old, lambda arg: arg is old)
+        if i is not None:
+            self.arguments[i] = new
+
+    def argument_index(self, node, matches):
+        # Index of the first argument that matches, None if none does. The
+        # position of node is tried first, it goes stale once arguments are
+        # added or removed in front of node, but spares a scan of long
+        # argument lists otherwise.
+        i = getattr(node, "position", None)
+        if i is not None and i < len(self.arguments) and matches(self.arguments[i]):
+            return i
+        for i, arg in enumerate(self.arguments):
+            if matches(arg):
+                return i
+        return None
+
+    def _content_key(self):
+        return (self.func_name,)
 
     def compare_content(self, other_node):
         return self.func_name == other_node.func_name
 
 
 class Cell(BaseNode):
+    __slots__ = ("col", "row")
+
     def __init__(self, col, row, user_id):
-        super().__init__(f"Cell[{col}{row}]", user_id)
+        super().__init__(user_id)
         self.col = col
         self.row = row
 
-    def __str__(self):
-        return f"{self.col}{self.row}"
+    @property
+    def node_content(self):
+        return f"Cell[{self.col}{self.row}]"
 
-    def __repr__(self):
+    def _str_parts(self):
+        return [f"{self.col}{self.row}"]
+
+    def _format_repr(self, parts):
         return f"Cell(col='{self.col}', row={self.row})"
 
+    def _content_key(self):
+        return (self.col, self.row)
+
     def compare_content(self, other_node):
         return self.col == other_node.col and self.row == other_node.row
 
 
 class CellRange(BaseNode):
+    __slots__ = ("start", "end")
+
     def __init__(self, start, end, user_id):
-        super().__init__(f"Range[{start}][{end}]", user_id)
+        super().__init__(user_id)
         self.start = start
         self.end = end
 
-    def __str__(self):
-        return f"{self.start}:{self.end}"
+    @property
+    def node_content(self):
+        return f"Range[{self.start}][{self.end}]"
 
-    def __repr__(self):
+    def _str_parts(self):
+        return [f"{self.start}:{self.end}"]
+
+    def _format_repr(self, parts):
         return f"CellRange(start={self.start}, end={self.end}')"
 
+    def _copy_children(self):
+        self.start = self.start._copy()
+        self.end = self.end._copy()
+        return ()
+
+    def _content_key(self):
+        return (self.start.col, self.start.row, self.end.col, self.end.row)
+
     def compare_content(self, other_node):
         return self.start.compare_content(
             other_node.start
@@ -84,53 +378,82 @@ class CellRange(BaseNode):
 
 
 class Name(BaseNode):
+    __slots__ = ("name",)
+
     def __init__(self, name, user_id):
-        super().__init__(f"Name[{name}]", user_id)
+        super().__init__(user_id)
         self.name = name
 
-    def __str__(self):
-        return str(self.name)
+    @property
+    def node_content(self):
+        return f"Name[{self.name}]"
 
-    def __repr__(self):
+    def _str_parts(self):
+        return [str(self.name)]
+
+    def _format_repr(self, parts):
         return f"Name(name='{self.name}')"
 
+    def _content_key(self):
+        return (self.name,)
+
     def compare_content(self, other_node):
         return self.name == other_node.name
 
 
 class Number(BaseNode):
+    __slots__ = ("value",)
+
     def __init__(self, value, user_id):
-        super().__init__(f"Num[{value}]", user_id)
+        super().__init__(user_id)
         self.value = value
 
-    def __str__(self):
-        return str(self.value)
+    @property
+    def node_content(self):
+        return f"Num[{self.value}]"
 
-    def __repr__(self):
+    def _str_parts(self):
+        return [str(self.value)]
+
+    def _format_repr(self, parts):
         return f"Number(value={self.value})"
 
+    def _content_key(self):
+        return (self.value,)
+
     def compare_content(self, other_node):
         return self.value == other_node.value
 
 
 class Logical(BaseNode):
+    __slots__ = ("value",)
+
     def __init__(self, value, user_id):
-        super().__init__(f"Bool[{value}]", user_id)
+        super().__init__(user_id)
         self.value = value
 
-    def __str__(self):
-        return str(self.value)
+    @property
+    def node_content(self):
+        return f"Bool[{self.value}]"
 
-    def __repr__(self):
+    def _str_parts(self):
+        return [str(self.value)]
+
+    def _format_repr(self, parts):
         return f"Logical(value={self.value})"
 
+    def _content_key(self):
+        return (self.value,)
+
     def compare_content(self, other_node):
         return self.value == other_node.value
 
 
 class Binary(BaseNode):
+    __slots__ = ("left", "right", "op")
+
     def __init__(self, left, op, right, user_id):
-        super().__init__(f"Binary[{op}]", user_id)
+        super().__init__(user_id)
         self.left = left
         self.right = right
         self.op = op
@@ -141,31 +464,77 @@ class Binary(BaseNode):
         if self.right:
             self.right.parent = self
 
-    def __str__(self):
-        return f"{str(self.left)} {self.op} {str(self.right)}"
+    @property
+    def node_content(self):
+        return f"Binary[{self.op}]"
 
-    def __repr__(self):
-        return (
-            f"Binary(left={repr(self.left)}, op='{self.op}', "
-            f"right={repr(self.right)})"
-        )
+    def children(self):
+        return (self.left, self.right)
+
+    def _str_parts(self):
+        return [self.left, f" {self.op} ", self.right]
+
+    def _format_repr(self, parts):
+        return f"Binary(left={parts[0]}, op='{self.op}', right={parts[1]})"
+
+    def _copy_children(self):
+        children = []
+        if self.left:
+            self.left = self.left._copy()
+            self.left.parent = self
+            children.append(self.left)
+        if self.right:
+            self.right = self.right._copy()
+            self.right.parent = self
+            children.append(self.right)
+        return children
+
+    def _replace_child(self, old, new):
+        if self.left is old:
+            self.left = new
+        elif self.right is old:
+            self.right = new
+
+    def _content_key(self):
+        return (self.op,)
 
     def compare_content(self, other_node):
         return self.op == other_node.op
 
 
 class Unary(BaseNode):
+    __slots__ = ("op", "expr")
+
     def __init__(self, op, expr, user_id):
-        super().__init__(f"Unary[{op}]", user_id)
+        super().__init__(user_id)
         self.op = op
         self.expr = expr
         self.expr.parent = self
 
-    def __str__(self):
-        return f"{self.op}{str(self.expr)}"
+    @property
+    def node_content(self):
+        return f"Unary[{self.op}]"
 
-    def __repr__(self):
-        return f"Unary(op='{self.op}', expr={repr(self.expr)})"
+    def children(self):
+        return (self.expr,)
+
+    def _str_parts(self):
+        return [self.op, self.expr]
+
+    def _format_repr(self, parts):
+        return f"Unary(op='{self.op}', expr={parts[0]})"
+
+    def _copy_children(self):
+        self.expr = self.expr._copy()
+        self.expr.parent = self
+        return (self.expr,)
+
+    def _replace_child(self, old, new):
+        if self.expr is old:
+            self.expr = new
+
+    def _content_key(self):
+        return (self.op,)
 
     def compare_content(self, other_node):
         return self.op == other_node.op
@@ -1,4 +1,9 @@
+import itertools
+import os
 import re
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from parser.cache import CacheInfo, ParseCache
 from parser.nodes import (
     BaseNode,
     Binary,
@@ -10,241 +15,415 @@ from parser.nodes import (
     Number,
     Unary,
 )
+from typing import Iterable, Iterator, NamedTuple, Optional, Union
+
+_TOKEN_REGEX = re.compile(
+    r"""
+    (?P<NUMBER>(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?)
+    |(?P<CELL>[A-Za-z]{1,3}[0-9]+)(?![A-Za-z0-9_.])
+    |(?P<WORD>[A-Za-z_][A-Za-z0-9_.]*)
+    |(?P<OP><>|<=|>=|[-+*/%^=<>])
+    |(?P<LPAREN>\()
+    |(?P<RPAREN>\))
+    |(?P<COMMA>,)
+    |(?P<COLON>:)
+    |(?P<SPACE>\s+)
+    |(?P<UNKNOWN>.)
+    """,
+    re.VERBOSE,
+)
+
+
+class Token(NamedTuple):
+    kind: str
+    text: str
+    value: object
+    offset: int
+
+
+def _classify_word(text):
+    # Words are logicals or names; anything shorter than a name is unknown
+    lowered = text.lower()
+    if lowered == "true":
+        return "LOGICAL", True
+    if lowered == "false":
+        return "LOGICAL", False
+    if len(text) < 2:
+        return "UNKNOWN", text
+    return "NAME", text.upper()
+
+
+def _classify_cell(text):
+    # Out-of-bounds references fall back to names, like Excel does
+    digits = len(text.rstrip("0123456789"))
+    col = text[:digits].upper()
+    row = int(text[digits:])
+    if col > "XFD" or row > 1048576 or row == 0:
+        return _classify_word(text)
+    return "CELL", (col, row)
 
 
 def _tokenize(code):
-    return (
-        code.replace(":", " : ")
-        .replace(",", " , ")
-        .replace("(", " ( ")
-        .replace(")", " ) ")
-        .replace("*", " * ")
-        .replace("+", " + ")
-        .replace("/", " / ")
-        .replace("-", " - ")
-        .replace("%", " % ")
-        .replace("^", " ^ ")
-        .replace("=", " = ")
-        .replace("<", " < ")
-        .replace("e - ", "e-")
-        .replace("e + ", "e+")
-        .replace("> =", " >= ")
-        .replace("< =", " <= ")
-        .replace("< >", " <> ")
-        .split()
-    )
+    tokens = []
+    for match in _TOKEN_REGEX.finditer(code):
+        kind = match.lastgroup
+        text = match.group()
+        if kind == "SPACE":
+            continue
+        if kind == "NUMBER":
+            value = int(text) if text.isdigit() else float(text)
+        elif kind == "CELL":
+            kind, value = _classify_cell(text)
+        elif kind == "WORD":
+            kind, value = _classify_word(text)
+        else:
+            value = text
+        tokens.append(Token(kind, text, value, match.start()))
+    return tokens
+
+
+# Operator precedence according to Excel rules, lower levels bind tighter
+_LEVEL = {
+    "%": 0,
+    "^": 1,
+    "*": 2,
+    "/": 2,
+    "+": 3,
+    "-": 3,
+    "=": 4,
+    "<": 4,
+    ">": 4,
+    "<=": 4,
+    ">=": 4,
+    "<>": 4,
+}
 
 
 class FormulaParseError(Exception):
     pass
 
 
+# Marks an _ExprFrame opened by a bare parenthesis rather than a function call
+_PAREN = object()
+
+
+class _ExprFrame:
+    """
+    Operand and operator stacks of one expression that is being parsed.
+
+    ``context`` is None for the whole formula, _PAREN for a parenthesised
+    expression, or the name of the function whose arguments are parsed.
+    """
+
+    __slots__ = ("context", "arguments", "operands", "operators", "unary")
+
+    def __init__(self, context):
+        self.context = context
+        self.arguments = []
+        self.operands = []
+        self.operators = []
+        self.unary = []
+
+    def push_operand(self, operand):
+        # Prefix operators bind tighter than any binary operator
+        while self.unary:
+            operand = Unary(self.unary.pop(), operand, "default_user")
+        self.operands.append(operand)
+
+    def push_operator(self, op):
+        # Reduce everything that binds at least as tight, so every precedence
+        # level stays left-associative
+        while self.operators and _LEVEL[self.operators[-1]] <= _LEVEL[op]:
+            self._reduce()
+        self.operators.append(op)
+
+    def finish(self):
+        while self.operators:
+            self._reduce()
+        expr = self.operands.pop()
+        self.operands = []
+        return expr
+
+    def _reduce(self):
+        right = self.operands.pop()
+        left = self.operands.pop()
+        self.operands.append(Binary(left, self.operators.pop(), right, "default_user"))
+
+
 def _parse(tokens):
     # print("In_parse")  # Debugging print
+    pos = 0
+    end = len(tokens)
+
+    def _advance():
+        nonlocal pos
+        pos += 1
+        return tokens[pos - 1]
 
     def _parse_logical():
-        if tokens[0].lower() == "true":
-            tokens.pop(0)
-            return Logical(True, "default_user")
-        elif tokens[0].lower() == "false":
-            tokens.pop(0)
-            return Logical(False, "default_user")
+        if tokens[pos].kind == "LOGICAL":
+            return Logical(_advance().value, "default_user")
 
     def _parse_number():
-        try:
-            number = int(tokens[0])
-            tokens.pop(0)
-            # print(f"Parsed int: {number}")  # Debugging print
-            return Number(number, "default_user")
-        except ValueError:
-            try:
-                number = float(tokens[0])
-                tokens.pop(0)
-                # print(f"Parsed float: {number}")  # Debugging print
-                return Number(number, "default_user")
-            except ValueError:
-                # print("Failed to parse number")  # Debugging print
-                return None
+        if tokens[pos].kind == "NUMBER":
+            # print(f"Parsed number: {tokens[pos].value}")  # Debugging print
+            return Number(_advance().value, "default_user")
 
     def _parse_cell():
-        cell_regex = "^([a-zA-Z]+)([0-9]+)$"
-        matches = re.match(cell_regex, tokens[0])
-        if matches is None:
-            return None
-        col = matches.group(1).upper()
-        if len(col) > 3 or col > "XFD":
-            return None
-        row = int(matches.group(2))
-        if row > 1048576 or row == 0:
+        if tokens[pos].kind != "CELL":
             return None
+        col, row = tokens[pos].value
         return Cell(col, row, "default_user")
 
     def _parse_cell_or_range():
         cell1 = _parse_cell()
         if cell1 is None:
             return None
-        tokens.pop(0)
-        if len(tokens) == 0 or tokens[0] != ":":
+        _advance()
+        if pos == end or tokens[pos].kind != "COLON":
             return cell1
-        tokens.pop(0)
-        if len(tokens) == 0:
+        _advance()
+        if pos == end:
             raise FormulaParseError("Unexpected end-of-formula after colon")
         cell2 = _parse_cell()
         if cell2 is None:
-            raise FormulaParseError("Expected cell after colon, found " + tokens[0])
-        tokens.pop(0)
+            raise FormulaParseError(
+                "Expected cell after colon, found " + tokens[pos].text
+            )
+        _advance()
         return CellRange(cell1, cell2, "default_user")
 
-    def _parse_name_or_func():
-        name_is_ok = re.match("^[a-zA-Z_][a-zA-Z0-9_.]+$", tokens[0])
-        if name_is_ok is None:
-            return None
-        name = tokens.pop(0).upper()
-        if len(tokens) == 0 or tokens[0] != "(":
-            return Name(name, "default_user")
-        tokens.pop(0)
-        arguments = []
-        while True:
-            if len(tokens) == 0:
-                raise FormulaParseError(
-                    "Unexpected end-of-formula while parsing arguments of " + name
-                )
-            arg = _parse_expr()
-            if arg is None:
-                return None
-            arguments.append(arg)
-            if len(tokens) == 0:
-                raise FormulaParseError(
-                    "Unexpected end-of-formula while parsing arguments of " + name
-                )
-            next_token = tokens.pop(0)
-            if next_token == ")":
-                break
-            elif next_token == ",":
-                continue
-            else:
-                raise FormulaParseError(
-                    "Expected closed parenthesis or comma after argument of function "
-                    + name
-                )
-        return Function(name, arguments, "default_user")
-
-    def _parse_unary():
-        if tokens[0] in ["+", "-"]:
-            op = tokens.pop(0)
-            if len(tokens) == 0:
-                raise FormulaParseError(
-                    "Unexpected end-of-formula after unary operator " + op
-                )
-            return Unary(op, _parse_expr(), "default_user")
-
     def _parse_op():
-        if tokens[0] in ["+", "-", "*", "/", "%", "^", "=", "<>", "<", ">", "<=", ">="]:
-            return tokens.pop(0)
-        raise FormulaParseError("Unknown operator " + tokens.pop(0))
-
-    def _parse_basic_expr():
-        if len(tokens) == 0:
-            raise FormulaParseError("Incomplete expression")
-        # print("Current token:", tokens[0])  # Debugging print
-        logical = _parse_logical()
-        if logical is not None:
-            return logical
-        number = _parse_number()
-        if number is not None:
-            return number
-        cell_or_range = _parse_cell_or_range()
-        if cell_or_range is not None:
-            return cell_or_range
-        func_or_name = _parse_name_or_func()
-        if func_or_name is not None:
-            return func_or_name
-        if tokens[0] == "(":
-            tokens.pop(0)
-            expr = _parse_expr()
-            if len(tokens) == 0 or tokens[0] != ")":
-                raise FormulaParseError("Closed parenthesis expected")
-            return expr
-        if tokens[0] == "+" or tokens[0] == "-":
-            op = tokens.pop(0)
-            if len(tokens) == 0:
-                raise FormulaParseError(
-                    "Unexpected end-of-formula after unary operator " + op
-                )
-            expr = _parse_basic_expr()
-            return Unary(op, expr, "default_user")
+        if tokens[pos].kind == "OP":
+            return _advance().text
+        raise FormulaParseError("Unknown operator " + _advance().text)
 
     def _parse_expr():
-        if len(tokens) == 0:
+        # Explicit-stack version of the recursive descent parser. Every open
+        # function call or parenthesis pushes an _ExprFrame, so the nesting
+        # depth of a formula is only bounded by memory.
+        if pos == end:
             raise FormulaParseError("Expression cannot be empty or incomplete")
-        # print("In_parse_expr")  # Debugging print
-        if len(tokens) == 0:
-            raise FormulaParseError("Expression cannot be empty")
-
         # print("Parsing expression, current tokens:", tokens)  # Debugging print
-
-        arithmetic = []
+        frames = []
+        frame = _ExprFrame(None)
 
         while True:
-            basic = _parse_basic_expr()
-            if basic is not None:
-                arithmetic.append(basic)
-            else:
-                raise FormulaParseError(
-                    "Expected a number, a boolean, a cell, a range, or a function call"
-                )
-
-            if len(tokens) == 0 or tokens[0] == "," or tokens[0] == ")":
-                break
-
-            arithmetic.append(_parse_op())
-
-        # resolve precedence according to Excel rules
-
-        level = {
-            "%": 0,
-            "^": 1,
-            "*": 2,
-            "/": 2,
-            "+": 3,
-            "-": 3,
-            "=": 4,
-            "<": 4,
-            ">": 4,
-            "<=": 4,
-            ">=": 4,
-            "<>": 4,
-        }
-
-        while len(arithmetic) != 1:
-            min_i = 1
-            for i in range(1, len(arithmetic), 2):
-                if level[arithmetic[i]] < level[arithmetic[min_i]]:
-                    min_i = i
-            arithmetic = (
-                arithmetic[0 : min_i - 1]
-                + [
-                    Binary(
-                        arithmetic[min_i - 1],
-                        arithmetic[min_i],
-                        arithmetic[min_i + 1],
-                        "default_user",
+            # Parse one operand, possibly opening nested frames on the way
+            operand = None
+            while operand is None:
+                if pos == end:
+                    raise FormulaParseError("Incomplete expression")
+                # print("Current token:", tokens[pos])  # Debugging print
+                kind = tokens[pos].kind
+                if kind == "LOGICAL":
+                    operand = _parse_logical()
+                elif kind == "NUMBER":
+                    operand = _parse_number()
+                elif kind == "CELL":
+                    operand = _parse_cell_or_range()
+                elif kind == "NAME":
+                    name = _advance().value
+                    if pos == end or tokens[pos].kind != "LPAREN":
+                        operand = Name(name, "default_user")
+                        continue
+                    _advance()
+                    if pos == end:
+                        raise FormulaParseError(
+                            "Unexpected end-of-formula while parsing arguments of "
+                            + name
+                        )
+                    frames.append(frame)
+                    frame = _ExprFrame(name)
+                elif kind == "LPAREN":
+                    _advance()
+                    if pos == end:
+                        raise FormulaParseError(
+                            "Expression cannot be empty or incomplete"
+                        )
+                    frames.append(frame)
+                    frame = _ExprFrame(_PAREN)
+                elif tokens[pos].text == "+" or tokens[pos].text == "-":
+                    op = _advance().text
+                    if pos == end:
+                        raise FormulaParseError(
+                            "Unexpected end-of-formula after unary operator " + op
+                        )
+                    frame.unary.append(op)
+                else:
+                    raise FormulaParseError(
+                        "Expected a number, a boolean, a cell, a range, "
+                        "or a function call"
                     )
-                ]
-                + arithmetic[min_i + 2 :]
-            )
 
-        return arithmetic[0]
+            # Attach the operand, closing every frame that ends right after it
+            while True:
+                frame.push_operand(operand)
+                if pos < end and tokens[pos].kind not in ("COMMA", "RPAREN"):
+                    if tokens[pos].kind != "OP":
+                        _parse_op()
+                    frame.push_operator(_advance().text)
+                    break
+
+                expr = frame.finish()
+                if frame.context is None:
+                    return expr
+
+                if frame.context is _PAREN:
+                    # The closing parenthesis is left for the enclosing frame
+                    if pos == end or tokens[pos].kind != "RPAREN":
+                        raise FormulaParseError("Closed parenthesis expected")
+                    operand = expr
+                    frame = frames.pop()
+                    continue
+
+                name = frame.context
+                frame.arguments.append(expr)
+                if pos == end:
+                    raise FormulaParseError(
+                        "Unexpected end-of-formula while parsing arguments of " + name
+                    )
+                next_token = _advance()
+                if next_token.kind == "RPAREN":
+                    operand = Function(name, frame.arguments, "default_user")
+                    frame = frames.pop()
+                elif next_token.kind == "COMMA":
+                    if pos == end:
+                        raise FormulaParseError(
+                            "Unexpected end-of-formula while parsing arguments of "
+                            + name
+                        )
+                    break
+                else:
+                    raise FormulaParseError(
+                        "Expected closed parenthesis or comma after argument of "
+                        "function " + name
+                    )
 
     expr = _parse_expr()
 
-    if len(tokens) > 0:
+    if pos < end:
         raise FormulaParseError("Multiple formulas provided")
 
     return expr
 
 
-def parse(code: str) -> BaseNode:
+def _parse_uncached(code: str) -> BaseNode:
     tokens = _tokenize(code)
     # print("Tokens: ", tokens) # Debugging Print
     return _parse(tokens)
+
+
+_parse_cache = ParseCache()
+
+
+def parse(code: str) -> BaseNode:
+    return _parse_cache.get(code, _parse_uncached)
+
+
+def _parse_chunk(codes):
+    # Runs in a worker process, parse errors are returned rather than raised
+    # so that one bad formula does not fail the rest of its chunk
+    results = []
+    for code in codes:
+        try:
+            results.append(parse(code))
+        except FormulaParseError as e:
+            results.append(e)
+    return results
+
+
+def _chunked(codes, chunksize):
+    chunk = []
+    for code in codes:
+        chunk.append(code)
+        if len(chunk) == chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _chunk_results(future, chunk):
+    try:
+        return future.result()
+    except Exception:
+        # Results that cannot travel back from the worker, e.g. trees nested
+        # deeper than pickle can handle, are parsed here instead
+        return _parse_chunk(chunk)
+
+
+def parse_many(
+    codes: Iterable[str],
+    workers: Optional[int] = None,
+    chunksize: int = 256,
+    ordered: bool = True,
+) -> Iterator[Union[BaseNode, FormulaParseError, tuple]]:
+    """
+    Parse a stream of formulas in chunks across a pool of worker processes.
+
+    Each formula yields its AST, or the FormulaParseError it raised. With
+    ordered=True results come in input order. With ordered=False chunks are
+    yielded as soon as they finish, as (index, result) pairs. The input is
+    consumed lazily and at most two chunks per worker are in flight.
+    workers=None uses every CPU. With one worker the formulas are parsed in
+    this process.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = _chunked(codes, chunksize)
+
+    if workers == 1:
+        index = 0
+        for chunk in chunks:
+            for result in _parse_chunk(chunk):
+                yield result if ordered else (index, result)
+                index += 1
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = {}
+        order = deque()
+        start = 0
+
+        def submit(chunk):
+            nonlocal start
+            future = executor.submit(_parse_chunk, chunk)
+            in_flight[future] = (start, chunk)
+            if ordered:
+                order.append(future)
+            start += len(chunk)
+
+        for chunk in itertools.islice(chunks, 2 * workers):
+            submit(chunk)
+
+        while in_flight:
+            if ordered:
+                done = [order.popleft()]
+            else:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                index, chunk = in_flight.pop(future)
+                results = _chunk_results(future, chunk)
+
+                # Refill the pool before handing results to the caller
+                for next_chunk in itertools.islice(chunks, 1):
+                    submit(next_chunk)
+
+                if ordered:
+                    yield from results
+                else:
+                    yield from enumerate(results, index)
+
+
+def parse_cache_info() -> CacheInfo:
+    return _parse_cache.info()
+
+
+def set_parse_cache_size(maxsize: int):
+    # 0 disables the cache
+    _parse_cache.resize(maxsize)
+
+
+def clear_parse_cache():
+    _parse_cache.clear()
@@ -291,3 +291,59 @@ def test_delete_root_binary():
     changes = compare_asts(original_ast, modified_ast)
     original_ast = apply_changes_to_ast(original_ast, changes, user_id="test")
     assert str(original_ast) == "SUM(A1:A10)"
+
+
+#######################
+# DEEPLY NESTED TESTS #
+#######################
+
+
+def test_deeply_nested_modification():
+    original_ast = parse("IF(A1, " * 10000 + "B1" + ", 0)" * 10000)
+    modified_ast = parse("IF(A1, " * 10000 + "B2" + ", 0)" * 10000)
+    changes = compare_asts(original_ast, modified_ast)
+    assert len(changes) == 1
+    apply_changes_to_ast(original_ast, changes, user_id="test")
+    assert str(original_ast) == str(modified_ast)
+
+
+######################
+# ARGUMENT ALIGNMENT #
+######################
+
+
+def test_insert_argument_in_the_middle_is_one_change():
+    args = [f"A{i}" for i in range(1, 51)]
+    original_ast = parse(f"SUM({', '.join(args)})")
+    modified = f"SUM({', '.join(args[:20] + ['B1 * 2'] + args[20:])})"
+    changes = compare_asts(original_ast, parse(modified))
+    assert len(changes) == 1
+    apply_changes_to_ast(original_ast, changes, user_id="test")
+    assert str(original_ast) == modified
+
+
+def test_delete_argument_in_the_middle_is_one_change():
+    original_ast = parse("SUM(A1, B1, C1, D1, E1)")
+    changes = compare_asts(original_ast, parse("SUM(A1, B1, D1, E1)"))
+    assert len(changes) == 1
+    apply_changes_to_ast(original_ast, changes, user_id="test")
+    assert str(original_ast) == "SUM(A1, B1, D1, E1)"
+
+
+def test_arguments_between_identical_ones_are_modified():
+    original_ast = parse("SUM(A1, B1, C1, D1)")
+    modified_ast = parse("SUM(A1, B2, 5, C1, D1)")
+    changes = compare_asts(original_ast, modified_ast)
+    apply_changes_to_ast(original_ast, changes, user_id="test")
+    assert str(original_ast) == "SUM(A1, B2, 5, C1, D1)"
+
+
+def test_long_argument_edits_fall_back_to_positions(monkeypatch):
+    import ast_processing.compare_asts as module
+
+    monkeypatch.setattr(module, "MAX_ARGUMENT_EDITS", 1)
+    original_ast = parse("SUM(A1, B1, C1, D1)")
+    changes = compare_asts(original_ast, parse("SUM(E1, F1, A1, B1, C1, D1)"))
+    assert len(changes) == 6
+    apply_changes_to_ast(original_ast, changes, user_id="test")
+    assert str(original_ast) == "SUM(E1, F1, A1, B1, C1, D1)"
@@ -0,0 +1,73 @@
+from parser.clock import (
+    UNSTAMPED,
+    HybridLogicalClock,
+    timestamp_millis,
+    timestamp_replica,
+)
+from parser.parser import parse
+
+import pytest  # pyright: ignore # noqa F401
+
+from crdt.ast_manager import ASTManager
+from crdt.utils import conflict_resolution
+
+
+def frozen_wall(millis):
+    return lambda: millis * 1_000_000
+
+
+def test_clock_follows_wall_time():
+    clock = HybridLogicalClock(replica_id=3, wall_ns=frozen_wall(1000))
+    stamp = clock.now()
+    assert timestamp_millis(stamp) == 1000
+    assert timestamp_replica(stamp) == 3
+
+
+def test_clock_is_monotonic_when_wall_time_stalls_or_goes_back():
+    wall = [2000]
+    clock = HybridLogicalClock(replica_id=1, wall_ns=lambda: wall[0] * 1_000_000)
+    first = clock.now()
+    second = clock.now()
+    wall[0] = 1000
+    third = clock.now()
+    assert first < second < third
+
+
+def test_clock_observes_remote_stamps():
+    ahead = HybridLogicalClock(replica_id=1, wall_ns=frozen_wall(5000))
+    behind = HybridLogicalClock(replica_id=2, wall_ns=frozen_wall(1000))
+    remote = ahead.now()
+    assert behind.now() < remote
+    behind.observe(remote)
+    assert behind.now() > remote
+
+
+def test_stamps_of_replicas_never_tie():
+    a = HybridLogicalClock(replica_id=1, wall_ns=frozen_wall(1000))
+    b = HybridLogicalClock(replica_id=2, wall_ns=frozen_wall(1000))
+    assert a.now() < b.now()
+
+
+def test_parsed_nodes_are_unstamped():
+    ast = parse("SUM(A1, 2)")
+    assert ast.timestamp == UNSTAMPED
+    assert ast.arguments[0].timestamp == UNSTAMPED
+
+
+def test_ast_manager_stamps_edits_with_its_clock():
+    manager = ASTManager(parse("SUM(A1, 2)"), replica_id=9)
+    assert manager.replica_id == 9
+    manager.apply_changes(manager.get_changes_to("SUM(A2, 2)"), "test")
+    cell = manager.ast.arguments[0]
+    assert timestamp_replica(cell.timestamp) == 9
+    assert cell.timestamp > UNSTAMPED
+
+
+def test_conflict_resolution_prefers_later_stamp():
+    clock = HybridLogicalClock(replica_id=1)
+    earlier = parse("A1")
+    later = parse("A2")
+    earlier.refresh_node("user_1", clock)
+    later.refresh_node("user_2", clock)
+    assert conflict_resolution(later, earlier)
+    assert not conflict_resolution(earlier, later)
@@ -0,0 +1,109 @@
+import random
+from parser.parser import parse
+
+import pytest  # pyright: ignore # noqa F401
+
+from ast_utils.change_classes import ChildAddition, NodeModification
+from crdt.ast_manager import ASTManager
+from crdt.coalesce import coalesce
+from tests.utils.helpers import CELLS, random_edit
+
+
+def stage(manager, *formulas):
+    for formula in formulas:
+        manager.stage(manager.get_changes_to(formula), "user")
+
+
+def merged(manager, changes):
+    manager.apply_changes(manager.merge_changes(changes), "other")
+    return str(manager)
+
+
+def test_successive_modifications_collapse():
+    base = ASTManager(parse("SUM(A1, B1)"))
+    sender = base.fork()
+    stage(sender, "SUM(A2, B1)", "SUM(A3, B1)", "SUM(A3, B2)", "SUM(A4, B2)")
+    assert len(sender.pending) == 4
+
+    changes = sender.take_pending()
+    assert len(changes) == 2
+    assert all(isinstance(change, NodeModification) for change in changes)
+    assert sender.pending == []
+    assert merged(base, changes) == "SUM(A4, B2)"
+
+
+def test_addition_and_deletion_cancel():
+    base = ASTManager(parse("SUM(A1, B1)"))
+    sender = base.fork()
+    stage(sender, "SUM(A1, MAX(C1, 2), B1)", "SUM(A1, B1)")
+    assert sender.take_pending() == []
+
+    # Y went in next to X, and ends up one place further left
+    stage(sender, "SUM(C1, A1, B1)", "SUM(C1, A1, D1, B1)", "SUM(A1, D1, B1)")
+    changes = sender.take_pending()
+    assert len(changes) == 1
+    assert isinstance(changes[0], ChildAddition)
+    assert changes[0].position == 1
+    assert merged(base, changes) == "SUM(A1, D1, B1)"
+
+
+def test_added_subtree_absorbs_changes_to_it():
+    base = ASTManager(parse("SUM(A1, B1)"))
+    sender = base.fork()
+    stage(sender, "SUM(A1, MAX(C1, 2), B1)", "SUM(A1, MAX(C2, 3), B1)")
+    changes = sender.take_pending()
+    assert len(changes) == 1
+    assert merged(base, changes) == "SUM(A1, MAX(C2, 3), B1)"
+
+
+def test_deleted_subtree_absorbs_changes_to_it():
+    base = ASTManager(parse("SUM(A1, MAX(C1, 2), B1)"))
+    sender = base.fork()
+    stage(sender, "SUM(A1, MAX(C2, 2), B1)", "SUM(A1, MAX(C2, 3), B1)")
+    stage(sender, "SUM(A2, MAX(C2, 3), B1)", "SUM(A2, B1)")
+    changes = sender.take_pending()
+    assert len(changes) == 2
+    assert merged(base, changes) == "SUM(A2, B1)"
+
+
+def test_root_addition_absorbs_changes_above_the_old_root():
+    base = ASTManager(parse("SUM(A1, B1)"))
+    sender = base.fork()
+    stage(sender, "SUM(A1, B1) * 2", "SUM(A1, B1) * 3", "SUM(A2, B1) * 3")
+    changes = sender.take_pending()
+    assert len(changes) == 2
+    assert merged(base, changes) == "SUM(A2, B1) * 3"
+
+
+def test_forks_start_with_nothing_pending():
+    manager = ASTManager(parse("SUM(A1, B1)"))
+    stage(manager, "SUM(A2, B1)")
+    assert manager.fork().pending == []
+    assert len(manager.pending) == 1
+    assert coalesce([]) == []
+
+
+def concurrent_edit(rng, manager):
+    # Modifies one argument in place, which moves no argument around
+    args = [str(arg) for arg in manager.ast.arguments]
+    i = rng.randrange(len(args))
+    args[i] = rng.choice(CELLS) if args[i] in CELLS else args[i].replace("*", "+")
+    return f"SUM({', '.join(args)})"
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_merging_coalesced_changes_gives_the_same_tree(seed):
+    rng = random.Random(seed)
+    base = ASTManager(parse("SUM(A1, MAX(B2, 3), C3 * 2)"))
+    sender, plain, folded = base.fork(), base.fork(), base.fork()
+    for _ in range(rng.randint(1, 12)):
+        stage(sender, random_edit(rng, sender))
+    if rng.random() < 0.5:
+        formula = concurrent_edit(rng, plain)
+        for manager in (plain, folded):
+            manager.apply_changes(manager.get_changes_to(formula), "other")
+
+    changes = list(sender.pending)
+    coalesced = sender.take_pending()
+    assert len(coalesced) <= len(changes)
+    assert merged(plain, changes) == merged(folded, coalesced)
@@ -0,0 +1,64 @@
+from parser.parser import parse
+
+import pytest  # pyright: ignore # noqa F401
+
+from ast_processing.compare_asts import compare_asts
+from ast_processing.diff_cache import DiffCache
+from ast_processing.tree_diff import tree_diff
+from crdt.ast_manager import ASTManager
+from tests.utils.helpers import nodes
+
+
+def test_hit_is_bound_to_the_callers_nodes():
+    cache = DiffCache()
+    first = cache(parse("SUM(A1, B1, 2)"), parse("SUM(A1, B2, 2, C1)"))
+    original, modified = parse("SUM(A1, B1, 2)"), parse("SUM(A1, B2, 2, C1)")
+    changes = cache(original, modified)
+    assert cache.info().hits == 1 and cache.info().misses == 1
+    assert [type(change) for change in changes] == [type(change) for change in first]
+
+    live = {id(node) for node in nodes(original) + nodes(modified)}
+    for change in changes:
+        for value in vars(change).values():
+            if hasattr(value, "id_history"):
+                assert id(value) in live
+
+    manager = ASTManager(original)
+    manager.apply_changes(changes, "test")
+    assert str(manager) == "SUM(A1, B2, 2, C1)"
+
+
+def test_different_pairs_miss():
+    cache = DiffCache()
+    cache(parse("SUM(A1)"), parse("SUM(A2)"))
+    cache(parse("SUM(A1)"), parse("SUM(A3)"))
+    cache(parse("SUM(A2)"), parse("SUM(A1)"))
+    assert cache.info() == (0, 3, 1024, 3)
+
+
+def test_eviction_and_disabling():
+    cache = DiffCache(maxsize=2)
+    for target in ("SUM(A2)", "SUM(A3)", "SUM(A4)"):
+        cache(parse("SUM(A1)"), parse(target))
+    assert cache.info().currsize == 2
+    cache(parse("SUM(A1)"), parse("SUM(A2)"))
+    assert cache.info().hits == 0
+
+    cache.resize(0)
+    cache(parse("SUM(A1)"), parse("SUM(A3)"))
+    assert cache.info() == (0, 5, 0, 0)
+    cache.clear()
+    assert cache.info() == (0, 0, 0, 0)
+
+
+@pytest.mark.parametrize("engine", [compare_asts, tree_diff])
+def test_cached_engine_on_replicas(engine):
+    cache = DiffCache(engine)
+    managers = [ASTManager(parse("SUM(A1, MAX(B1, 2), C1) * 2"), diff_engine=cache)]
+    managers += [managers[0].fork() for _ in range(3)]
+    for manager in managers:
+        manager.apply_changes(
+            manager.get_changes_to("SUM(A1, MAX(B1, 3), D1, C1) * 2"), "test"
+        )
+        assert str(manager) == "SUM(A1, MAX(B1, 3), D1, C1) * 2"
+    assert cache.info().hits == 3
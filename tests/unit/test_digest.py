@@ -0,0 +1,119 @@
+import os
+import pickle
+import subprocess
+import sys
+from parser.parser import parse
+
+import pytest  # pyright: ignore # noqa F401
+
+from crdt.ast_manager import ASTManager
+from crdt.digest import BUCKET_SIZE, Divergence, WorkbookDigest, find_divergence
+from crdt.sync import sync
+from tests.utils.helpers import edit
+
+
+def sheet(n):
+    return {
+        f"A{i}": ASTManager(parse(f"SUM(B{i}, C{i} * 2, MAX(D{i}, 3))"))
+        for i in range(n)
+    }
+
+
+def forked(cells):
+    return {address: manager.fork() for address, manager in cells.items()}
+
+
+def test_digest_follows_ids_and_content():
+    a = ASTManager(parse("SUM(A1, B1)"))
+    b = a.fork()
+    assert a.digest() == b.digest()
+    # Same text, other ids
+    assert a.digest() != ASTManager(parse("SUM(A1, B1)")).digest()
+
+    before = a.digest()
+    edit(a, "SUM(A1, B2)")
+    assert a.digest() != before
+    assert b.digest() == before
+    sync(a, b)
+    assert a.digest() == b.digest()
+
+
+def test_digest_is_the_same_in_every_process():
+    tree = parse("SUM(A1:B2, C3 * 2, -4, TRUE)")
+    script = "import pickle, sys; print(pickle.load(sys.stdin.buffer).digest().hex())"
+    digests = set()
+    for seed in ("1", "2"):
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            input=pickle.dumps(tree),
+            capture_output=True,
+            check=True,
+            env={**os.environ, "PYTHONHASHSEED": seed},
+            cwd=os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+        )
+        digests.add(result.stdout.decode().strip())
+    assert digests == {tree.digest().hex()}
+
+
+def test_equal_workbooks_take_one_request():
+    cells = sheet(100)
+    found, requests = find_divergence(
+        WorkbookDigest({"S": cells}), WorkbookDigest({"S": forked(cells)})
+    )
+    assert found == []
+    assert requests == 1
+
+
+def test_finds_the_nodes_that_changed():
+    cells = sheet(2000)
+    other = forked(cells)
+    edit(other["A5"], "SUM(B5, C5 * 2, MAX(D5, 4))")
+    edit(other["A6"], "MIN(B6, C6 * 2, MAX(D6, 3))")
+    edit(other["A7"], "SUM(B7, C7 * 2, MAX(D7, 3), E7)")
+    found, requests = find_divergence(
+        WorkbookDigest({"S": cells}), WorkbookDigest({"S": other})
+    )
+
+    def node_id(address, *path):
+        node = cells[address].ast
+        for i in path:
+            node = node.children()[i]
+        return node.id_history[0]
+
+    assert found == [
+        Divergence("S", "A5", node_id("A5", 2, 1)),
+        Divergence("S", "A6", node_id("A6")),
+        Divergence("S", "A7", node_id("A7")),
+    ]
+    # A handful of requests per formula, not one per cell
+    assert requests < 40
+
+
+def test_cells_and_sheets_on_one_side_only():
+    cells = sheet(3 * BUCKET_SIZE)
+    other = forked(cells)
+    del other["A3"]
+    other["Z1"] = ASTManager(parse("1"))
+    found, _ = find_divergence(
+        WorkbookDigest({"S": cells, "T": sheet(1)}), WorkbookDigest({"S": other})
+    )
+    assert found == [
+        Divergence("S", "A3", None),
+        Divergence("S", "Z1", None),
+        Divergence("T", None, None),
+    ]
+
+
+def test_buckets_split_differently_on_each_side():
+    # One side has a bucket more than BUCKET_SIZE cells would split
+    cells = sheet(BUCKET_SIZE + 1)
+    fewer = forked(cells)
+    del fewer["A0"]
+    found, _ = find_divergence(
+        WorkbookDigest({"S": fewer}), WorkbookDigest({"S": cells})
+    )
+    assert found == [Divergence("S", "A0", None)]
+    found, _ = find_divergence(
+        WorkbookDigest({"S": cells}), WorkbookDigest({"S": fewer})
+    )
+    assert found == [Divergence("S", "A0", None)]
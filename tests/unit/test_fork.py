@@ -0,0 +1,137 @@
+import random
+from copy import deepcopy
+from parser.parser import parse
+
+import pytest  # pyright: ignore # noqa F401
+
+from ast_utils.index import ForkableDict
+from crdt.ast_manager import ASTManager
+from tests.utils.helpers import nodes
+
+
+def merge(original, user1_str, user2_str, copy):
+    if copy:
+        user1 = ASTManager(deepcopy(original))
+        user2 = ASTManager(deepcopy(original))
+    else:
+        user1 = ASTManager(original)
+        user2 = user1.fork()
+    user1_changes = user1.get_changes_to(user1_str)
+    user2_changes = user2.get_changes_to(user2_str)
+    user1.apply_changes(user1_changes, user_id="user_1")
+    user2.apply_changes(user2_changes, user_id="user_2")
+    user1_merged = user1.merge_changes(user2_changes)
+    user2_merged = user2.merge_changes(user1_changes)
+    user1.apply_changes(user1_merged, user_id="user_1")
+    user2.apply_changes(user2_merged, user_id="user_2")
+    return str(user1), str(user2)
+
+
+def test_forkable_dict_forks_are_independent():
+    first = ForkableDict({"a": 1, "b": 2})
+    second = first.fork()
+    first["a"] = 10
+    second.pop("b")
+    second["c"] = 3
+    assert (first.get("a"), first.get("b"), first.get("c")) == (10, 2, None)
+    assert (second.get("a"), second.get("b"), second.get("c")) == (1, None, 3)
+    assert (len(first), len(second)) == (2, 2)
+    assert "b" not in second
+
+
+def test_forkable_dict_flattens_layers():
+    d = ForkableDict()
+    for i in range(1000):
+        d[i] = i
+        d.fork()
+    assert len(d._frozen) <= 10
+    assert dict(d.items()) == {i: i for i in range(1000)}
+
+
+def test_forkable_dict_compaction_keeps_removals():
+    d = ForkableDict({i: i for i in range(8)})
+    d.fork()
+    for i in range(8):
+        d.pop(i)
+        d.fork()
+    assert len(d) == 0
+    assert list(d.items()) == []
+    assert all(i not in d for i in range(8))
+
+
+def test_fork_shares_tree_and_ids():
+    user1 = ASTManager(parse("SUM(A1, B2 * 3, C3)"))
+    user2 = user1.fork()
+    assert user2.ast is user1.ast
+    assert user2.replica_id != user1.replica_id
+
+
+def test_fork_copies_only_the_changed_path():
+    user1 = ASTManager(parse("SUM(A1, B2 * 3, C3)"))
+    original_ids = {id(node): list(node.id_history) for node in nodes(user1.ast)}
+    user2 = user1.fork()
+    user2.apply_changes(user2.get_changes_to("SUM(A1, B2 * 4, C3)"), "user_2")
+
+    assert str(user1) == "SUM(A1, B2 * 3, C3)"
+    assert str(user2) == "SUM(A1, B2 * 4, C3)"
+    # Root, the binary and the changed number are copies, the rest is shared
+    assert user2.ast is not user1.ast
+    assert user2.ast.arguments[0] is user1.ast.arguments[0]
+    assert user2.ast.arguments[2] is user1.ast.arguments[2]
+    assert user2.ast.arguments[1] is not user1.ast.arguments[1]
+    assert user2.ast.arguments[1].left is user1.ast.arguments[1].left
+    # Copies keep the ids of their originals
+    assert user2.ast.id_history == user1.ast.id_history
+    assert user2.ast.arguments[1].right.id_history[0] == (
+        user1.ast.arguments[1].right.id_history[0]
+    )
+    # Nothing in the first replica changed
+    for node in nodes(user1.ast):
+        assert node.id_history == original_ids[id(node)]
+    assert user2.index.get(user1.ast.arguments[1]) is user2.ast.arguments[1]
+
+
+def test_snapshot_is_left_untouched():
+    manager = ASTManager(parse("SUM(A1, 2)"))
+    snapshot = manager.snapshot()
+    manager.apply_changes(manager.get_changes_to("MAX(A1, 3, B1)"), "test")
+    assert str(snapshot) == "SUM(A1, 2)"
+    assert str(manager) == "MAX(A1, 3, B1)"
+
+
+@pytest.mark.parametrize(
+    "original,user1,user2",
+    [
+        ("SUM(A1)", "AVERAGE(A1)", "SUM(A1)"),
+        ("SUM(A2:A8)", "SUM(A3:A10)", "SUM(A1:A8)"),
+        ("SUM(A2:A9)", "SUM(A3:A10)", "SUM(A2:A9) / B5"),
+        ("SUM(A1, B1)", "SUM(A1, B1, C1)", "SUM(A2, B1)"),
+        ("A1 + B1", "A1 - B1", "A1 + B2"),
+    ],
+)
+def test_fork_merges_like_deepcopy(original, user1, user2):
+    assert merge(parse(original), user1, user2, copy=False) == merge(
+        parse(original), user1, user2, copy=True
+    )
+
+
+def test_repeated_forks_stay_isolated():
+    rng = random.Random(3)
+    managers = [ASTManager(parse("SUM(A1, B1, C1, D1)"))]
+    expected = ["SUM(A1, B1, C1, D1)"]
+    for _ in range(60):
+        i = rng.randrange(len(managers))
+        if rng.random() < 0.3:
+            managers.append(managers[i].fork())
+            expected.append(expected[i])
+            continue
+        args = str(managers[i].ast)[4:-1].split(", ")
+        args[rng.randrange(len(args))] = f"{rng.choice('ABCD')}{rng.randint(1, 9)}"
+        formula = f"SUM({', '.join(args)})"
+        changes = managers[i].get_changes_to(formula)
+        managers[i].apply_changes(changes, "test")
+        expected[i] = formula
+        assert [str(manager) for manager in managers] == expected
+    for manager in managers:
+        for node in nodes(manager.ast):
+            assert manager.index.get(node) is node
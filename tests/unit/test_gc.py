@@ -0,0 +1,160 @@
+import pickle
+import random
+
+import pytest  # pyright: ignore # noqa F401
+
+from crdt.ast_manager import ASTManager
+from crdt.sync import exchange, sync
+from crdt.utils import calculate_depth
+from tests.utils.helpers import edit, random_edit, replicas
+
+
+def test_stable_ids_are_dropped():
+    a, b = replicas("SUM(A1, B1)")
+    first_id = a.ast.arguments[0].id_history[0]
+    for row in range(2, 12):
+        edit(a, f"SUM(A{row}, B1)")
+    sync(a, b)
+    history = list(b.ast.arguments[0].id_history)
+    assert len(history) == 11
+    # a does not know yet that b got its edits
+    assert a.collect_garbage() == (0, 0)
+
+    collected = b.collect_garbage()
+    assert collected.ids == 9
+    assert b.ast.arguments[0].id_history == [first_id, history[-1]]
+    assert b.index.get_id(first_id) is b.ast.arguments[0]
+    assert history[5] not in b.index
+    assert a.ast.arguments[0].id_history == history
+    assert b.collect_garbage() == (0, 0)
+
+    sync(a, b)
+    assert a.collect_garbage().ids == 9
+    assert a.ast.arguments[0].id_history == b.ast.arguments[0].id_history
+
+
+def test_forks_keep_their_ids():
+    a, b = replicas("SUM(A1, B1)")
+    for row in range(2, 6):
+        edit(a, f"SUM(A{row}, B1)")
+    sync(a, b)
+    sync(a, b)
+    c = a.fork()
+    history = list(c.ast.arguments[0].id_history)
+    a.collect_garbage()
+    assert len(a.ast.arguments[0].id_history) == 2
+    assert c.ast.arguments[0].id_history == history
+
+
+def test_garbage_waits_for_every_known_replica():
+    a, b, c = replicas("SUM(A1, B1)", 3)
+    for row in range(2, 6):
+        edit(a, f"SUM(A{row}, B1)")
+    for _ in range(2):
+        sync(a, b)
+    # c has not been heard from since it was forked
+    assert a.collect_garbage() == (0, 0)
+    assert b.collect_garbage() == (0, 0)
+    for _ in range(2):
+        sync(a, c)
+    assert a.collect_garbage().ids == 3
+
+
+def test_replicas_learn_of_each_other_through_ops():
+    # b only hears of c through the ops of a
+    a, b = replicas("SUM(A1, B1)")
+    c = a.fork()
+    edit(a, "SUM(A2, B1)")
+    edit(a, "SUM(A3, B1)")
+    b.receive(a.ops_since(b.version_vector))
+    assert b.collect_garbage() == (0, 0)
+    c.receive(a.ops_since(c.version_vector))
+    edit(c, "SUM(A3, B2)")
+    b.receive(c.ops_since(b.version_vector))
+    assert b.collect_garbage().ids == 1
+
+
+def test_stable_tombstones_are_dropped():
+    a, b = replicas("SUM(A1, B1, C1)")
+    edit(a, "SUM(A1, C1)")
+    sync(a, b)
+    assert a._sequences.get(a.ast.id_history[0]) is not None
+    sync(a, b)
+    assert a.collect_garbage().tombstones == 1
+    assert a._sequences.get(a.ast.id_history[0]) is None
+    # Later inserts next to where the argument was still agree
+    edit(a, "SUM(A1, D1, C1)")
+    edit(b, "SUM(A1, E1, C1)")
+    sync(a, b)
+    assert str(a) == str(b)
+
+
+def test_garbage_is_collected_every_interval():
+    a, b = replicas("SUM(A1, B1)", gc_interval=5)
+    for row in range(2, 12):
+        edit(a, f"SUM(A{row}, B1)")
+        sync(a, b)
+    assert len(a.ast.arguments[0].id_history) < 5
+    assert len(b.ast.arguments[0].id_history) < 5
+
+    a, b = replicas("SUM(A1, B1)", gc_interval=None)
+    for row in range(2, 12):
+        edit(a, f"SUM(A{row}, B1)")
+        sync(a, b)
+    assert len(a.ast.arguments[0].id_history) == 11
+
+
+def test_depth_of_histories_truncated_as_far():
+    # The updated node is one edit ahead, the other one edit behind
+    assert calculate_depth([1, 5, 7, 9], [1, 7, 9, 11]) == 1
+    assert calculate_depth([1, 7, 9], [1, 5, 7]) == 0
+    # Not truncated, they split after the first id
+    assert calculate_depth([1, 5, 7], [1, 6, 8]) == 2
+
+
+def test_merging_changes_after_garbage_is_collected():
+    a, b = replicas("SUM(A1, B1)")
+    for row in range(2, 12):
+        edit(a, f"SUM(A{row}, B1)")
+        sync(a, b)
+        if row == 6:
+            a.collect_garbage()
+    b.collect_garbage()
+    assert a.ast.arguments[0].id_history != b.ast.arguments[0].id_history
+
+    changes = b.get_changes_to("SUM(C1, B1)")
+    b.apply_changes(changes, "b")
+    ours, theirs = a.ast.arguments[0], b.ast.arguments[0]
+    assert calculate_depth(ours.id_history, theirs.id_history) == 1
+    assert calculate_depth(theirs.id_history, ours.id_history) == 0
+    a.apply_changes(a.merge_changes(changes), "a")
+    assert str(a) == "SUM(C1, B1)"
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_collecting_garbage_changes_no_formula(seed):
+    rng = random.Random(seed)
+    managers = replicas("SUM(A1, B2, C3)", 4, gc_interval=1)
+    # Replicas of the same tree that never collect and get every op of
+    # their twin, without the others knowing of them
+    twins = [
+        ASTManager(pickle.loads(pickle.dumps(managers[0].ast)), gc_interval=None)
+        for _ in managers
+    ]
+    for _ in range(60):
+        manager = rng.choice(managers)
+        edit(manager, random_edit(rng, manager))
+        if rng.random() < 0.4:
+            first, second = rng.sample(managers, 2)
+            if rng.random() < 0.5:
+                sync(first, second)
+            else:
+                exchange(first, second)
+        for manager, twin in zip(managers, twins):
+            twin.receive(manager.ops_since(twin.version_vector))
+            assert str(manager) == str(twin)
+    for first in managers:
+        for second in managers:
+            if first is not second:
+                sync(first, second)
+    assert len({str(manager) for manager in managers}) == 1
@@ -0,0 +1,78 @@
+from parser.ids import (
+    LamportIds,
+    UuidIds,
+    get_id_scheme,
+    id_counter,
+    id_replica,
+    set_id_scheme,
+)
+from parser.parser import clear_parse_cache, parse, parse_many
+
+import pytest  # pyright: ignore # noqa F401
+
+from ast_utils.change_classes import ChildAddition
+from crdt.ast_manager import ASTManager
+
+
+def all_ids(ast):
+    ids = []
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        ids.extend(node.id_history)
+        stack.extend(child for child in node.children() if child is not None)
+    return ids
+
+
+def test_lamport_ids_pack_replica_and_counter():
+    ids = LamportIds(replica_id=7)
+    first = ids.new_id()
+    second = ids.new_id()
+    assert (id_replica(first), id_counter(first)) == (7, 1)
+    assert (id_replica(second), id_counter(second)) == (7, 2)
+    assert first < second
+
+
+def test_lamport_ids_order_by_counter_then_replica():
+    a = LamportIds(replica_id=2)
+    b = LamportIds(replica_id=1)
+    a_id = a.new_id()
+    b_id = b.new_id()
+    assert b_id < a_id
+    b.observe(a.new_id())
+    assert b.new_id() > a_id
+
+
+def test_lamport_ids_reject_oversized_replica():
+    with pytest.raises(ValueError):
+        LamportIds(replica_id=1 << 40)
+
+
+def test_id_scheme_is_pluggable():
+    previous = get_id_scheme()
+    set_id_scheme(UuidIds())
+    try:
+        clear_parse_cache()
+        ast = parse("SUM(A1, 2)")
+        assert all(isinstance(node_id, str) for node_id in all_ids(ast))
+    finally:
+        set_id_scheme(previous)
+        clear_parse_cache()
+
+
+def test_ids_are_unique_across_parse_workers():
+    results = list(parse_many(["SUM(A1, B2 * 3)"] * 64, workers=2, chunksize=8))
+    ids = [node_id for ast in results for node_id in all_ids(ast)]
+    assert len(ids) == len(set(ids))
+
+
+def test_merge_observes_remote_ids():
+    local = get_id_scheme()
+    remote = LamportIds(replica_id=1)
+    remote.counter = local.counter + 1000
+    child = parse("B1")
+    child.id_history = [remote.new_id()]
+
+    original = parse("SUM(A1, 2)")
+    ASTManager(original).merge_changes([ChildAddition(original, child)])
+    assert id_counter(local.new_id()) > remote.counter
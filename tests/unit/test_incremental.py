@@ -0,0 +1,94 @@
+import random
+from parser.incremental import formula_spans, reparse
+from parser.parser import FormulaParseError, parse
+
+import pytest  # pyright: ignore # noqa F401
+
+from crdt.ast_manager import ASTManager
+
+
+def edit(text, offset, deleted_length, inserted_text):
+    return text[:offset] + inserted_text + text[offset + deleted_length :]
+
+
+def test_formula_spans_match_str():
+    ast = parse("SUM(A1:A3, -B2 * 3, MAX(C1, 2))")
+    text, spans = formula_spans(ast)
+    assert text == str(ast)
+    assert spans[ast] == (0, len(text))
+    for node, (start, end) in spans.items():
+        assert text[start:end] == str(node)
+
+
+def test_edit_inside_argument_reparses_only_that_argument():
+    ast = parse("SUM(A1, B2 + 3, C3)")
+    first, second, third = ast.arguments
+    histories = [list(arg.id_history) for arg in ast.arguments]
+
+    offset = str(ast).index("3,")
+    node, parent, subtree = reparse(ast, offset, 1, "4")
+    assert node is second.right
+    assert parent is second
+    assert str(subtree) == "4"
+
+    manager = ASTManager(ast)
+    manager.apply_changes(manager.get_changes_for_edit(offset, 1, "4"), "test")
+    assert str(manager.ast) == "SUM(A1, B2 + 4, C3)"
+    assert manager.ast.arguments == [first, second, third]
+    assert first.id_history == histories[0]
+    assert third.id_history == histories[2]
+
+
+def test_edit_changing_precedence_widens_reparse():
+    # Replacing "+" with "*" rebinds B1, so the whole binary is parsed again
+    ast = parse("A1 + B1 * C1")
+    offset = str(ast).index("+")
+    node, parent, subtree = reparse(ast, offset, 1, "*")
+    assert node is ast
+    assert parent is None
+    assert str(subtree) == "A1 * B1 * C1"
+
+
+def test_edit_changing_argument_type():
+    ast = parse("SUM(A1, 2)")
+    manager = ASTManager(ast)
+    offset = str(ast).index("A1")
+    manager.apply_changes(manager.get_changes_for_edit(offset, 2, "7"), "test")
+    assert str(manager.ast) == "SUM(7, 2)"
+
+
+def test_invalid_edit_raises():
+    ast = parse("SUM(A1, B2)")
+    with pytest.raises(FormulaParseError):
+        reparse(ast, str(ast).index("B2"), 2, "*")
+    with pytest.raises(ValueError):
+        reparse(ast, len(str(ast)), 1, "")
+
+
+def test_edits_match_full_parse():
+    rng = random.Random(7)
+    formulas = [
+        "SUM(A1, B2, C3, 4, 5)",
+        "A1 + B2 * C3 - 4",
+        "MAX(SUM(A1:A4), -B2, 3 ^ 2)",
+        "IF(A1 > 3, B1, C1 / 2)",
+    ]
+    replacements = ["1", "9", "A5", "B7", "+", "*", "SUM(1, 2)", ""]
+    for formula in formulas:
+        for _ in range(30):
+            text = str(parse(formula))
+            offset = rng.randrange(len(text))
+            deleted_length = rng.randrange(min(3, len(text) - offset) + 1)
+            inserted_text = rng.choice(replacements)
+            expected = edit(text, offset, deleted_length, inserted_text)
+            try:
+                parse(expected)
+            except FormulaParseError:
+                continue
+
+            manager = ASTManager(parse(formula))
+            changes = manager.get_changes_for_edit(
+                offset, deleted_length, inserted_text
+            )
+            manager.apply_changes(changes, "test")
+            assert str(manager.ast) == str(parse(expected)), (text, expected)
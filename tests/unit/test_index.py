@@ -0,0 +1,74 @@
+from copy import deepcopy
+from parser.parser import parse
+
+import pytest  # pyright: ignore # noqa F401
+
+from ast_utils.custom_exceptions import NodeNotFoundError
+from ast_utils.index import NodeIndex
+from ast_utils.operations import find_node
+from crdt.ast_manager import ASTManager
+
+
+def assert_index_covers(manager):
+    # Every id of every live node is indexed, and nothing else
+    count = 0
+    stack = [manager.ast]
+    while stack:
+        node = stack.pop()
+        if node is None:
+            continue
+        for node_id in node.id_history:
+            assert node_id in manager.index
+        assert manager.index.get(node) is node
+        count += len(node.id_history)
+        stack.extend(node.children())
+    assert len(manager.index) == count
+
+
+def test_index_finds_same_nodes_as_search():
+    ast = parse("SUM(A1, B2 * -3, MAX(C1:C4, 2))")
+    index = NodeIndex(ast)
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        assert find_node(ast, node, index) is find_node(ast, node)
+        stack.extend(child for child in node.children() if child is not None)
+    with pytest.raises(NodeNotFoundError):
+        find_node(ast, parse("A1"), index)
+
+
+@pytest.mark.parametrize(
+    "original,modified",
+    [
+        ("SUM(A1, B2 * 3)", "SUM(A2, B2 * 3)"),
+        ("SUM(A1, B2 * 3)", "SUM(A1, B2 * 3, C3 + 1)"),
+        ("SUM(A1, B2 * 3, C3)", "SUM(A1, C3)"),
+        ("A1 + B1", "A1 + B1 * 2"),
+        ("SUM(A1)", "SUM(A1) + 2"),
+    ],
+)
+def test_apply_keeps_index_up_to_date(original, modified):
+    manager = ASTManager(parse(original))
+    manager.apply_changes(manager.get_changes_to(modified), "test")
+    assert str(manager) == str(parse(modified))
+    assert_index_covers(manager)
+
+
+def test_merge_uses_index():
+    original = parse("SUM(A1, B2, C3)")
+    user1 = ASTManager(deepcopy(original))
+    user2 = ASTManager(deepcopy(original))
+    user1_changes = user1.get_changes_to("SUM(A1, B5, C3)")
+    user1.apply_changes(user1_changes, "user_1")
+    user2_changes = user2.get_changes_to("SUM(A1, B2, C3, D4)")
+    user2.apply_changes(user2_changes, "user_2")
+
+    user2.apply_changes(user2.merge_changes(user1_changes), "user_2")
+    assert str(user2) == "SUM(A1, B5, C3, D4)"
+    assert_index_covers(user2)
+
+
+def test_replacing_ast_rebuilds_index():
+    manager = ASTManager(parse("SUM(A1)"))
+    manager.ast = parse("MAX(B1, B2)")
+    assert_index_covers(manager)
@@ -0,0 +1,65 @@
+from parser.parser import parse
+
+import pytest  # pyright: ignore # noqa F401
+
+from ast_utils.change_classes import ChildAddition, NodeModification
+from crdt.merge import merge_changes, merge_indexed
+from tests.utils.helpers import apply_edit, replicas
+
+
+def test_merge_matches_merge_changes():
+    user1, user2 = replicas("SUM(A1, B1 * 2, C1:C5)")
+    apply_edit(user1, "MAX(A1, B1 * 3, C1:C5, D1)", "user_1")
+    changes = apply_edit(user2, "SUM(A2, B1 * 2, C1:C9)", "user_2")
+    result = user1.merge(changes)
+    expected = merge_changes(user1.ast, changes, index=user1.index)
+    assert [type(change) for change in result.changes] == [
+        type(change) for change in expected
+    ]
+    assert result.unresolved == []
+    user1.apply_changes(result.changes, "user_1")
+    assert str(user1) == "MAX(A2, B1 * 3, C1:C9, D1)"
+
+
+def test_unresolved_changes_are_returned_not_printed(capsys):
+    user1, user2 = replicas("SUM(A1, MAX(B1, 2))")
+    apply_edit(user1, "SUM(A1)", "user_1")
+    changes = apply_edit(user2, "SUM(A1, MAX(B2, 2, 3))", "user_2")
+    result = user1.merge(changes)
+    assert merge_changes(user1.ast, changes) == []
+    assert capsys.readouterr().out == ""
+    assert result.changes == []
+    assert len(result.unresolved) == 2
+    assert {type(change) for change in result.unresolved} == {
+        NodeModification,
+        ChildAddition,
+    }
+
+
+def test_changes_are_grouped_by_target():
+    user1, user2 = replicas("SUM(A1, MAX(B1), C1)")
+    root, inner = user2.ast, user2.ast.arguments[1]
+    changes = [
+        ChildAddition(root, parse("D1"), 3),
+        ChildAddition(inner, parse("E1"), 1),
+        ChildAddition(root, parse("F1"), 4),
+    ]
+    result = merge_indexed(user1.index, changes)
+    assert [str(change.child_node) for change in result.changes] == ["D1", "F1", "E1"]
+    user1.apply_changes(result.changes, "user_1")
+    assert str(user1) == "SUM(A1, MAX(B1, E1), C1, D1, F1)"
+
+
+def test_range_changed_on_one_side_takes_the_change():
+    # Only when both replicas changed a range do their changes combine,
+    # a range left alone here takes the other change, a shrink included
+    user1, user2 = replicas("SUM(A1:B5)")
+    changes = apply_edit(user2, "SUM(A1:A3)", "user_2")
+    user1.apply_changes(user1.merge(changes).changes, "user_1")
+    assert str(user1) == "SUM(A1:A3)"
+
+    user1, user2 = replicas("SUM(A1:B5)")
+    apply_edit(user1, "SUM(A1:C5)", "user_1")
+    changes = apply_edit(user2, "SUM(A1:A3)", "user_2")
+    user1.apply_changes(user1.merge(changes).changes, "user_1")
+    assert str(user1) == "SUM(A1:C5)"
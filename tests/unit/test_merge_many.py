@@ -0,0 +1,116 @@
+from itertools import permutations
+from parser.parser import parse
+
+import pytest  # pyright: ignore # noqa F401
+
+from crdt.ast_manager import ASTManager
+from tests.utils.helpers import apply_edit, replicas
+
+
+def edit_replicas(base, edits):
+    # The common tree and the change sets of one replica per edit
+    common, *forks = replicas(base, len(edits) + 1)
+    return common, [apply_edit(fork, formula) for fork, formula in zip(forks, edits)]
+
+
+def merge(common, change_sets):
+    hub = common.fork()
+    result = hub.merge_replicas(change_sets)
+    hub.apply_changes(result.changes, "hub")
+    return hub, result
+
+
+def converge(base, edits):
+    return merge(*edit_replicas(base, edits))
+
+
+def test_edits_to_different_nodes_all_apply():
+    hub, result = converge(
+        "SUM(A1, B1, C1)",
+        ["SUM(A2, B1, C1)", "SUM(A1, B2, C1)", "MAX(A1, B1, C1)"],
+    )
+    assert str(hub) == "MAX(A2, B2, C1)"
+    assert result.unresolved == []
+
+
+def test_latest_modification_wins():
+    common, change_sets = edit_replicas("SUM(A1)", ["SUM(A2)", "SUM(A3)", "SUM(A4)"])
+    latest = max(
+        (changes[0].new_node for changes in change_sets),
+        key=lambda node: node.timestamp,
+    )
+    hub, _ = merge(common, change_sets)
+    assert str(hub) == f"SUM({latest})"
+
+
+def test_ranges_changed_by_several_replicas_are_covered():
+    hub, _ = converge("SUM(B2:B5)", ["SUM(B1:B5)", "SUM(B2:B8)", "SUM(C2:C5)"])
+    assert str(hub) == "SUM(B1:C8)"
+
+
+def test_shared_deletion_happens_once():
+    hub, _ = converge("SUM(A1, B1, C1)", ["SUM(A1, C1)", "SUM(A1, C1)"])
+    assert str(hub) == "SUM(A1, C1)"
+
+
+def test_additions_of_all_replicas_are_kept():
+    hub, _ = converge(
+        "SUM(A1, B1)", ["SUM(A1, B1, C1)", "SUM(A1, B1, D1)", "SUM(E1, A1, B1)"]
+    )
+    assert str(hub) in ("SUM(E1, A1, B1, C1, D1)", "SUM(E1, A1, B1, D1, C1)")
+
+
+def test_latest_replacement_of_an_operand_wins():
+    common, change_sets = edit_replicas(
+        "SUM(A1) + B1", ["A1:B2 + B1", "5 + B1", "SUM(A1) + C2"]
+    )
+    first, second = (changes[1].child_node for changes in change_sets[:2])
+    latest = max(first, second, key=lambda node: node.timestamp)
+    hub, result = merge(common, change_sets)
+    assert str(hub) == f"{latest} + C2"
+    assert [change.child_node for change in result.unresolved] == [
+        min(first, second, key=lambda node: node.timestamp)
+    ]
+
+
+@pytest.mark.parametrize(
+    "others, expected, unresolved",
+    [([], "D2 * 2", 0), (["C3 * 4"], "D2 * 4", 0), (["C3 * 4", "5 * 2"], "D2 * 4", 1)],
+)
+def test_operand_replaced_twice_by_one_replica(others, expected, unresolved):
+    # The first replacement was deleted again on that replica and does not
+    # compete with anything, the second one is the latest of all
+    common, change_sets = edit_replicas("C3 * 2", others)
+    replica = common.fork()
+    changes = apply_edit(replica, "MIN(C1, C2) * 2")
+    changes += apply_edit(replica, "D2 * 2")
+    for order in permutations(change_sets + [changes]):
+        hub, result = merge(common, list(order))
+        assert str(hub) == expected
+        assert len(result.unresolved) == unresolved
+
+
+def test_result_does_not_depend_on_the_order_of_change_sets():
+    base = "SUM(A1, B1 * 2, C1:C3)"
+    edits = [
+        "SUM(A2, B1 * 2, C1:C3, D1)",
+        "SUM(A3, B1 * 5, C1:C4)",
+        "MAX(A1, B1 * 2, C2:C3, E1)",
+    ]
+    common, change_sets = edit_replicas(base, edits)
+    results = {
+        str(merge(common, [change_sets[i] for i in order])[0])
+        for order in permutations(range(3))
+    }
+    assert len(results) == 1
+
+
+def test_changes_to_missing_nodes_are_unresolved():
+    hub = ASTManager(parse("SUM(A1, MAX(B1, 2))"))
+    replica = hub.fork()
+    changes = replica.get_changes_to("SUM(A1, MAX(B2, 2))")
+    replica.apply_changes(changes, "user")
+    hub.apply_changes(hub.get_changes_to("SUM(A1)"), "hub")
+    result = hub.merge_replicas([changes])
+    assert result.changes == []
+    assert len(result.unresolved) == 1
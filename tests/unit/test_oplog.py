@@ -0,0 +1,136 @@
+import json
+import pickle
+import random
+from parser.nodes import Cell, Function
+
+import pytest  # pyright: ignore # noqa F401
+
+from ast_utils.change_classes import ChildAddition
+from crdt.oplog import Op
+from tests.utils.helpers import nodes, random_edit, receive_all, replicas
+
+
+def test_concurrent_edits_converge():
+    a, b = replicas("SUM(A1, B2, C3)")
+    a.commit(a.get_changes_to("SUM(A1, D4, B2, C3, 1)"), "a")
+    b.commit(b.get_changes_to("MAX(A1, B2, E5)"), "b")
+    receive_all([a, b])
+    assert str(a) == str(b) == "MAX(A1, D4, B2, E5, 1)"
+
+
+def test_concurrent_inserts_at_one_place_keep_one_order():
+    a, b, c = replicas("SUM(A1, B1)", 3)
+    a.commit(a.get_changes_to("SUM(A1, C1, B1)"), "a")
+    b.commit(b.get_changes_to("SUM(A1, C2, B1)"), "b")
+    c.commit(c.get_changes_to("SUM(A1, C3, B1)"), "c")
+    receive_all([c, b, a])
+    assert str(a) == str(b) == str(c)
+    assert str(a).startswith("SUM(A1, ") and str(a).endswith(", B1)")
+
+
+def test_insert_next_to_concurrently_deleted_argument():
+    a, b = replicas("SUM(A1, B1, C1)")
+    a.commit(a.get_changes_to("SUM(A1, C1)"), "a")
+    b.commit(b.get_changes_to("SUM(A1, B1, D1, C1)"), "b")
+    receive_all([a, b])
+    assert str(a) == str(b) == "SUM(A1, D1, C1)"
+
+
+def test_later_modification_wins():
+    a, b = replicas("SUM(A1)")
+    [op_a] = a.commit(a.get_changes_to("SUM(A2)"), "a")
+    [op_b] = b.commit(b.get_changes_to("SUM(A3)"), "b")
+    receive_all([a, b])
+    latest = "A2" if op_a.data[2] > op_b.data[2] else "A3"
+    assert str(a) == str(b) == f"SUM({latest})"
+    assert a.ast.arguments[0].id_history == b.ast.arguments[0].id_history
+
+
+def test_concurrent_replacements_of_an_operand_keep_the_latest():
+    a, b, c = replicas("SUM(A1) + B1", 3)
+    a.commit(a.get_changes_to("A1:B2 + B1"), "a")
+    b.commit(b.get_changes_to("MAX(C1) + B1"), "b")
+    # c replaces the operand after it got the replacement of a
+    c.receive(a.ops_since(c.version_vector))
+    c.commit(c.get_changes_to("D1 + B1"), "c")
+    receive_all([b, a, c])
+    assert str(a) == str(b) == str(c) in ("MAX(C1) + B1", "D1 + B1")
+    assert a.ast.left.id_history == b.ast.left.id_history == c.ast.left.id_history
+
+
+def test_concurrent_new_roots_stack_up():
+    a, b = replicas("SUM(A1)")
+    a.commit(a.get_changes_to("SUM(A1) + 1"), "a")
+    b.commit(b.get_changes_to("-SUM(A1)"), "b")
+    receive_all([a, b])
+    assert str(a) == str(b)
+
+
+def test_receiving_ops_twice_changes_nothing():
+    a, b = replicas("SUM(A1, B1)")
+    ops = a.commit(a.get_changes_to("SUM(A1, B1, C1)"), "a")
+    assert b.receive(ops) == 1
+    assert b.receive(ops) == 0
+    assert str(b) == "SUM(A1, B1, C1)"
+
+
+def test_ops_wait_for_their_dependencies():
+    a, b = replicas("SUM(A1)")
+    first = a.commit(a.get_changes_to("SUM(A1, B1)"), "a")
+    second = a.commit(a.get_changes_to("SUM(A1, B1, C1)"), "a")
+    assert b.receive(second) == 0
+    assert b.log.pending == 1
+    assert str(b) == "SUM(A1)"
+    assert b.receive(first) == 2
+    assert b.log.pending == 0
+    assert str(b) == "SUM(A1, B1, C1)"
+
+
+def test_ops_since_sends_only_what_is_missing():
+    a, b = replicas("SUM(A1)")
+    a.commit(a.get_changes_to("SUM(A1, B1)"), "a")
+    b.receive(a.ops_since(b.version_vector))
+    a.commit(a.get_changes_to("SUM(A1, B1, C1)"), "a")
+    missing = a.ops_since(b.version_vector)
+    assert [(op.replica, op.counter) for op in missing] == [(a.replica_id, 2)]
+    assert a.ops_since(a.version_vector) == []
+
+
+def test_ops_survive_serialization():
+    a, b, c = replicas("SUM(A1, B1:B2)", 3)
+    ops = a.commit(a.get_changes_to("SUM(A1, B1:B3, 2) * 3"), "a")
+    b.receive(pickle.loads(pickle.dumps(ops)))
+    c.receive([Op(*op) for op in json.loads(json.dumps(ops))])
+    assert str(a) == str(b) == str(c)
+
+
+def test_subtrees_nested_past_the_recursion_limit_are_sent():
+    a, b = replicas("SUM(A1)")
+    deep = Cell("B", 1, "a")
+    for _ in range(2000):
+        deep = Function("SUM", [deep], "a")
+    ops = a.commit([ChildAddition(a.ast, deep, 1)], "a")
+    b.receive(ops)
+    assert len(nodes(b.ast)) == 2003
+    assert b.digest() == a.digest()
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_edits_converge(seed):
+    rng = random.Random(seed)
+    managers = replicas("SUM(A1, MAX(B2, 3), C3 * 2)", 3)
+    sent = [[] for _ in managers]
+    for _ in range(30):
+        i = rng.randrange(len(managers))
+        manager = managers[i]
+        sent[i] += manager.commit(
+            manager.get_changes_to(random_edit(rng, manager)), "u"
+        )
+        if rng.random() < 0.3:
+            # Some ops arrive early, out of order or twice
+            ops = list(rng.choice(sent))
+            rng.shuffle(ops)
+            rng.choice(managers).receive(ops[: rng.randrange(len(ops) + 1)])
+    receive_all(managers)
+    assert len({str(manager) for manager in managers}) == 1
+    assert all(manager.log.pending == 0 for manager in managers)
@@ -1,6 +1,14 @@
 from parser.nodes import Function  # Name,
 from parser.nodes import Binary, Cell, CellRange, Logical, Number, Unary
-from parser.parser import FormulaParseError, parse
+from parser.parser import (
+    FormulaParseError,
+    _tokenize,
+    clear_parse_cache,
+    parse,
+    parse_cache_info,
+    parse_many,
+    set_parse_cache_size,
+)
 
 import pytest  # pyright: ignore # noqa F401
 
@@ -85,3 +93,173 @@ def test_parse_error_incomplete_function_call():
 def test_parse_error_incomplete_expression():
     with pytest.raises(FormulaParseError):
         parse("A1 + ")  # Incomplete expression
+
+
+def test_tokenize_kinds_and_offsets():
+    tokens = _tokenize("SUM(A1:B2, 1.5e-3) >= TRUE")
+    assert [token.kind for token in tokens] == [
+        "NAME",
+        "LPAREN",
+        "CELL",
+        "COLON",
+        "CELL",
+        "COMMA",
+        "NUMBER",
+        "RPAREN",
+        "OP",
+        "LOGICAL",
+    ]
+    assert [token.offset for token in tokens] == [0, 3, 4, 6, 7, 9, 11, 17, 19, 22]
+    assert tokens[2].value == ("A", 1)
+    assert tokens[6].value == 1.5e-3
+    assert tokens[8].text == ">="
+
+
+def test_tokenize_out_of_range_cell_is_name():
+    tokens = _tokenize("XFE1 + A0")
+    assert tokens[0].kind == "NAME"
+    assert tokens[2].kind == "NAME"
+
+
+def test_parse_comparison_operators():
+    for op in ["=", "<", ">", "<=", ">=", "<>"]:
+        ast = parse(f"A1 {op} B1")
+        assert isinstance(ast, Binary)
+        assert ast.op == op
+
+
+def test_parse_scientific_number():
+    ast = parse("1e-5 + B1")
+    assert isinstance(ast, Binary)
+    assert ast.left.value == 1e-5
+
+
+def test_parse_error_unknown_operator():
+    with pytest.raises(FormulaParseError, match="Unknown operator &"):
+        parse("A1 & B1")
+
+
+def test_parse_long_argument_list():
+    ast = parse("SUM(" + ", ".join(f"A{i}" for i in range(1, 5001)) + ")")
+    assert isinstance(ast, Function)
+    assert len(ast.arguments) == 5000
+    assert ast.arguments[-1].row == 5000
+
+
+def test_parse_operator_precedence_and_associativity():
+    ast = parse("1 - 2 - 3 * 4 ^ 5")
+    assert ast.op == "-"
+    assert ast.left.op == "-"
+    assert ast.right.op == "*"
+    assert ast.right.right.op == "^"
+
+    ast = parse("2 ^ 3 ^ 4")
+    assert ast.left.op == "^"
+    assert ast.right.value == 4
+
+
+def test_parse_long_binary_chain():
+    ast = parse("+".join(f"A{i}" for i in range(1, 5001)))
+    assert isinstance(ast, Binary)
+    assert ast.right.row == 5000
+    assert ast.left.right.row == 4999
+
+
+def test_parse_deeply_nested_formula():
+    formula = "IF(A1, " * 10000 + "B1" + ", 0)" * 10000
+    ast = parse(formula)
+    assert isinstance(ast, Function)
+    assert str(ast) == formula
+    assert repr(parse("-" * 10000 + "A1")).startswith("Unary(op='-', expr=Unary(")
+
+
+def test_nodes_have_no_instance_dict():
+    ast = parse("SUM(A1:B2, -3, X1 + 2)")
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        assert not hasattr(node, "__dict__")
+        stack.extend(child for child in node.children() if child is not None)
+
+
+def test_node_content_and_type_follow_fields():
+    ast = parse("SUM(A1:B2, -3)")
+    assert ast.node_type == "Function"
+    assert ast.node_content == "Func[SUM]"
+    assert ast.arguments[0].node_content == "Range[A1][B2]"
+    assert ast.arguments[1].node_content == "Unary[-]"
+    ast.func_name = "MAX"
+    assert ast.node_content == "Func[MAX]"
+    assert ast.clone().node_content == "Func[MAX]"
+    assert ast.clone().arguments[1].position == 1
+
+
+###############
+# Parse cache #
+###############
+
+
+def test_parse_cache_returns_fresh_clones():
+    clear_parse_cache()
+    first = parse("SUM(A1:B2, C3) * 2")
+    second = parse("SUM(A1:B2,   C3)  * 2")
+    assert str(first) == str(second)
+    assert first is not second
+    assert first.left.arguments[0].start is not second.left.arguments[0].start
+    assert first.id_history != second.id_history
+    assert second.left.parent is second
+    assert second.left.arguments[1].parent is second.left
+    info = parse_cache_info()
+    assert (info.hits, info.misses, info.currsize) == (1, 1, 1)
+
+
+def test_parse_cache_template_is_not_shared():
+    clear_parse_cache()
+    first = parse("SUM(A1)")
+    first.arguments[0].row = 5
+    first.arguments.append(parse("B1"))
+    assert str(parse("SUM(A1)")) == "SUM(A1)"
+
+
+def test_parse_cache_evicts_least_recently_used():
+    clear_parse_cache()
+    set_parse_cache_size(2)
+    try:
+        parse("A1")
+        parse("A2")
+        parse("A1")
+        parse("A3")
+        parse("A2")
+        info = parse_cache_info()
+        assert (info.hits, info.misses, info.currsize) == (1, 4, 2)
+    finally:
+        set_parse_cache_size(1024)
+        clear_parse_cache()
+
+
+##############
+# Batch API  #
+##############
+
+
+def test_parse_many_keeps_input_order():
+    codes = [f"SUM(A{i}, {i})" for i in range(1, 40)] + ["SUM("] + ["B1 * 2"]
+    results = list(parse_many(codes, workers=2, chunksize=7))
+    assert [str(result) for result in results[:39]] == [
+        f"SUM(A{i}, {i})" for i in range(1, 40)
+    ]
+    assert isinstance(results[39], FormulaParseError)
+    assert str(results[40]) == "B1 * 2"
+
+
+def test_parse_many_unordered_yields_indices():
+    codes = [f"A{i} + 1" for i in range(1, 30)]
+    results = dict(parse_many(codes, workers=2, chunksize=4, ordered=False))
+    assert sorted(results) == list(range(len(codes)))
+    assert all(str(results[i]) == codes[i] for i in results)
+
+
+def test_parse_many_serial():
+    results = list(parse_many(iter(["A1", "A1 +"]), workers=1))
+    assert str(results[0]) == "A1"
+    assert isinstance(results[1], FormulaParseError)
@@ -0,0 +1,96 @@
+from parser.parser import parse
+
+import pytest  # pyright: ignore # noqa F401
+
+from crdt.ast_manager import ASTManager
+from tests.utils.helpers import apply_edit, nodes
+
+
+def test_every_change_adds_a_version():
+    manager = ASTManager(parse("SUM(A1, 2)"), persistent=True)
+    assert manager.version == 0
+    apply_edit(manager, "MAX(A1, 3)")
+    assert manager.version == 2
+    assert [str(root) for root in manager.versions] == [
+        "SUM(A1, 2)",
+        "MAX(A1, 2)",
+        "MAX(A1, 3)",
+    ]
+
+
+def test_versions_share_untouched_subtrees():
+    manager = ASTManager(parse("SUM(A1 * 2, B1 * 3, C1)"), persistent=True)
+    first = manager.ast
+    apply_edit(manager, "SUM(A1 * 2, B1 * 4, C1)")
+    assert manager.ast is not first
+    assert manager.ast.arguments[0] is first.arguments[0]
+    assert manager.ast.arguments[2] is first.arguments[2]
+    assert manager.ast.arguments[1].left is first.arguments[1].left
+    assert str(first) == "SUM(A1 * 2, B1 * 3, C1)"
+
+
+def test_rollback_restores_an_earlier_version():
+    manager = ASTManager(parse("SUM(A1, 2)"), persistent=True)
+    apply_edit(manager, "SUM(A1, 2, B1)")
+    apply_edit(manager, "MAX(A2, 2, B1)")
+    manager.rollback(1)
+    assert str(manager) == "SUM(A1, 2, B1)"
+    assert manager.version == 1
+
+    apply_edit(manager, "SUM(A1, 5, B1)")
+    assert str(manager) == "SUM(A1, 5, B1)"
+    assert str(manager.versions[1]) == "SUM(A1, 2, B1)"
+    for node in nodes(manager.ast):
+        assert manager.index.get(node) is node
+
+    manager.rollback(0)
+    assert str(manager) == "SUM(A1, 2)"
+    for node in nodes(manager.ast):
+        assert manager.index.get(node) is node
+
+
+def test_rollback_accepts_negative_versions():
+    manager = ASTManager(parse("SUM(A1)"), persistent=True)
+    apply_edit(manager, "SUM(A2)")
+    apply_edit(manager, "SUM(A3)")
+    manager.rollback(-2)
+    assert str(manager) == "SUM(A2)"
+    with pytest.raises(IndexError):
+        manager.rollback(5)
+
+
+def test_rollback_needs_persistent_mode():
+    manager = ASTManager(parse("SUM(A1)"))
+    assert manager.versions == []
+    with pytest.raises(Exception, match="persistent"):
+        manager.rollback(0)
+
+
+def test_rollback_stops_at_the_latest_op():
+    manager = ASTManager(parse("SUM(A1)"), persistent=True)
+    other = manager.fork()
+    apply_edit(manager, "SUM(A1, B1)")
+    manager.commit(manager.get_changes_to("SUM(A1, B1, C1)"), "test")
+    apply_edit(manager, "SUM(A2, B1, C1)")
+    with pytest.raises(Exception, match="ops"):
+        manager.rollback(1)
+    manager.rollback(2)
+    assert str(manager) == "SUM(A1, B1, C1)"
+
+    other.receive(manager.ops_since(other.version_vector))
+    with pytest.raises(Exception, match="ops"):
+        other.rollback(0)
+    assert str(other) == "SUM(A1, C1)"
+
+
+def test_merge_after_rollback():
+    user1 = ASTManager(parse("SUM(A1, B1)"), persistent=True)
+    user2 = user1.fork()
+    apply_edit(user1, "SUM(A1, B1, C1)")
+    user1.rollback(0)
+
+    user2_changes = user2.get_changes_to("SUM(A1, B2)")
+    user2.apply_changes(user2_changes, "user_2")
+    user1.apply_changes(user1.merge_changes(user2_changes), "user_1")
+    assert str(user1) == "SUM(A1, B2)"
+    assert [str(root) for root in user1.versions] == ["SUM(A1, B1)", "SUM(A1, B2)"]
@@ -0,0 +1,120 @@
+import random
+from parser.parser import parse
+
+import pytest  # pyright: ignore # noqa F401
+
+from ast_utils.change_classes import ChildAddition, ChildDeletion
+from crdt.ast_manager import ASTManager
+from crdt.sequence import Sequence
+from crdt.sync import sync
+
+
+def insert_into(entries, left, key, present=True):
+    # The tuple the sequence stands for, with key inserted the RGA way
+    i = 0
+    if left is not None:
+        i = next(
+            (j + 1 for j, (node_id, _) in enumerate(entries) if node_id == left),
+            len(entries),
+        )
+    while i < len(entries) and entries[i][0] > key:
+        i += 1
+    index = sum(1 for _, present in entries[:i] if present)
+    return entries[:i] + ((key, present),) + entries[i:], index
+
+
+def test_sequence_of_ids():
+    sequence = Sequence([(1, True), (2, False), (5, True)])
+    assert list(sequence) == [(1, True), (2, False), (5, True)]
+    assert len(sequence) == 3 and sequence.present() == 2
+    assert sequence.index(5) == 1
+    assert sequence.index(2) is None
+
+    # Past the greater ids after 1, the tombstone stops it all the same
+    assert sequence.insert(1, 4) == 1
+    assert sequence.insert(1, 3) == 2
+    assert list(sequence) == [(1, True), (4, True), (3, True), (2, False), (5, True)]
+    assert sequence.insert(None, 6, present=False) == 0
+    assert sequence.insert(7, 0) == 4
+
+    assert sequence.remove(3) == 2
+    assert sequence.remove(3) is None
+    assert sequence.index(5) == 2
+    assert list(sequence.copy()) == list(sequence)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_sequence_matches_tuples(seed):
+    rng = random.Random(seed)
+    entries = tuple((key, rng.random() < 0.8) for key in rng.sample(range(100), 10))
+    sequence = Sequence(entries)
+    for key in range(100, 400):
+        if rng.random() < 0.6 or not entries:
+            left = rng.choice([None, -1] + [node_id for node_id, _ in entries])
+            present = rng.random() < 0.8
+            entries, index = insert_into(entries, left, key, present)
+            assert sequence.insert(left, key, present) == index
+        else:
+            removed = rng.choice(entries)[0]
+            there = [node_id for node_id, present in entries if present]
+            index = there.index(removed) if removed in there else None
+            assert sequence.remove(removed) == index
+            entries = tuple(
+                (node_id, present and node_id != removed)
+                for node_id, present in entries
+            )
+        assert tuple(sequence) == entries
+    assert sequence.present() == sum(present for _, present in entries)
+
+
+def test_forks_change_their_own_sequence():
+    a = ASTManager(parse("CHOOSE(1, A1, B1)"))
+    a.commit(a.get_changes_to("CHOOSE(1, A1, C1, B1)"), "a")
+    b = a.fork()
+    key = a.ast.id_history[0]
+    assert a._sequences.get(key) is b._sequences.get(key)
+    a.commit(a.get_changes_to("CHOOSE(1, C1, B1)"), "a")
+    b.commit(b.get_changes_to("CHOOSE(1, A1, C1, B1, D1)"), "b")
+    assert a._sequences.get(key).present() == 3
+    assert b._sequences.get(key).present() == 5
+    sync(a, b)
+    assert str(a) == str(b) == "CHOOSE(1, C1, B1, D1)"
+
+
+def test_concurrent_changes_at_one_position_converge():
+    a = ASTManager(parse("CHOOSE(1, A1, B1)"))
+    b = a.fork()
+    ours = a.get_changes_to("CHOOSE(1, A1, X1, B1)")
+    a.apply_changes(ours, "a")
+    theirs = b.get_changes_to("CHOOSE(1, A1, Y1, B1)")
+    b.apply_changes(theirs, "b")
+    a.apply_changes(a.merge_changes(theirs), "a")
+    b.apply_changes(b.merge_changes(ours), "b")
+    assert str(a) == str(b)
+    assert str(a) in ("CHOOSE(1, A1, X1, Y1, B1)", "CHOOSE(1, A1, Y1, X1, B1)")
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_wide_argument_lists_converge(seed):
+    rng = random.Random(seed)
+    cells = ", ".join(f"A{i}" for i in range(1, 301))
+    managers = [ASTManager(parse(f"SWITCH(A1, {cells})"), gc_interval=7)]
+    managers += [managers[0].fork() for _ in range(2)]
+    for _ in range(60):
+        manager = rng.choice(managers)
+        arguments = manager.ast.arguments
+        if rng.random() < 0.5 or len(arguments) < 3:
+            child = parse(f"B{rng.randrange(1, 100)}")
+            position = rng.randrange(1, len(arguments) + 1)
+            change = ChildAddition(manager.ast, child, position)
+        else:
+            child = arguments[rng.randrange(1, len(arguments))]
+            change = ChildDeletion(manager.ast, child)
+        manager.commit([change], "user")
+        if rng.random() < 0.3:
+            sync(*rng.sample(managers, 2))
+    for first in managers:
+        for second in managers:
+            if first is not second:
+                sync(first, second)
+    assert len({str(manager) for manager in managers}) == 1
@@ -0,0 +1,62 @@
+import pickle
+from parser.nodes import Cell
+from parser.parser import parse
+
+import pytest  # pyright: ignore # noqa F401
+
+from ast_processing.apply_changes import apply_changes_to_ast
+from ast_processing.compare_asts import compare_asts
+
+
+def test_hash_depends_on_structure_not_ids():
+    assert parse("SUM(A1, B2 * 3)").structural_hash() == (
+        parse("SUM(A1, B2 * 3)").structural_hash()
+    )
+    assert parse("SUM(A1, B2 * 3)").structural_hash() != (
+        parse("SUM(A1, B2 * 4)").structural_hash()
+    )
+    assert parse("A1 - B1").structural_hash() != parse("B1 - A1").structural_hash()
+    assert parse("1").structural_hash() != parse("TRUE").structural_hash()
+
+
+@pytest.mark.parametrize(
+    "original,modified",
+    [
+        ("SUM(A1, B2 * 3)", "SUM(A1, B2 * 4)"),
+        ("SUM(A1, B2 * 3)", "MAX(A1, B2 * 3)"),
+        ("SUM(A1, B2 * 3)", "SUM(A1, B2 * 3, C3)"),
+        ("SUM(A1, B2 * 3, C3)", "SUM(A1, B2 * 3)"),
+        ("SUM(A1:A3, 2)", "SUM(A1:A4, 2)"),
+        ("A1 + B1", "A1 + B1 * 2"),
+        ("SUM(A1)", "SUM(A1) + 2"),
+    ],
+)
+def test_changes_invalidate_cached_hashes(original, modified):
+    original_ast = parse(original)
+    original_ast.structural_hash()
+    changes = compare_asts(original_ast, parse(modified))
+    result = apply_changes_to_ast(original_ast, changes, user_id="test")
+    assert str(result) == str(parse(modified))
+    assert result.structural_hash() == parse(modified).structural_hash()
+
+
+def test_compare_skips_identical_subtrees(monkeypatch):
+    calls = []
+    compare_content = Cell.compare_content
+
+    def counting(self, other_node):
+        calls.append(self)
+        return compare_content(self, other_node)
+
+    monkeypatch.setattr(Cell, "compare_content", counting)
+    formula = "SUM(" + ", ".join(f"A{i} * B{i}" for i in range(1, 50)) + ", C1)"
+    changes = compare_asts(parse(formula), parse(formula.replace("C1", "C2")))
+    assert len(changes) == 1
+    assert len(calls) == 1
+
+
+def test_hash_is_not_pickled():
+    ast = parse("SUM(A1, 2)")
+    ast.structural_hash()
+    copy = pickle.loads(pickle.dumps(ast))
+    assert copy.structural_hash() == parse("SUM(A1, 2)").structural_hash()
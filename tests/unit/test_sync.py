@@ -0,0 +1,109 @@
+import random
+
+import pytest  # pyright: ignore # noqa F401
+
+from crdt.oplog import SKIP, TOMBSTONE
+from crdt.sync import exchange, sync
+from tests.utils.helpers import random_edit, replicas
+
+
+def test_sync_brings_both_sides_to_one_state():
+    a, b = replicas("SUM(A1, B1, C1)")
+    a.commit(a.get_changes_to("SUM(A1, D1, B1, C1)"), "a")
+    b.commit(b.get_changes_to("MAX(A1, C1)"), "b")
+    assert sync(a, b) == (1, 2)
+    assert str(a) == str(b) == "MAX(A1, D1, C1)"
+    assert a.version_vector == b.version_vector
+
+
+def test_sync_again_sends_nothing():
+    a, b = replicas("SUM(A1)")
+    a.commit(a.get_changes_to("SUM(A2)"), "a")
+    sync(a, b)
+    assert sync(a, b) == (0, 0)
+    assert sync(b, a) == (0, 0)
+
+
+def test_repeated_modifications_are_sent_once():
+    a, b = replicas("SUM(A1, B1)")
+    for row in range(2, 50):
+        a.commit(a.get_changes_to(f"SUM(A{row}, B1)"), "a")
+    delta = a.delta_since(b.version_vector)
+    assert [op.kind for op in delta] == [SKIP, "modify"]
+    exchange(a, b)
+    assert str(b) == "SUM(A49, B1)"
+    assert b.ast.arguments[0].id_history == a.ast.arguments[0].id_history
+
+
+def test_deleted_additions_are_sent_as_tombstones():
+    a, b = replicas("SUM(A1, B1)")
+    a.commit(a.get_changes_to("SUM(A1, MAX(C1, C2, C3), B1)"), "a")
+    a.commit(a.get_changes_to("SUM(A1, MAX(C1, C4, C3), B1)"), "a")
+    a.commit(a.get_changes_to("SUM(A1, B1)"), "a")
+    delta = a.delta_since(b.version_vector)
+    assert [op.kind for op in delta] == [TOMBSTONE, SKIP, "delete"]
+    exchange(a, b)
+    assert str(b) == "SUM(A1, B1)"
+
+
+def test_insert_next_to_argument_sent_as_tombstone():
+    # c saw D1 before a deleted it, b only gets its tombstone
+    a, b, c = replicas("SUM(A1, B1)", 3)
+    a.commit(a.get_changes_to("SUM(A1, D1, B1)"), "a")
+    exchange(a, c)
+    c.commit(c.get_changes_to("SUM(A1, D1, E1, B1)"), "c")
+    a.commit(a.get_changes_to("SUM(A1, F1, B1)"), "a")
+    exchange(a, b)
+    for first, second in [(a, c), (b, c), (a, b)]:
+        sync(first, second)
+    assert str(a) == str(b) == str(c)
+
+
+def test_concurrent_replacements_of_an_operand_converge():
+    # The first replacement of a goes out as a tombstone, the second one
+    # is the latest of all
+    a, b = replicas("SUM(A1) + B1")
+    a.commit(a.get_changes_to("A1:B2 + B1"), "a")
+    b.commit(b.get_changes_to("MAX(C1) + B1"), "b")
+    a.commit(a.get_changes_to("D1 + B1"), "a")
+    delta = a.delta_since(b.version_vector)
+    assert TOMBSTONE in [op.kind for op in delta]
+    sync(a, b)
+    assert str(a) == str(b) == "D1 + B1"
+    assert a.digest() == b.digest()
+
+
+def test_receiving_a_delta_twice_changes_nothing():
+    a, b = replicas("SUM(A1, B1)")
+    a.commit(a.get_changes_to("SUM(A1, B1, C1)"), "a")
+    delta = a.delta_since(b.version_vector)
+    b.receive(delta)
+    assert b.receive(delta) == 0
+    assert str(b) == "SUM(A1, B1, C1)"
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_syncs_converge(seed):
+    rng = random.Random(seed)
+    managers = replicas("SUM(A1, MAX(B2, 3), C3 * 2)", 4)
+    for _ in range(40):
+        manager = rng.choice(managers)
+        manager.commit(manager.get_changes_to(random_edit(rng, manager)), "u")
+        if rng.random() < 0.3:
+            first, second = rng.sample(managers, 2)
+            roll = rng.random()
+            if roll < 0.3:
+                sync(first, second)
+            elif roll < 0.6:
+                exchange(first, second)
+            else:
+                # Deltas mix with ops that arrive on their own
+                ops = first.ops_since(second.version_vector)
+                rng.shuffle(ops)
+                second.receive(ops[: rng.randrange(len(ops) + 1)])
+    for first in managers:
+        for second in managers:
+            if first is not second:
+                sync(first, second)
+    assert len({str(manager) for manager in managers}) == 1
+    assert all(manager.log.pending == 0 for manager in managers)
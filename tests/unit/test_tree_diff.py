@@ -0,0 +1,123 @@
+import random
+from parser.parser import parse
+
+import pytest  # pyright: ignore # noqa F401
+
+from ast_processing.align import align
+from ast_processing.compare_asts import compare_asts
+from ast_processing.tree_diff import tree_diff
+from ast_utils.change_classes import ChildAddition, ChildDeletion, NodeModification
+from crdt.ast_manager import ASTManager
+
+
+def apply(original, modified):
+    manager = ASTManager(parse(original), diff_engine=tree_diff)
+    changes = manager.get_changes_to(modified)
+    manager.apply_changes(changes, "test")
+    return changes, str(manager)
+
+
+def lcs_length(a, b):
+    table = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+    for i in reversed(range(len(a))):
+        for j in reversed(range(len(b))):
+            if a[i] == b[j]:
+                table[i][j] = table[i + 1][j + 1] + 1
+            else:
+                table[i][j] = max(table[i + 1][j], table[i][j + 1])
+    return table[0][0]
+
+
+def test_align_finds_a_longest_common_subsequence():
+    rng = random.Random(7)
+    for _ in range(500):
+        a = [rng.randint(0, 4) for _ in range(rng.randint(0, 12))]
+        b = [rng.randint(0, 4) for _ in range(rng.randint(0, 12))]
+        pairs = align(a, b)
+        assert all(a[i] == b[j] for i, j in pairs)
+        assert all(p[0] < q[0] and p[1] < q[1] for p, q in zip(pairs, pairs[1:]))
+        assert len(pairs) == lcs_length(a, b)
+
+
+def test_insert_at_the_front_is_one_change():
+    args = ", ".join(f"A{i}" for i in range(1, 201))
+    changes, result = apply(f"SUM({args})", f"SUM(B1, {args})")
+    assert result == f"SUM(B1, {args})"
+    assert len(changes) == 1
+    assert isinstance(changes[0], ChildAddition)
+    assert changes[0].position == 0
+
+
+def test_delete_in_the_middle_is_one_change():
+    changes, result = apply("SUM(A1, B1 * 2, C1, D1)", "SUM(A1, C1, D1)")
+    assert result == "SUM(A1, C1, D1)"
+    assert [type(change) for change in changes] == [ChildDeletion]
+
+
+def test_nested_modification():
+    changes, result = apply("SUM(A1, MAX(B1, B2), C1)", "SUM(A1, MAX(B1, B3), C1)")
+    assert result == "SUM(A1, MAX(B1, B3), C1)"
+    assert [type(change) for change in changes] == [NodeModification]
+
+
+def test_moved_argument_is_deleted_and_added():
+    changes, result = apply("SUM(A1 * 2, B1, C1)", "SUM(B1, C1, A1 * 2)")
+    assert result == "SUM(B1, C1, A1 * 2)"
+    assert len(changes) == 2
+
+
+def test_new_root_falls_back_to_compare_asts():
+    original, modified = parse("SUM(A1)"), parse("SUM(A1) + 1")
+    assert [type(c) for c in tree_diff(original, modified)] == [
+        type(c) for c in compare_asts(original, modified)
+    ]
+
+
+@pytest.mark.parametrize(
+    "original,modified",
+    [
+        ("SUM(A1, B1)", "SUM(A1, B1)"),
+        ("SUM(A1, B1)", "MAX(A1, B1, C1)"),
+        ("A1 + B1", "A1 - B2"),
+        ("A1 + B1 * 2", "C1 + B1 * 3"),
+        ("A1 * 2 + B1", "B1 + A1 * 2"),
+        ("-SUM(A1, 2)", "-SUM(A1, 3, 4)"),
+        ("-SUM(A1, 2)", "-MAX(B1)"),
+        ("SUM(A1:A9, 2, IF(A1, 1, 2))", "SUM(A2:A9, IF(A1, 1, 3), 2)"),
+        ("SUM(1, 2, 3)", "SUM(3, 2, 1)"),
+    ],
+)
+def test_changes_turn_original_into_modified(original, modified):
+    assert apply(original, modified)[1] == modified
+
+
+def test_random_argument_edits_round_trip():
+    rng = random.Random(11)
+    pool = ["A1", "B2", "C3", "2", "A1 * 2", "MAX(A1, 2)", "SUM(B2, C3)"]
+    pool += ["INIT_VALUE", "TRUE", "FALSE"]
+    for _ in range(300):
+        args = [rng.choice(pool) for _ in range(rng.randint(1, 8))]
+        edited = list(args)
+        for _ in range(rng.randint(1, 4)):
+            action = rng.random()
+            if action < 0.3 and len(edited) > 1:
+                edited.pop(rng.randrange(len(edited)))
+            elif action < 0.6:
+                edited.insert(rng.randint(0, len(edited)), rng.choice(pool))
+            else:
+                edited[rng.randrange(len(edited))] = rng.choice(pool)
+        original = f"SUM({', '.join(args)})"
+        modified = f"SUM({', '.join(edited)})"
+        assert apply(original, modified)[1] == str(parse(modified))
+
+
+def test_concurrent_insert_and_modification_merge():
+    user1 = ASTManager(parse("SUM(A1, B1, C1)"), diff_engine=tree_diff)
+    user2 = user1.fork()
+    user1_changes = user1.get_changes_to("SUM(D1, A1, B1, C1)")
+    user2_changes = user2.get_changes_to("SUM(A1, B2, C1)")
+    user1.apply_changes(user1_changes, "user_1")
+    user2.apply_changes(user2_changes, "user_2")
+    user1.apply_changes(user1.merge_changes(user2_changes), "user_1")
+    user2.apply_changes(user2.merge_changes(user1_changes), "user_2")
+    assert str(user1) == str(user2) == "SUM(D1, A1, B2, C1)"
@@ -0,0 +1,111 @@
+from parser.nodes import Binary, Function
+from parser.parser import parse
+
+from crdt.ast_manager import ASTManager
+
+CELLS = [f"{col}{row}" for col in "ABCDE" for row in range(1, 6)]
+
+
+def nodes(ast):
+    result = []
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        if node is not None:
+            result.append(node)
+            stack.extend(node.children())
+    return result
+
+
+def replicas(formula, k=2, **options):
+    # A manager of formula and k - 1 forks of it, options go to ASTManager
+    first = ASTManager(parse(formula), **options)
+    return [first] + [first.fork() for _ in range(k - 1)]
+
+
+def edit(manager, formula, user_id="user"):
+    # Commits the changes to formula, returns the ops
+    return manager.commit(manager.get_changes_to(formula), user_id)
+
+
+def apply_edit(manager, formula, user_id="user"):
+    # Applies the changes to formula, without ops, and returns them
+    changes = manager.get_changes_to(formula)
+    manager.apply_changes(changes, user_id)
+    return changes
+
+
+def receive_all(managers):
+    # Every manager receives the ops of every other one, directly
+    for manager in managers:
+        for other in managers:
+            manager.receive(other.ops_since(manager.version_vector))
+
+
+def replaced(root, node, text):
+    # The formula of root with text in place of node. Ops that are on
+    # their way may leave a Binary without an operand or a Function
+    # without arguments, those read as 0.
+    if root is node:
+        return text
+    if root is None:
+        return "0"
+    if isinstance(root, Function) and not root.arguments:
+        return f"{root.func_name}(0)"
+    return "".join(
+        part if isinstance(part, str) else replaced(part, node, text)
+        for part in root._str_parts()
+    )
+
+
+def random_argument(rng, depth=0, binary=True):
+    # A random formula, which is no Binary unless binary is set: the
+    # parser would group a Binary in an operand of another one anew
+    roll = rng.random()
+    if roll < 0.5 or depth > 1:
+        return rng.choice(CELLS)
+    if roll < 0.6:
+        return str(rng.randint(1, 9))
+    if roll < 0.8 and binary:
+        first = random_argument(rng, depth + 1, binary=False)
+        second = random_argument(rng, depth + 1, binary=False)
+        return f"{first} {rng.choice('+-*/')} {second}"
+    first, second = random_argument(rng, depth + 1), random_argument(rng, depth + 1)
+    return f"{rng.choice(['MAX', 'MIN'])}({first}, {second})"
+
+
+def random_edit(rng, manager):
+    """
+    A formula one edit away from that of manager, whose root is a
+    Function and stays one. The edit is to any node: arguments of a
+    Function are added, deleted or replaced or the Function renamed, an
+    operand of a Binary is replaced or its operator swapped for one that
+    binds as tightly, and leaves are replaced.
+    """
+    node = rng.choice(nodes(manager.ast))
+    roll = rng.random()
+    if isinstance(node, Function):
+        args = [str(arg) for arg in node.arguments]
+        name = node.func_name
+        if roll < 0.35 or not args:
+            args.insert(rng.randrange(len(args) + 1), random_argument(rng))
+        elif roll < 0.6 and len(args) > 1:
+            del args[rng.randrange(len(args))]
+        elif roll < 0.9:
+            args[rng.randrange(len(args))] = random_argument(rng)
+        else:
+            name = rng.choice(["SUM", "MAX", "MIN"])
+        text = f"{name}({', '.join(args)})"
+    elif isinstance(node, Binary):
+        left, op, right = str(node.left), node.op, str(node.right)
+        if roll < 0.3:
+            op = {"+": "-", "-": "+", "*": "/", "/": "*"}.get(op, op)
+        elif roll < 0.65:
+            left = random_argument(rng, binary=False)
+        else:
+            right = random_argument(rng, binary=False)
+        text = f"{left} {op} {right}"
+    else:
+        under_binary = isinstance(node.parent, Binary)
+        text = random_argument(rng, binary=not under_binary)
+    return replaced(manager.ast, node, text)
@@ -1,9 +1,6 @@
-from copy import deepcopy
 from parser.parser import parse
 
-from ast_processing.apply_changes import apply_changes_to_ast
-from ast_processing.compare_asts import compare_asts
-from crdt.merge import merge_ast
+from crdt.ast_manager import ASTManager
 
 
 def process_and_merge_asts(
@@ -20,40 +17,43 @@ def process_and_merge_asts(
         debug_new_asts = True
         debug_merged_asts = True
 
-    # Parse ASTs
+    # Parse the original AST once, important for id_history
     original_ast = parse(original_ast_str)
-    user1_original_ast = deepcopy(original_ast)
-    user2_original_ast = deepcopy(original_ast)
 
-    user1_modified_ast = parse(user1_ast_str)
-    user2_modified_ast = parse(user2_ast_str)
+    # The second replica is forked from the first, both share the original
+    # nodes until they change them
+    user1_ast_manager = ASTManager(original_ast)
+    user2_ast_manager = user1_ast_manager.fork()
 
     # Compare ASTs
-    user1_changes = compare_asts(user1_original_ast, user1_modified_ast)
-    user2_changes = compare_asts(user2_original_ast, user2_modified_ast)
+    user1_changes = user1_ast_manager.get_changes_to(user1_ast_str)
+    user2_changes = user2_ast_manager.get_changes_to(user2_ast_str)
+
+    if debug_changes:
+        print("")
+        print("User 1 Changes:", user1_changes)
+        print("User 2 Changes:", user2_changes)
 
     # Proceed with the following steps once connection has been established ...
 
     # Apply changes
-    user1_new_ast, user1_new_nodes = apply_changes_to_ast(
-        user1_original_ast, user1_changes, user_id="user_1"
-    )
-    user2_new_ast, user2_new_nodes = apply_changes_to_ast(
-        user2_original_ast, user2_changes, user_id="user_2"
-    )
+    user1_ast_manager.apply_changes(user1_changes, user_id="user_1")
+    user2_ast_manager.apply_changes(user2_changes, user_id="user_2")
 
     if debug_new_asts:
         print("")
-        print("User 1 New AST:", user1_new_ast)
-        print("User 2 New AST:", user2_new_ast)
+        print("User 1 New AST:", user1_ast_manager)
+        print("User 2 New AST:", user2_ast_manager)
 
     # Merge changes
-    user1_merged_ast = merge_ast(user1_new_ast, user2_new_nodes)
-    user2_merged_ast = merge_ast(user2_new_ast, user1_new_nodes)
+    user1_merged_changes = user1_ast_manager.merge_changes(user2_changes)
+    user2_merged_changes = user2_ast_manager.merge_changes(user1_changes)
+    user1_ast_manager.apply_changes(user1_merged_changes, user_id="user_1")
+    user2_ast_manager.apply_changes(user2_merged_changes, user_id="user_2")
 
     if debug_merged_asts:
         print("")
-        print("User 1 Merged AST:", user1_merged_ast)
-        print("User 2 Merged AST:", user2_merged_ast)
+        print("User 1 Merged AST:", user1_ast_manager)
+        print("User 2 Merged AST:", user2_ast_manager)
 
-    return str(user1_merged_ast), str(user2_merged_ast)
+    return str(user1_ast_manager), str(user2_ast_manager)